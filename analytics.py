@@ -0,0 +1,334 @@
+# analytics.py
+#
+# Offline report over the event log (events.py), for tuning content:
+#
+#   questions  miss rate, time to answer, and how often each option is
+#              picked; a wrong option nobody picks isn't doing its job, and
+#              one picked more than the right answer may be unfair
+#   scenes     how often each scene is reached, which choices are taken,
+#              and how often players stop there without choosing, plus the
+#              funnel along the most taken path from the start scene
+#
+# Events are read --chunk rows at a time into numpy columns and folded into
+# fixed-size count arrays with bincount, so memory stays flat however long
+# the log is. Question and scene ids only mean something within one version
+# of questions.json / scenes.json, so only events on the current versions
+# are counted.
+#
+#   python analytics.py [--db EVENTS_DB | --csv events.csv] [--out report.json]
+#
+# On tens of millions of events, export the table once and read the CSV;
+# pandas' C parser is several times faster than fetching rows via sqlite3:
+#
+#   sqlite3 -header -csv "$EVENTS_DB" "SELECT * FROM events" > events.csv
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from content import _file_version
+from events import ADVENTURE_END, ADVENTURE_START, ANSWER, CHOICE, EVENTS_DB
+from question_bank import load_bank
+from scene_graph import compile_scenes
+
+QUESTIONS_PATH = os.getenv(
+    "QUESTIONS_PATH", os.path.join(os.path.dirname(__file__), "questions.json"))
+SCENES_PATH = os.getenv(
+    "SCENES_PATH", os.path.join(os.path.dirname(__file__), "scenes.json"))
+
+COLUMNS = ["kind", "version", "subject", "option", "value", "elapsed"]
+KINDS = (ANSWER, ADVENTURE_START, CHOICE, ADVENTURE_END)
+# time-to-answer buckets, upper edges in seconds; one more bucket for slower
+TIME_EDGES = np.array([1, 2, 3, 5, 8, 13, 20, 30, 45, 60, 90, 120, 180, 300])
+
+
+# ── READERS ──────────────────────────────────────────────────
+# each yields dict column → int64 array, one chunk at a time
+
+
+def _columns(frame: pd.DataFrame) -> dict:
+    # NULLs (e.g. no elapsed) come back as NaN; -1 never passes a range check
+    return {c: frame[c].fillna(-1).to_numpy(dtype=np.int64) for c in COLUMNS}
+
+
+def read_sqlite(path: str, chunk: int):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    kinds = ",".join(str(k) for k in KINDS)
+    last = 0
+    while True:
+        frame = pd.read_sql_query(
+            f"SELECT id, {', '.join(COLUMNS)} FROM events"
+            f" WHERE id > ? AND kind IN ({kinds}) ORDER BY id LIMIT ?",
+            conn, params=(last, chunk))
+        if frame.empty:
+            break
+        last = int(frame["id"].iloc[-1])
+        yield _columns(frame)
+    conn.close()
+
+
+def read_csv(path: str, chunk: int):
+    for frame in pd.read_csv(path, usecols=COLUMNS, chunksize=chunk, dtype="float64"):
+        yield _columns(frame)
+
+
+# ── QUESTIONS ────────────────────────────────────────────────
+
+
+class QuestionStats:
+    """Answer counts per question, option and time bucket for one bank version."""
+
+    def __init__(self, bank, version: int):
+        self.bank = bank
+        self.version = version
+        self.n = len(bank)
+        self.options = max(len(bank[i]["options"]) for i in range(self.n))
+        self.picks = np.zeros(self.n * self.options, dtype=np.int64)
+        self.missed = np.zeros(self.n, dtype=np.int64)
+        self.times = np.zeros(self.n * (len(TIME_EDGES) + 1), dtype=np.int64)
+
+    def add(self, cols: dict) -> int:
+        q, opt = cols["subject"], cols["option"]
+        keep = ((cols["kind"] == ANSWER) & (cols["version"] == self.version)
+                & (q >= 0) & (q < self.n) & (opt >= 0) & (opt < self.options))
+        q, opt, ok, elapsed = q[keep], opt[keep], cols["value"][keep], cols["elapsed"][keep]
+        self.picks += np.bincount(q * self.options + opt, minlength=self.picks.size)
+        self.missed += np.bincount(q, weights=ok == 0, minlength=self.n).astype(np.int64)
+        timed = elapsed >= 0
+        buckets = np.searchsorted(TIME_EDGES, elapsed[timed])
+        self.times += np.bincount(
+            q[timed] * (len(TIME_EDGES) + 1) + buckets, minlength=self.times.size)
+        return int(keep.sum())
+
+    def report(self, min_answers: int, easy: float, hard: float, weak: float) -> tuple:
+        picks = self.picks.reshape(self.n, self.options)
+        answered = picks.sum(axis=1)
+        miss_rate = np.divide(self.missed, answered, out=np.zeros(self.n), where=answered > 0)
+        times = self.times.reshape(self.n, -1)
+        p50, p90 = _percentile(times, 0.5), _percentile(times, 0.9)
+        total_times = times.sum(axis=0)
+
+        rows, flags = [], []
+        for i in range(self.n):
+            q = self.bank[i]
+            options = []
+            correct_picks = max((picks[i, j] for j, o in enumerate(q["options"]) if o["ok"]),
+                                default=0)
+            for j, o in enumerate(q["options"]):
+                share = picks[i, j] / answered[i] if answered[i] else 0.0
+                options.append({"id": o.get("id", j), "text": o["txt"], "ok": o["ok"],
+                                "picks": int(picks[i, j]), "share": round(share, 4)})
+                if answered[i] < min_answers or o["ok"]:
+                    continue
+                if share < weak:
+                    flags.append(_flag("weak_distractor", i, q["q"],
+                                       f"option {o.get('id', j)!r} picked {share:.1%} of the time"))
+                elif picks[i, j] > correct_picks:
+                    flags.append(_flag("misleading_distractor", i, q["q"],
+                                       f"option {o.get('id', j)!r} picked more than the answer"))
+            rows.append({
+                "q_idx": i, "question": q["q"], "answered": int(answered[i]),
+                "miss_rate": round(float(miss_rate[i]), 4),
+                "seconds_p50": p50[i], "seconds_p90": p90[i], "options": options,
+            })
+            if answered[i] >= min_answers:
+                if miss_rate[i] < easy:
+                    flags.append(_flag("too_easy", i, q["q"], f"missed {miss_rate[i]:.1%}"))
+                elif miss_rate[i] > hard:
+                    flags.append(_flag("too_hard", i, q["q"], f"missed {miss_rate[i]:.1%}"))
+        overall = {"answered": int(answered.sum()), "missed": int(self.missed.sum()),
+                   "seconds_p50": _percentile(total_times[None, :], 0.5)[0],
+                   "seconds_p90": _percentile(total_times[None, :], 0.9)[0],
+                   "seconds_histogram": dict(zip(_bucket_labels(), total_times.tolist()))}
+        return overall, rows, flags
+
+
+def _bucket_labels() -> list:
+    return [f"<={e}s" for e in TIME_EDGES] + [f">{TIME_EDGES[-1]}s"]
+
+
+def _percentile(hist: np.ndarray, q: float) -> list:
+    """Upper bucket edge holding the q-th answer, per row (None if no answers)."""
+    cum = hist.cumsum(axis=1)
+    total = cum[:, -1]
+    idx = (cum < np.maximum(total, 1)[:, None] * q).sum(axis=1)
+    labels = _bucket_labels()
+    return [labels[i] if t else None for i, t in zip(idx, total)]
+
+
+def _flag(kind: str, subject, name: str, detail: str) -> dict:
+    return {"flag": kind, "id": subject, "name": name[:80], "detail": detail}
+
+
+# ── SCENES ───────────────────────────────────────────────────
+
+
+class SceneStats:
+    """Arrivals, choices and endings per scene for one scene graph version."""
+
+    def __init__(self, graph, version: int):
+        self.graph = graph
+        self.version = version
+        self.n = len(graph)
+        self.choices = max((len(s.choices) for s in graph.scenes), default=0) or 1
+        self.routes = max((len(c.targets) for s in graph.scenes for c in s.choices), default=1)
+        # (scene, choice, route) → next scene id, -1 where there is no such route
+        self.next = np.full(self.n * self.choices * self.routes, -1, dtype=np.int64)
+        for s in graph.scenes:
+            for j, c in enumerate(s.choices):
+                for r, target in enumerate(c.targets):
+                    self.next[(s.id * self.choices + j) * self.routes + r] = target
+        self.starts = 0
+        self.arrivals = np.zeros(self.n, dtype=np.int64)
+        self.picks = np.zeros(self.next.size, dtype=np.int64)
+        self.endings = np.zeros(self.n, dtype=np.int64)
+        self.end_score = np.zeros(self.n, dtype=np.int64)
+
+    def add(self, cols: dict) -> int:
+        scene, kind = cols["subject"], cols["kind"]
+        mine = (cols["version"] == self.version) & (scene >= 0) & (scene < self.n)
+
+        start = mine & (kind == ADVENTURE_START)
+        self.starts += int(start.sum())
+        self.arrivals += np.bincount(scene[start], minlength=self.n)
+
+        # option is choice index + 256 × route (see events.py)
+        option = cols["option"]
+        picked, route = option & 0xFF, option >> 8
+        choice = (mine & (kind == CHOICE) & (option >= 0)
+                  & (picked < self.choices) & (route < self.routes))
+        slot = (scene[choice] * self.choices + picked[choice]) * self.routes + route[choice]
+        slot = slot[self.next[slot] >= 0]
+        self.picks += np.bincount(slot, minlength=self.picks.size)
+        self.arrivals += np.bincount(self.next[slot], minlength=self.n)
+
+        end = mine & (kind == ADVENTURE_END)
+        self.endings += np.bincount(scene[end], minlength=self.n)
+        self.end_score += np.bincount(
+            scene[end], weights=cols["value"][end], minlength=self.n).astype(np.int64)
+        return int(start.sum() + choice.sum() + end.sum())
+
+    def _choice_picks(self):
+        """Picks per (scene, choice), whichever route they took."""
+        return self.picks.reshape(self.n, self.choices, self.routes).sum(axis=2)
+
+    def report(self, min_visits: int, drop_off: float, ignored: float) -> tuple:
+        picks = self._choice_picks()
+        departures = picks.sum(axis=1)
+        rows, flags = [], []
+        for s in self.graph.scenes:
+            arrived = int(self.arrivals[s.id])
+            row = {"scene": s.name, "arrivals": arrived}
+            if s.is_ending:
+                ended = int(self.endings[s.id])
+                row.update(ending=True, endings=ended,
+                           mean_score=round(self.end_score[s.id] / ended, 2) if ended else None)
+            else:
+                stopped = max(arrived - int(departures[s.id]), 0)
+                rate = stopped / arrived if arrived else 0.0
+                row.update(stopped=stopped, drop_off=round(rate, 4), choices=[
+                    {"text": c.text, "next": " / ".join(self.graph[t].name for t in c.targets),
+                     "picks": int(picks[s.id, j])} for j, c in enumerate(s.choices)])
+                if arrived >= min_visits:
+                    if rate > drop_off:
+                        flags.append(_flag("high_drop_off", s.name, s.name,
+                                           f"{rate:.1%} of visits stop here"))
+                    for j, c in enumerate(s.choices):
+                        if c.requires is not None:
+                            continue  # only some players see it
+                        share = picks[s.id, j] / departures[s.id] if departures[s.id] else 0.0
+                        if share < ignored:
+                            flags.append(_flag("ignored_choice", s.name, s.name,
+                                               f"{c.text!r} taken {share:.1%} of the time"))
+            rows.append(row)
+        return {"starts": self.starts, "main_path": self.main_path()}, rows, flags
+
+    def main_path(self) -> list:
+        """The most taken choice (and route) from the start scene on, with how many got that far."""
+        path, scene, seen = [], self.graph.start, set()
+        picks = self.picks.reshape(self.n, self.choices * self.routes)
+        while scene not in seen:
+            seen.add(scene)
+            s = self.graph[scene]
+            path.append({"scene": s.name, "arrivals": int(self.arrivals[scene])})
+            if s.is_ending or not picks[scene].any():
+                break
+            scene = int(self.next[scene * self.choices * self.routes + picks[scene].argmax()])
+        reached = path[0]["arrivals"] or 1
+        for step in path:
+            step["of_start"] = round(step["arrivals"] / reached, 4)
+        return path
+
+
+# ── COMMAND ──────────────────────────────────────────────────
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CyberQuest content analytics")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--db", default=EVENTS_DB, help="events database (default EVENTS_DB)")
+    source.add_argument("--csv", help="CSV export of the events table")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--scenes", default=SCENES_PATH)
+    parser.add_argument("--chunk", type=int, default=1_000_000, help="rows per chunk")
+    parser.add_argument("--out", help="write the full report here as JSON")
+    parser.add_argument("--min-answers", type=int, default=30,
+                        help="answers (or scene visits) before anything is flagged")
+    parser.add_argument("--easy", type=float, default=0.05, help="flag miss rates below this")
+    parser.add_argument("--hard", type=float, default=0.6, help="flag miss rates above this")
+    parser.add_argument("--weak", type=float, default=0.02,
+                        help="flag wrong options picked less often than this")
+    parser.add_argument("--drop-off", type=float, default=0.3,
+                        help="flag scenes where more visits than this stop")
+    parser.add_argument("--ignored", type=float, default=0.05,
+                        help="flag choices taken less often than this")
+    args = parser.parse_args(argv)
+
+    questions = QuestionStats(load_bank(args.questions), _file_version(args.questions))
+    with open(args.scenes) as f:
+        scenes = SceneStats(compile_scenes(json.load(f)), _file_version(args.scenes))
+
+    started = time.perf_counter()
+    reader = read_csv(args.csv, args.chunk) if args.csv else read_sqlite(args.db, args.chunk)
+    counted = 0
+    for cols in reader:
+        counted += questions.add(cols) + scenes.add(cols)
+    elapsed = time.perf_counter() - started
+
+    quiz_overall, question_rows, question_flags = questions.report(
+        args.min_answers, args.easy, args.hard, args.weak)
+    adventure_overall, scene_rows, scene_flags = scenes.report(
+        args.min_answers, args.drop_off, args.ignored)
+    report = {
+        "generated": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "questions_version": f"{questions.version:08x}",
+        "scenes_version": f"{scenes.version:08x}",
+        "events_counted": counted,
+        "quiz": quiz_overall,
+        "adventure": adventure_overall,
+        "flags": question_flags + scene_flags,
+        "questions": question_rows,
+        "scenes": scene_rows,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"{counted:,} events on the current content in {elapsed:.2f} s")
+    print(f"quiz: {quiz_overall['answered']:,} answers, {quiz_overall['missed']:,} missed, "
+          f"time to answer p50 {quiz_overall['seconds_p50']} p90 {quiz_overall['seconds_p90']}")
+    print(f"adventure: {adventure_overall['starts']:,} starts; most taken path: "
+          + " → ".join(f"{s['scene']} ({s['of_start']:.0%})" for s in adventure_overall["main_path"]))
+    for flag in report["flags"]:
+        print(f"  {flag['flag']:<22} {flag['name']}: {flag['detail']}")
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
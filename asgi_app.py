@@ -0,0 +1,413 @@
+# asgi_app.py
+#
+# Asyncio entry point: the same game on Bolt's AsyncApp, served by any
+# ASGI server. slacky2.py (Flask + sync workers) is unchanged; pick one.
+#
+#   uvicorn asgi_app:api --host 0.0.0.0 --port 8080
+#
+# Listeners are coroutines around the shared game logic in cyberquestquiz.py
+# and cyberquestadv.py, so one process keeps thousands of interactions in
+# flight while replies wait on Slack. Every Slack call – Web API methods and
+# response_url replies – goes through one aiohttp session per process,
+# opened at ASGI lifespan startup.
+#
+# Needs aiohttp, and an ASGI server such as uvicorn.
+
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from urllib.parse import parse_qsl
+
+import aiohttp
+from slack_bolt.adapter.asgi.aiohttp import AsyncSlackRequestHandler
+from slack_bolt.adapter.asgi.http_request import AsgiHttpRequest
+from slack_bolt.async_app import AsyncApp
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+import cyberquestquiz as quiz
+from cyberquestadv import (
+    COMING_SOON, STALE_BUTTON, adventure_allowed, adventure_sessions, handle_adventure_choice,
+    handle_adventure_start,
+)
+import events
+from dedup import deliveries, skip_duplicates_async
+from outbound import (
+    OUTBOUND_BACKOFF, OUTBOUND_RETRIES, OUTBOUND_TIMEOUT, SLACK_API_URL, _api_error,
+    response_message,
+)
+from profile_cache import DEFAULT_NAME, DisplayNameCache, display_name
+from session_store import MemoryStore
+from tournament import NOT_IN_CHANNEL, TOURNAMENT_ROUNDS, Tournaments
+import metrics
+import prefork
+from profiler import profiler, trace_middleware_async
+from session_journal import journal
+
+# ── CONFIG ───────────────────────────────────────────────────
+SLACK_BOT_TOKEN = os.environ["SLACK_BOT_TOKEN"]
+SLACK_SIGNING_SECRET = os.environ["SLACK_SIGNING_SECRET"]
+# open connections to Slack per process; further calls wait for one
+ASYNC_HTTP_CONNECTIONS = int(os.getenv("ASYNC_HTTP_CONNECTIONS", 256))
+
+logger = logging.getLogger(__name__)
+
+
+# ── SHARED HTTP CLIENT ───────────────────────────────────────
+class SlackHTTP:
+    """The process's aiohttp session, used for every outbound Slack call."""
+
+    def __init__(self, client: AsyncWebClient, connections: int = ASYNC_HTTP_CONNECTIONS,
+                 retries: int = OUTBOUND_RETRIES, backoff: float = OUTBOUND_BACKOFF,
+                 timeout: float = OUTBOUND_TIMEOUT):
+        self.client = client
+        self.connections = connections
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = None
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    async def start(self) -> None:
+        """Open the session (at lifespan startup, or on first use without one)."""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.client.session = self.session
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+
+    async def post(self, url: str, payload: dict) -> None:
+        """POST JSON, retrying rate limits, 5xx and dropped connections."""
+        if self.session is None or self.session.closed:
+            await self.start()
+        started = time.monotonic()
+        self.in_flight += 1
+        try:
+            await self._send(url, payload)
+            ok = True
+        except Exception:
+            logger.exception("outbound POST to %s failed", url.split("/")[2])
+            ok = False
+        finally:
+            self.in_flight -= 1
+        elapsed = time.monotonic() - started
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+        self.latency_total += elapsed
+        self.latency_max = max(self.latency_max, elapsed)
+        if metrics.METRICS_ENABLED:
+            metrics.outbound_result(url, ok, elapsed)
+
+    async def _send(self, url: str, payload: dict) -> None:
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            try:
+                async with self.session.post(url, json=payload) as resp:
+                    data = await resp.read()
+                    if resp.status == 429 or resp.status >= 500:
+                        error = RuntimeError(f"HTTP {resp.status}")
+                    elif resp.status >= 400:
+                        raise RuntimeError(f"HTTP {resp.status}")
+                    else:
+                        # the Web API answers 200 with "ok": false
+                        api_error = _api_error(resp.headers.get("Content-Type"), data)
+                        if api_error is None:
+                            return
+                        if api_error != "ratelimited":
+                            raise RuntimeError(f"Slack API error: {api_error}")
+                        error = RuntimeError(api_error)
+                    retry_after = resp.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = float(retry_after)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            if attempt < self.retries:
+                self.retried += 1
+                await asyncio.sleep(delay)
+        raise RuntimeError(f"giving up after {self.retries + 1} attempts") from error
+
+    def stats(self) -> dict:
+        done = self.sent + self.failed
+        return {
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "latency_avg_ms": round(self.latency_total / done * 1000, 2) if done else 0.0,
+            "latency_max_ms": round(self.latency_max * 1000, 2),
+        }
+
+
+class SharedRespond:
+    """Drop-in for Bolt's async respond() that posts through SlackHTTP."""
+
+    def __init__(self, response_url: str, http: SlackHTTP):
+        self.response_url = response_url
+        self.http = http
+
+    async def __call__(self, text: str = "", **kwargs):
+        await self.http.post(self.response_url, response_message(text, **kwargs))
+
+
+# ── APP INIT ─────────────────────────────────────────────────
+app = AsyncApp(
+    # named, or Bolt inspects the caller's stack for one (~100 ms per import)
+    name="asgi_app",
+    signing_secret=SLACK_SIGNING_SECRET,
+    client=AsyncWebClient(token=SLACK_BOT_TOKEN, base_url=SLACK_API_URL),
+)
+http = SlackHTTP(app.client)
+
+if metrics.METRICS_ENABLED:
+    # first, so listener timings include the rest of the middleware
+    app.middleware(metrics.start_timer_async)
+    metrics.watch_stores([quiz.sessions, quiz.history, adventure_sessions])
+
+# repeated deliveries (Slack retries, double-clicks) stop here (see dedup.py)
+app.middleware(skip_duplicates_async)
+# while a trace is being recorded, interactions are appended to it
+app.middleware(trace_middleware_async)
+
+
+@app.middleware
+async def shared_responses(context, next):
+    # Bolt's own respond() opens a new HTTP session per reply
+    if context.response_url:
+        context["respond"] = SharedRespond(context.response_url, http)
+    await next()
+
+
+# memory-store sessions survive restarts with SESSION_JOURNAL_DIR set
+# (see session_journal.py); under gunicorn, in each worker (see prefork.py)
+if journal is not None:
+    prefork.per_worker(journal.start)
+
+# `kill -USR2 <pid>` turns the profiler on or off
+prefork.per_worker(profiler.install_signal)
+
+# the in-memory store answers in microseconds; SQLite and Redis block, so
+# their calls are moved off the event loop
+if all(isinstance(s, MemoryStore) for s in (quiz.sessions, adventure_sessions)):
+    async def run_game(fn, *args):
+        return fn(*args)
+else:
+    async def run_game(fn, *args):
+        return await asyncio.to_thread(fn, *args)
+
+# ── QUIZ ─────────────────────────────────────────────────────
+# game logic lives in cyberquestquiz.py; listeners only ack and respond
+
+
+@app.command("/cyberquest")
+@metrics.listener("start_quiz")
+async def start_quiz(ack, respond, command):
+    await ack()
+    words = command.get("text", "").lower().split()
+    # `/cyberquest stats`: your totals and the leaderboards (see events.py)
+    if words[:1] in (["stats"], ["leaderboard"]):
+        return await respond(**await asyncio.to_thread(
+            events.stats_message, command["user_id"], events.origin(command)))
+    # `/cyberquest tournament [rounds]`: the whole channel plays (see tournament.py)
+    if words[:1] == ["tournament"]:
+        return await start_tournament(command, respond, words[1:])
+    await respond(**quiz.start_menu())
+
+
+@app.action("start_game_click")
+@metrics.listener("handle_start_click")
+async def handle_start_click(ack, body, respond):
+    await ack()
+    await respond(**await run_game(quiz.start_game, body["user"]["id"], events.origin(body)))
+
+
+@app.action(re.compile(r"^answer_[A-D]$"))
+@metrics.listener("handle_answer")
+async def handle_answer(ack, body, respond):
+    await ack()
+    await respond(**await run_game(
+        quiz.answer, body["user"]["id"], body["actions"][0]["value"], events.origin(body)))
+
+
+@app.action("next_click")
+@metrics.listener("handle_next")
+async def handle_next(ack, body, respond):
+    await ack()
+    await respond(**await run_game(
+        quiz.next_question, body["user"]["id"], body["actions"][0]["value"]))
+
+
+# ── TOURNAMENT MODE ─────────────────────────────────────────
+_loop = None
+
+
+def _api_from_scheduler(method: str, **payload) -> None:
+    # the tournament scheduler runs on its own thread; the call runs on the loop
+    def log_failure(future):
+        if future.cancelled():
+            logger.warning("%s cancelled", method)
+        elif future.exception() is not None:
+            logger.warning("%s failed: %s", method, future.exception())
+
+    asyncio.run_coroutine_threadsafe(
+        app.client.api_call(method, json=payload), _loop).add_done_callback(log_failure)
+
+
+tournaments = Tournaments(_api_from_scheduler)
+
+
+async def start_tournament(command, respond, args):
+    global _loop
+    _loop = asyncio.get_running_loop()
+    rounds = int(args[0]) if args and args[0].isdigit() else TOURNAMENT_ROUNDS
+    t = tournaments.create(events.origin(command), command["user_id"], rounds)
+    try:
+        posted = await app.client.chat_postMessage(channel=t.channel, **tournaments.message(t))
+    except SlackApiError:
+        return await respond(text=NOT_IN_CHANNEL)
+    tournaments.posted(t, posted["ts"])
+
+
+@app.action(re.compile(r"^tourney_[A-D]$"))
+@metrics.listener("tournament_answer")
+async def handle_tournament_answer(ack, body, respond):
+    await ack()
+    await respond(**tournaments.answer(body["user"]["id"], body["actions"][0]["value"]))
+
+
+# ── ADVENTURE MODE ──────────────────────────────────────────
+async def _fetch_name(user_id: str) -> str:
+    resp = await app.client.users_info(user=user_id)
+    return display_name(resp["user"]["profile"])
+
+
+# display names, cached and refreshed off the request path (see profile_cache.py)
+PROFILES = DisplayNameCache(_fetch_name)
+
+
+@app.action("start_adventure_click")
+@metrics.listener("start_adventure_click")
+async def start_adventure_click(ack, body, respond):
+    await ack()
+    user_id = body["user"]["id"]
+    if not adventure_allowed(user_id):
+        return await respond(text=COMING_SOON, replace_original=False)
+    blocks = await run_game(
+        handle_adventure_start, user_id, await PROFILES.aget(user_id), events.origin(body))
+    await respond(replace_original=True, blocks=blocks)
+
+
+@app.action(re.compile(r"^adv_\d+$"))
+@metrics.listener("adventure_choice")
+async def handle_adventure_choice_action(ack, body, respond):
+    await ack()
+    user_id = body["user"]["id"]
+    # the name is only needed when this process has no session for the user
+    name = None
+    if await run_game(adventure_sessions.get, user_id) is None:
+        name = await PROFILES.aget(user_id)
+    blocks = await run_game(
+        handle_adventure_choice, user_id, body["actions"][0]["value"],
+        lambda _: name or DEFAULT_NAME, events.origin(body))
+    # a stale button gets a separate note, so the current scene stays
+    await respond(replace_original=blocks is not STALE_BUTTON, blocks=blocks)
+
+
+@app.event("user_change")
+async def refresh_profile(event):
+    user = event["user"]
+    PROFILES.put(user["id"], display_name(user.get("profile", {})))
+
+
+# ── ASGI ROUTES & HEALTH ─────────────────────────────────────
+class CyberQuestASGI(AsyncSlackRequestHandler):
+    """Bolt's ASGI handler with the same routes as the Flask app."""
+
+    SLACK_PATHS = {"/slack/commands", "/slack/interactive", "/slack/events"}
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            raise TypeError(f"Unsupported scope type: {scope['type']!r}")
+
+        method, path = scope["method"], scope["path"]
+        if method == "POST" and path in self.SLACK_PATHS:
+            with profiler.request():
+                resp = await self.dispatch(AsgiHttpRequest(scope, receive))
+            headers = {k: v[0] for k, v in resp.headers.items()}
+            status, body = resp.status, resp.body
+        elif method == "GET" and path == "/stats" and profiler.authorized(
+                dict(scope.get("headers") or []).get(b"authorization", b"").decode()):
+            # session counts, evictions and memory use per store, outbound calls;
+            # needs PROFILE_TOKEN like /debug/profile, else a 404 below
+            stats = {s.namespace: s.stats() for s in (quiz.sessions, quiz.history, adventure_sessions)}
+            stats["outbound"] = http.stats()
+            stats["dedup"] = deliveries.stats()
+            stats["events"] = events.log.stats()
+            stats["tournaments"] = tournaments.stats()
+            if journal is not None:
+                stats["journal"] = journal.stats()
+            stats["profiler"] = profiler.stats()
+            status, headers, body = 200, {"content-type": "application/json"}, json.dumps(stats)
+        elif path == "/debug/profile":
+            # on/off and folded stacks; needs PROFILE_TOKEN (see profiler.py)
+            status, content_type, body = await self._profile_control(scope, receive)
+            headers = {"content-type": content_type}
+        elif method == "GET" and path == "/metrics" and metrics.METRICS_ENABLED:
+            status, body = 200, metrics.registry.render()
+            headers = {"content-type": "text/plain; version=0.0.4"}
+        elif method == "GET" and path == "/":
+            status, headers, body = 200, {"content-type": "text/plain; charset=utf-8"}, "🟢 CyberQuest is alive"
+        else:
+            status, headers, body = 404, {"content-type": "text/plain; charset=utf-8"}, "Not Found"
+
+        raw = body.encode() if isinstance(body, str) else body
+        headers["content-length"] = str(len(raw))
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(k.encode(), v.encode()) for k, v in headers.items()]})
+        await send({"type": "http.response.body", "body": raw})
+
+    @staticmethod
+    async def _profile_control(scope, receive) -> tuple:
+        params = dict(parse_qsl(scope.get("query_string", b"").decode()))
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        params.update(parse_qsl(body.decode()))
+        headers = dict(scope.get("headers") or [])
+        return profiler.control(
+            scope["method"], params, headers.get(b"authorization", b"").decode())
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await http.start()
+                profiler.watch_loop(asyncio.get_running_loop())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await http.close()
+                await asyncio.to_thread(events.log.flush)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+api = CyberQuestASGI(app)
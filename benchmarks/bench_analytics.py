@@ -0,0 +1,123 @@
+# benchmarks/bench_analytics.py
+#
+# analytics.py on a synthetic event log: writes --events rows shaped like
+# the events table (for the current questions.json and scenes.json) to a
+# CSV, and optionally a SQLite copy of the first --db-events of them, then
+# times the report over each.
+#
+#   python benchmarks/bench_analytics.py [--events N] [--db-events N]
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import analytics  # noqa: E402
+import events  # noqa: E402
+from content import _file_version  # noqa: E402
+from question_bank import load_bank  # noqa: E402
+from scene_graph import compile_scenes  # noqa: E402
+
+
+def synthetic_events(n: int, rng) -> pd.DataFrame:
+    """n rows: mostly quiz answers, the rest adventure starts, choices and endings."""
+    bank = load_bank(analytics.QUESTIONS_PATH)
+    with open(analytics.SCENES_PATH) as f:
+        graph = compile_scenes(json.load(f))
+    quiz_v = _file_version(analytics.QUESTIONS_PATH)
+    scenes_v = _file_version(analytics.SCENES_PATH)
+
+    kind = rng.choice([events.ANSWER, events.ADVENTURE_START, events.CHOICE, events.ADVENTURE_END],
+                      size=n, p=[0.8, 0.03, 0.14, 0.03])
+    subject = np.zeros(n, dtype=np.int64)
+    option = np.zeros(n, dtype=np.int64)
+    value = np.zeros(n, dtype=np.int64)
+    version = np.where(kind == events.ANSWER, quiz_v, scenes_v)
+
+    answers = kind == events.ANSWER
+    q = rng.integers(0, len(bank), answers.sum())
+    # the same per-question difficulty in every chunk
+    difficulty = np.random.default_rng(1).random(len(bank)) * 0.6
+    n_opts = np.array([len(bank[i]["options"]) for i in range(len(bank))])
+    correct = np.array([next(j for j, o in enumerate(bank[i]["options"]) if o["ok"])
+                        for i in range(len(bank))])
+    missed = rng.random(q.size) < difficulty[q]
+    subject[answers] = q
+    option[answers] = np.where(missed, (correct[q] + rng.integers(1, n_opts[q])) % n_opts[q],
+                               correct[q])
+    value[answers] = ~missed
+
+    live = [s for s in graph.scenes if not s.is_ending]
+    ends = [s.id for s in graph.scenes if s.is_ending] or [0]
+    choices = kind == events.CHOICE
+    pick = rng.integers(0, len(live), choices.sum())
+    subject[choices] = np.array([s.id for s in live])[pick]
+    option[choices] = rng.integers(0, 1 << 30, choices.sum()) % np.array(
+        [len(s.choices) for s in live])[pick]
+    subject[kind == events.ADVENTURE_START] = graph.start
+    subject[kind == events.ADVENTURE_END] = rng.choice(ends, (kind == events.ADVENTURE_END).sum())
+
+    return pd.DataFrame({
+        "id": np.arange(1, n + 1), "ts": 1.7e9 + np.arange(n) * 0.01, "kind": kind,
+        "team": "T1", "channel": "C1", "user": "U1", "version": version,
+        "subject": subject, "option": option, "value": value,
+        "elapsed": np.where(answers | choices, rng.gamma(2.0, 6.0, n).astype(np.int64), -1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics report benchmark")
+    parser.add_argument("--events", type=int, default=10_000_000)
+    parser.add_argument("--db-events", type=int, default=2_000_000)
+    parser.add_argument("--chunk", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "events.csv")
+        t0 = time.perf_counter()
+        written = 0
+        while written < args.events:
+            n = min(args.chunk, args.events - written)
+            frame = synthetic_events(n, rng)
+            frame["id"] += written
+            frame.to_csv(csv_path, mode="a", header=not written, index=False)
+            written += n
+        print(f"generated {args.events:,} events in {time.perf_counter() - t0:.1f} s")
+
+        t0 = time.perf_counter()
+        analytics.main(["--csv", csv_path, "--chunk", str(args.chunk),
+                        "--out", os.path.join(tmp, "report.json")])
+        csv_s = time.perf_counter() - t0
+
+        db_s = None
+        if args.db_events:
+            db_path = os.path.join(tmp, "events.db")
+            conn = sqlite3.connect(db_path)
+            for statement in events.SCHEMA:
+                conn.execute(statement)
+            for frame in pd.read_csv(csv_path, chunksize=args.chunk, nrows=args.db_events):
+                frame.to_sql("events", conn, if_exists="append", index=False)
+            conn.commit()
+            conn.close()
+            t0 = time.perf_counter()
+            analytics.main(["--db", db_path, "--chunk", str(args.chunk)])
+            db_s = time.perf_counter() - t0
+
+    print(f"csv report:    {args.events:,} events in {csv_s:.2f} s "
+          f"({args.events / csv_s / 1e6:.1f} M events/s)")
+    if db_s:
+        print(f"sqlite report: {args.db_events:,} events in {db_s:.2f} s "
+              f"({args.db_events / db_s / 1e6:.1f} M events/s)")
+
+
+if __name__ == "__main__":
+    main()
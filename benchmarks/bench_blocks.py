@@ -0,0 +1,122 @@
+# benchmarks/bench_blocks.py
+#
+# Per-render cost of quiz question blocks: the original build_question_blocks
+# (rebuild + shuffle + json.dumps per button) against the precompiled
+# templates in quiz_blocks.py. Signing the button values (payloads.py) is
+# timed on its own: it is HMAC work the old unsigned values never did, and
+# it would otherwise hide what the templates save.
+#
+#   python benchmarks/bench_blocks.py [--renders N]
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from quiz_blocks import TemplateCache  # noqa: E402
+from payloads import QUIZ_ANSWER, Signer  # noqa: E402
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), "..", "questions.json")
+HEADER = "[███░░░░░░░]  ✅ 3/10  ❌ 1/5"
+
+
+def legacy_build_question_blocks(questions, q_idx, correct, wrong, step):
+    """build_question_blocks as it was before quiz_blocks.py."""
+    q = questions[q_idx]
+    opts = q["options"].copy()
+    random.shuffle(opts)
+    letters = ["A", "B", "C", "D"]
+
+    options_md = "\n".join(
+        f"*{letters[i]}* – {opt['txt']}" for i, opt in enumerate(opts))
+    buttons = []
+    for i, opt in enumerate(opts):
+        buttons.append({
+            "type": "button",
+            "text": {"type": "plain_text", "text": letters[i]},
+            "action_id": f"answer_{letters[i]}",
+            "value": json.dumps({
+                "q_idx":      q_idx,
+                "step":       step,
+                "c":          correct,
+                "w":          wrong,
+                "choice_idx": i,
+                "orig_id":    opt["id"]
+            })
+        })
+
+    return [
+        {
+            "type": "section",
+            "text": {"type": "mrkdwn", "text": f"{HEADER}\n*Q{step+1}:* {q['q']}"}
+        },
+        {"type": "section", "text": {"type": "mrkdwn", "text": options_md}},
+        {"type": "actions", "elements": buttons}
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quiz block render benchmark")
+    parser.add_argument("--renders", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with open(QUESTIONS_PATH) as f:
+        questions = json.load(f)
+    n = len(questions)
+
+    t0 = timeit.default_timer()
+    templates = TemplateCache(questions)
+    compile_s = timeit.default_timer() - t0
+
+    signer = Signer(b"bench")
+
+    def signed(q_idx, c, w, s):
+        return lambda option: signer.sign("U0123456789", QUIZ_ANSWER, (1, 2, s, c, w, q_idx, option))
+
+    # sanity check: same blocks apart from the button values
+    legacy = legacy_build_question_blocks(questions, 0, 3, 1, 4)
+    blocks = templates.render(0, HEADER, 4, signed(0, 3, 1, 4))
+    for b in legacy[2]["elements"] + blocks[2]["elements"]:
+        b["value"] = None
+    assert [b["text"] for b in legacy[:1]] == [b["text"] for b in blocks[:1]]
+    assert legacy[2] == blocks[2]
+    assert sorted(legacy[1]["text"]["text"].split("\n")[i][4:] for i in range(4)) == \
+        sorted(blocks[1]["text"]["text"].split("\n")[i][4:] for i in range(4))
+
+    def run(fn):
+        i = 0
+
+        def once():
+            nonlocal i
+            fn(i % n, 3, 1, i % 50)
+            i += 1
+        return min(timeit.repeat(once, number=args.renders, repeat=3)) / args.renders
+
+    def unsigned(option):
+        return "value"
+
+    def sign_all(q, c, w, s):
+        sign = signed(q, c, w, s)
+        for option in range(4):
+            sign(option)
+
+    before = run(lambda q, c, w, s: legacy_build_question_blocks(questions, q, c, w, s))
+    after = run(lambda q, c, w, s: templates.render(q, HEADER, s, unsigned))
+    signing = run(sign_all)
+    total = run(lambda q, c, w, s: templates.render(q, HEADER, s, signed(q, c, w, s)))
+
+    print(f"questions:          {n}")
+    print(f"compile (once):     {compile_s * 1e3:.2f} ms")
+    print(f"before per render:  {before * 1e6:.2f} µs")
+    print(f"after per render:   {after * 1e6:.2f} µs")
+    print(f"speedup:            {before / after:.1f}x")
+    print(f"signing 4 buttons:  {signing * 1e6:.2f} µs")
+    print(f"after, signed:      {total * 1e6:.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
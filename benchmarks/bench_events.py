@@ -0,0 +1,74 @@
+# benchmarks/bench_events.py
+#
+# Event log costs: what record() adds to a request, how fast the writer
+# thread gets batches into SQLite, and how long the leaderboard and
+# per-player reads take once the aggregates hold --players players.
+#
+#   python benchmarks/bench_events.py [--events N] [--players N]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import events  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event log benchmark")
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--players", type=int, default=50_000)
+    parser.add_argument("--reads", type=int, default=2_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    channels = [f"C{i}" for i in range(50)]
+    with tempfile.TemporaryDirectory() as tmp:
+        log = events.EventLog(path=os.path.join(tmp, "events.db"), max_queue=args.events)
+        calls = [(f"U{rng.randrange(args.players)}", ("T1", rng.choice(channels)),
+                  rng.randrange(1000), rng.randrange(4), int(rng.random() < 0.7))
+                 for _ in range(args.events)]
+
+        started = time.perf_counter()
+        timings = []
+        for user, where, q_idx, option, ok in calls:
+            t0 = time.perf_counter()
+            log.record(events.ANSWER, user, where, 1, q_idx, option, ok, 5)
+            timings.append(time.perf_counter() - t0)
+        queued = time.perf_counter() - started
+        timings.sort()
+        log.flush(timeout=600)
+        written = time.perf_counter() - started
+
+        users = [f"U{rng.randrange(args.players)}" for _ in range(args.reads)]
+        t0 = time.perf_counter()
+        for user in users:
+            log.player("T1", user)
+        player_s = (time.perf_counter() - t0) / args.reads
+        t0 = time.perf_counter()
+        for i in range(args.reads):
+            log.leaderboard(f"channel:{channels[i % len(channels)]}")
+        board_s = (time.perf_counter() - t0) / args.reads
+        t0 = time.perf_counter()
+        for _ in range(args.reads // 10):
+            log.leaderboard("team:T1")
+        team_s = (time.perf_counter() - t0) / (args.reads // 10)
+        stats = log.stats()
+
+    print(f"events:                 {args.events:,} from {args.players:,} players")
+    # the tail is the GIL handing over to the writer thread, not I/O
+    print(f"record() mean / p99:    {queued / args.events * 1e6:.2f} / "
+          f"{timings[int(len(timings) * 0.99)] * 1e6:.2f} µs")
+    print(f"written:                {stats['written']:,} in {stats['batches']} batches, "
+          f"{args.events / written:,.0f} events/s")
+    print(f"player stats read:      {player_s * 1e6:.1f} µs")
+    print(f"channel top 10:         {board_s * 1e6:.1f} µs")
+    print(f"workspace top 10:       {team_s * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
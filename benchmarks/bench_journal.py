@@ -0,0 +1,213 @@
+# benchmarks/bench_journal.py
+#
+# Session journal costs and a restart check (see session_journal.py):
+#
+#   write     update() on a memory store, with and without a journal
+#   snapshot  time and size for --sessions quiz and adventure sessions each
+#   restore   from the snapshot alone, and with --updates journaled after it
+#   restart   a worker holding sessions, and still taking writes, gets
+#             SIGTERM while its replacement is already up; the replacement
+#             must end up with every session
+#   workers   --workers processes journal at once, each to its own segment;
+#             a restore afterwards must have every worker's sessions, and
+#             the newest copy of one they all wrote
+#
+#   python benchmarks/bench_journal.py [--sessions 100000] [--updates 100000]
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from game_state import AdventureSession, QuizSession  # noqa: E402
+from session_journal import SessionJournal  # noqa: E402
+from session_store import MemoryStore  # noqa: E402
+
+failures = []
+
+
+def make_stores(directory: str, max_size: int = 1_000_000):
+    journal = SessionJournal(directory, flush_interval=0.05, snapshot_interval=1e9,
+                             snapshot_bytes=1 << 40)
+    quiz = MemoryStore("quiz", QuizSession, max_size=max_size)
+    adventure = MemoryStore("adventure", AdventureSession, max_size=max_size)
+    journal.attach(quiz)
+    journal.attach(adventure)
+    return journal, quiz, adventure
+
+
+def bump(current):
+    state = current or QuizSession(1, 2)
+    return QuizSession(state.version, state.seed, state.step + 1, state.correct + 1), None
+
+
+def time_writes(store, n: int) -> float:
+    keys = [f"U{i % 5000}" for i in range(n)]
+    started = time.perf_counter()
+    for key in keys:
+        store.update(key, bump)
+    return (time.perf_counter() - started) / n
+
+
+# ── restart and worker checks ──
+# a child process: journal some sessions and report, then, until SIGTERM,
+#   idle      report whenever it loads sessions from a worker that exited
+#   drip      keep writing a session every few milliseconds, like a worker
+#             that is still draining requests
+#   shared:N  write key "shared" N tenths of a second in, and report
+
+
+def child(directory: str, prefix: str, count: int, mode: str) -> None:
+    journal, quiz, _ = make_stores(directory)
+    journal.start()
+    for i in range(count):
+        quiz.set(f"{prefix}{i}", QuizSession(1, i, i % 7))
+    print(f"owned {len(quiz)} {journal.restore_seconds:.4f} {journal.segment}", flush=True)
+    if mode.startswith("shared:"):
+        n = int(mode.split(":")[1])
+        time.sleep(n / 10)
+        quiz.set("shared", QuizSession(1, n))
+        print("shared", flush=True)
+    adopted, late = 0, 0
+    while True:
+        if mode == "drip":
+            quiz.set(f"{prefix}late{late}", QuizSession(1, late))
+            late += 1
+        if journal.adopted != adopted:
+            adopted = journal.adopted
+            print(f"adopted {len(quiz)}", flush=True)
+        time.sleep(0.005)
+
+
+def spawn(directory: str, prefix: str, count: int, mode: str = "idle") -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, __file__, "--child", directory, prefix, str(count), mode],
+        stdout=subprocess.PIPE, text=True)
+
+
+def restore_all(directory: str) -> MemoryStore:
+    journal, quiz, _ = make_stores(directory)
+    journal.start()
+    journal.close()
+    return quiz
+
+
+def restart_check(count: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        old = spawn(tmp, "old", count, "drip")
+        print(f"  old worker:  {old.stdout.readline().strip()}")
+        new = spawn(tmp, "new", count)
+        reply = new.stdout.readline().split()
+        print(f"  new worker:  {' '.join(reply)}, serving straight away")
+        if not reply or reply[0] != "owned" or int(reply[1]) < 2 * count:
+            failures.append("new worker did not restore the old one's sessions")
+        time.sleep(0.5)  # the old worker drains, still writing
+        started = time.perf_counter()
+        old.terminate()
+        old.wait(timeout=30)
+        reply = new.stdout.readline().split()
+        handover = time.perf_counter() - started
+        print(f"  new worker:  {' '.join(reply)} ({handover * 1000:.0f} ms after SIGTERM)")
+        new.terminate()
+        new.wait(timeout=30)
+        quiz = restore_all(tmp)
+        late = sum(key.startswith("oldlate") for key in quiz._data)
+        print(f"  after both:  {len(quiz)} sessions restored, {late} written while draining")
+        if not reply or reply[0] != "adopted" or int(reply[1]) != len(quiz):
+            failures.append("handover")
+        if not late or len(quiz) != 2 * count + late:
+            failures.append("final restore")
+
+
+def workers_check(workers: int, count: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        procs = [spawn(tmp, f"w{i}-", count, f"shared:{i}") for i in range(workers)]
+        replies = [p.stdout.readline().split() for p in procs]
+        segments = {reply[3] for reply in replies if reply and reply[0] == "owned"}
+        for p in procs:
+            p.stdout.readline()  # "shared"
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=30)
+        quiz = restore_all(tmp)
+        shared = quiz.get("shared")
+        print(f"  {len(segments)} segments, {len(quiz)} sessions restored, "
+              f"\"shared\" last written by worker {shared.seed if shared else None}")
+        if len(segments) != workers:
+            failures.append("workers shared a segment")
+        if len(quiz) != workers * count + 1:
+            failures.append("workers' sessions missing")
+        if shared is None or shared.seed != workers - 1:
+            failures.append("not the newest copy")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session journal benchmark")
+    parser.add_argument("--sessions", type=int, default=100_000, help="per store")
+    parser.add_argument("--updates", type=int, default=100_000)
+    parser.add_argument("--restart-sessions", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child[0], args.child[1], int(args.child[2]), args.child[3])
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = MemoryStore("quiz", QuizSession)
+        journal, quiz, adventure = make_stores(tmp)
+        journal.start()
+        without = time_writes(plain, args.updates)
+        with_journal = time_writes(quiz, args.updates)
+        print(f"update():         {without * 1e6:.2f} µs plain, "
+              f"{with_journal * 1e6:.2f} µs journaled")
+
+        for i in range(args.sessions):
+            quiz.set(f"U{i}", QuizSession(1, rng.getrandbits(32), i % 9, i % 10, i % 5))
+            adventure.set(f"U{i}", AdventureSession(
+                1, i % 40, f"Player {i}", 1 << i % 7 | 1 << i % 11, i % 13))
+        journal.flush()
+        started = time.perf_counter()
+        journal.snapshot()
+        snapshot_s = time.perf_counter() - started
+        size = os.path.getsize(os.path.join(journal.segment, f"snapshot.{journal._gen}"))
+        total = 2 * args.sessions
+        print(f"snapshot:         {total:,} sessions in {snapshot_s:.3f} s, "
+              f"{size / 1e6:.1f} MB ({size / total:.0f} B each)")
+
+        def restore_time() -> float:
+            _, q, a = make_stores(tmp)
+            j = q.journal
+            started = time.perf_counter()
+            restored = j.restore()
+            elapsed = time.perf_counter() - started
+            if restored != total:
+                failures.append(f"restored {restored} of {total}")
+            return elapsed
+
+        print(f"restore:          {restore_time():.3f} s from the snapshot")
+        for i in range(args.updates):
+            quiz.update(f"U{rng.randrange(args.sessions)}", bump)
+        journal.flush()
+        journaled = os.path.getsize(os.path.join(journal.segment, f"journal.{journal._gen}"))
+        print(f"restore:          {restore_time():.3f} s with {args.updates:,} journaled "
+              f"updates ({journaled / 1e6:.1f} MB)")
+        journal.close()
+
+    print(f"restart: {args.restart_sessions:,} sessions per worker")
+    restart_check(args.restart_sessions)
+    print(f"workers: {args.workers} at once, {args.restart_sessions:,} sessions each")
+    workers_check(args.workers, args.restart_sessions)
+    if failures:
+        print(f"FAILED: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
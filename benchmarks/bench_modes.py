@@ -0,0 +1,101 @@
+# benchmarks/bench_modes.py
+#
+# The same load test (loadtest.py) against both entry points:
+#
+#   sync   gunicorn sync workers with threads serving slacky2:flask_app
+#   async  uvicorn serving asgi_app:api (Bolt AsyncApp)
+#
+# The stub Slack answers every call after --slack-delay ms, so the run
+# shows how each mode copes with slow Slack round trips at high concurrency.
+#
+#   python benchmarks/bench_modes.py --players 500 --slack-delay 200
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import loadtest  # noqa: E402
+
+ROOT = loadtest.ROOT
+SECRET = "bench-modes"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_command(mode: str, port: int, workers: int, threads: int) -> list:
+    if mode == "sync":
+        return [sys.executable, "-m", "gunicorn", "-b", f"127.0.0.1:{port}",
+                "-w", str(workers), "--threads", str(threads), "slacky2:flask_app"]
+    return [sys.executable, "-m", "uvicorn", "asgi_app:api", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning"]
+
+
+def wait_until_up(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url + "/", timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not come up")
+
+
+def run_mode(mode: str, args) -> dict:
+    # the server calls auth.test while booting, so the stub goes first
+    stub = loadtest.StubSlack(0, args.slack_delay / 1000).start()
+    port = free_port()
+    env = dict(os.environ, SLACK_API_URL=f"{stub.base}/api/",
+               SLACK_BOT_TOKEN="xoxb-bench", SLACK_SIGNING_SECRET=SECRET, ADVENTURE_USERS="*",
+               PROFILE_TOKEN="bench")
+    server = subprocess.Popen(server_command(mode, port, args.workers, args.threads),
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        url = f"http://127.0.0.1:{port}"
+        wait_until_up(url)
+        return loadtest.run(loadtest.parse_args([
+            "--url", url, "--secret", SECRET, "--stats-token", "bench",
+            "--players", str(args.players), "--games", str(args.games),
+            "--slack-delay", str(args.slack_delay)]), stub)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        stub.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flask/sync vs ASGI/async under the same load")
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--games", type=int, default=1)
+    parser.add_argument("--slack-delay", type=float, default=200.0,
+                        help="ms the stub Slack takes per call")
+    parser.add_argument("--workers", type=int, default=1, help="server processes per mode")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker")
+    args = parser.parse_args()
+
+    results = {mode: run_mode(mode, args) for mode in ("sync", "async")}
+    print(f"players={args.players} games={args.games} slack_delay={args.slack_delay} ms "
+          f"workers={args.workers} (sync: {args.threads} threads each)")
+    print(f"{'':<8}{'req/s':>9}{'ack p50':>10}{'ack p99':>10}{'reply p50':>11}"
+          f"{'reply p99':>11}{'>3s':>6}{'errors':>8}")
+    for mode, r in results.items():
+        print(f"{mode:<8}{r['throughput_rps']:>9}{r['ack']['p50_ms']:>10}{r['ack']['p99_ms']:>10}"
+              f"{r['response']['p50_ms']:>11}{r['response']['p99_ms']:>11}"
+              f"{r['ack_over_deadline']:>6}{sum(r['errors'].values()):>8}")
+    for mode, r in results.items():
+        if r["errors"]:
+            print(f"{mode} errors: {r['errors']}")
+
+
+if __name__ == "__main__":
+    main()
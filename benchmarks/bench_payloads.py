@@ -0,0 +1,62 @@
+# benchmarks/bench_payloads.py
+#
+# Size and encode/decode cost of button values: the original JSON blobs
+# against the signed binary payloads in payloads.py.
+#
+#   python benchmarks/bench_payloads.py [--iterations N]
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from payloads import ADVENTURE, QUIZ_ANSWER, QUIZ_NEXT, Signer, bits_to_tail  # noqa: E402
+
+USER = "U06N9F2BV4P"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Button payload benchmark")
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+    signer = Signer(b"bench secret")
+
+    cases = [
+        ("quiz answer",
+         lambda: json.dumps({"q_idx": 4812, "step": 17, "c": 7, "w": 3, "choice_idx": 2, "orig_id": "c"}),
+         json.loads,
+         lambda: signer.sign(USER, QUIZ_ANSWER, (0x9A3C11F0, 123456789, 17, 7, 3, 4812, 2)),
+         lambda v: signer.verify(USER, v, QUIZ_ANSWER)),
+        ("quiz next",
+         lambda: json.dumps({"step": 17}),
+         json.loads,
+         lambda: signer.sign(USER, QUIZ_NEXT, (0x9A3C11F0, 123456789, 17, 7, 3)),
+         lambda v: signer.verify(USER, v, QUIZ_NEXT)),
+        ("adventure choice",
+         lambda: f"{USER}:2",
+         lambda v: v.split(":"),
+         lambda: signer.sign(USER, ADVENTURE, (0x51AB02C4, 12, -3, 2),
+                             bits_to_tail(1 | 1 << 7 | 1 << 9)),
+         lambda v: signer.verify(USER, v, ADVENTURE)),
+    ]
+
+    n = args.iterations
+    print(f"{'payload':<18}{'old bytes':>10}{'new bytes':>10}{'old enc µs':>12}"
+          f"{'new enc µs':>12}{'old dec µs':>12}{'new dec µs':>12}")
+    for name, old_enc, old_dec, new_enc, new_dec in cases:
+        old_v, new_v = old_enc(), new_enc()
+        timings = [
+            min(timeit.repeat(fn, number=n, repeat=3)) / n * 1e6
+            for fn in (old_enc, new_enc, lambda: old_dec(old_v), lambda: new_dec(new_v))
+        ]
+        print(f"{name:<18}{len(old_v):>10}{len(new_v):>10}"
+              f"{timings[0]:>12.2f}{timings[1]:>12.2f}{timings[2]:>12.2f}{timings[3]:>12.2f}")
+    print("old values carry only part of the game state and the adventure one is unsigned;")
+    print("new values carry all of it, bound to the user with a truncated HMAC-SHA256.")
+
+
+if __name__ == "__main__":
+    main()
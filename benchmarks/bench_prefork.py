@@ -0,0 +1,236 @@
+# benchmarks/bench_prefork.py
+#
+# slacky2 under gunicorn (gunicorn.conf.py) with the app preloaded in the
+# master and imported by each worker, over a generated content pack of
+# --questions questions and --scenes scenes:
+#
+#   cold start   launch until every worker has logged that it is ready
+#   restart      a killed worker until its replacement is ready, and a
+#                worker sent SIGUSR2 (the profiler's toggle) stays up
+#   memory       RSS, USS (pages no other process shares) and PSS per
+#                worker after loadtest traffic over HTTP, and the PSS of the
+#                whole server, master included: what it really costs
+#   imports      pandas, numpy and the Google clients are for analytics.py
+#                and tooling only; a worker must not load them
+#
+#   python benchmarks/bench_prefork.py [--workers 4] [--questions 4000] [--scenes 2000]
+
+import argparse
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import loadtest  # noqa: E402
+from loadtest import ROOT, StubSlack  # noqa: E402
+
+READY = re.compile(r"worker (\d+) ready in (\d+) ms")
+HEAVY = ("pandas", "numpy", "googleapiclient", "google.auth", "openpyxl")
+
+
+def content_pack(directory: str, n_questions: int, n_scenes: int) -> dict:
+    """questions.json repeated with distinct text, and a story a dozen or so choices deep."""
+    rng = random.Random(0)
+    with open(os.path.join(ROOT, "questions.json")) as f:
+        base = json.load(f)
+    questions = []
+    for i in range(n_questions):
+        q = base[i % len(base)]
+        questions.append({**q, "q": f"{q['q']} (#{i})", "options": [
+            {**o, "txt": f"{o['txt']} ({i})", "why": f"{o['why']} ({i})"} for o in q["options"]]})
+
+    def name(i):
+        return "choose_role" if i == 0 else f"s{i}"
+    scenes = {}
+    for i in range(n_scenes):
+        # the next scene, so every scene is reachable, and three further on
+        ahead = range(i + 2, min(n_scenes, i + 2 + n_scenes // 5))
+        targets = [i + 1] * (i + 1 < n_scenes) + rng.sample(ahead, min(3, len(ahead)))
+        scenes[name(i)] = {
+            "description": f"*Scene {i}*\n\nHello {{player_name}}, something happens. " * 3,
+            "choices": [{"text": f"Option {k} for scene {i}", "next_scene": name(t),
+                         "tags_added": [f"t{t % 50}"], "score_change": rng.randint(-2, 2)}
+                        for k, t in enumerate(targets)]}
+    paths = {"QUESTIONS_PATH": os.path.join(directory, "questions.json"),
+             "SCENES_PATH": os.path.join(directory, "scenes.json")}
+    with open(paths["QUESTIONS_PATH"], "w") as f:
+        json.dump(questions, f)
+    with open(paths["SCENES_PATH"], "w") as f:
+        json.dump(scenes, f)
+    return paths
+
+
+def memory(pid: int) -> dict:
+    """RSS, USS and PSS of one process, in MiB."""
+    kb = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                kb[parts[0].rstrip(":")] = int(parts[1])
+    mib = lambda k: k / 1024  # noqa: E731
+    return {"rss": mib(kb["Rss"]), "pss": mib(kb["Pss"]),
+            "uss": mib(kb["Private_Clean"] + kb["Private_Dirty"])}
+
+
+def children(pid: int) -> list:
+    out = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        out.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    return out
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """gunicorn serving slacky2, with its "ready" log lines collected."""
+
+    def __init__(self, env: dict, workers: int):
+        self.port = free_port()
+        self.base = f"http://127.0.0.1:{self.port}"
+        self.ready: list = []  # (monotonic time, pid, ms from fork to ready)
+        self._changed = threading.Condition()
+        self.started = time.monotonic()
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+             "-w", str(workers), "-b", f"127.0.0.1:{self.port}", "slacky2:flask_app"],
+            cwd=ROOT, env=env, stderr=subprocess.PIPE, text=True)
+        threading.Thread(target=self._read_log, daemon=True).start()
+
+    def _read_log(self) -> None:
+        for line in self.proc.stderr:
+            m = READY.search(line)
+            if m:
+                with self._changed:
+                    self.ready.append((time.monotonic(), int(m[1]), int(m[2])))
+                    self._changed.notify_all()
+            elif "Traceback" in line or "Error" in line:
+                print("  gunicorn: " + line.rstrip())
+
+    def wait_ready(self, n: int, timeout: float = 120) -> float:
+        """Seconds from launch until n workers had been ready."""
+        with self._changed:
+            if not self._changed.wait_for(lambda: len(self.ready) >= n, timeout):
+                raise RuntimeError(f"only {len(self.ready)} of {n} workers became ready")
+            return self.ready[n - 1][0] - self.started
+
+    def stop(self) -> None:
+        self.proc.send_signal(signal.SIGTERM)
+        self.proc.wait(30)
+
+
+def measure(preload: bool, args, env: dict, stub: StubSlack) -> dict:
+    env = {**env, "GUNICORN_PRELOAD": "1" if preload else "0"}
+    server = Server(env, args.workers)
+    try:
+        cold = server.wait_ready(args.workers)
+        boot_ms = [ms for _, _, ms in server.ready]
+
+        victim = server.ready[0][1]
+        killed = time.monotonic()
+        os.kill(victim, signal.SIGKILL)
+        server.wait_ready(args.workers + 1)
+        restart = server.ready[-1][0] - killed
+
+        # gunicorn resets a worker's signals; the profiler's SIGUSR2 must be
+        # set again after the fork (see prefork.py), or the worker dies of it
+        pid = server.ready[-1][1]
+        for _ in range(2):
+            try:
+                os.kill(pid, signal.SIGUSR2)
+            except ProcessLookupError:
+                break
+            time.sleep(0.3)
+        usr2 = pid in children(server.proc.pid)
+
+        load = loadtest.run(loadtest.parse_args([
+            "--url", server.base, "--players", str(args.players), "--games", str(args.games),
+            "--seed", "2" if preload else "1", "--secret", env["SLACK_SIGNING_SECRET"]]), stub)
+        workers = [memory(pid) for pid in children(server.proc.pid)]
+        master = memory(server.proc.pid)
+    finally:
+        server.stop()
+    return {
+        "cold": cold, "boot_ms": boot_ms, "restart": restart, "usr2": usr2, "load": load,
+        "workers": workers, "master": master,
+        "total_pss": master["pss"] + sum(w["pss"] for w in workers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preloaded gunicorn workers: startup and memory")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--questions", type=int, default=4000)
+    parser.add_argument("--scenes", type=int, default=2000)
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--games", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    stub = StubSlack().start()
+    env = {
+        **os.environ, **content_pack(tmp, args.questions, args.scenes),
+        "SLACK_API_URL": f"{stub.base}/api/", "SLACK_BOT_TOKEN": "xoxb-load",
+        "SLACK_SIGNING_SECRET": "loadtest", "ADVENTURE_USERS": "*", "PROFILE_TOKEN": "loadtest",
+        "EVENTS_DB": os.path.join(tmp, "events.db"), "SESSION_BACKEND": "memory",
+        "PYTHONPATH": ROOT,
+    }
+    failures = []
+
+    imported = subprocess.run(
+        [sys.executable, "-c", "import sys, slacky2; print(' '.join(sys.modules))"],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=120).stdout.split()
+    heavy = sorted(m for m in imported if m.split(".")[0] in HEAVY or m.startswith(HEAVY))
+    print(f"imports: {len(imported)} modules in a worker"
+          f"{', heavy: ' + ', '.join(heavy) if heavy else ', none of ' + ', '.join(HEAVY)}")
+    if heavy:
+        failures.append("heavy imports")
+
+    print(f"{args.workers} workers, {args.questions} questions, {args.scenes} scenes, "
+          f"after {args.players} players x {args.games} games:")
+    results = {}
+    for preload in (False, True):
+        label = "preload" if preload else "import"
+        r = results[label] = measure(preload, args, env, stub)
+        ws = r["workers"]
+        errors = sum(r["load"]["errors"].values())
+        print(f"  {label:<8} cold start {r['cold'] * 1000:7.0f} ms   worker boot "
+              f"{max(r['boot_ms']):5} ms   restart {r['restart'] * 1000:6.0f} ms   "
+              f"{r['load']['throughput_rps']:6} req/s   errors {errors}")
+        print(f"  {'':<8} per worker RSS {max(w['rss'] for w in ws):6.1f} MiB   "
+              f"USS {max(w['uss'] for w in ws):6.1f} MiB   PSS {max(w['pss'] for w in ws):6.1f} MiB"
+              f"   server PSS {r['total_pss']:6.1f} MiB (master {r['master']['pss']:.1f})")
+        if errors:
+            failures.append(f"{label}: errors")
+        if not r["usr2"]:
+            failures.append(f"{label}: SIGUSR2 killed a worker")
+
+    if results["preload"]["total_pss"] >= results["import"]["total_pss"]:
+        failures.append("preloading saved no memory")
+    if failures:
+        print(f"FAILED: {', '.join(failures)}")
+        sys.exit(1)
+    print("prefork ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# benchmarks/bench_profiler.py
+#
+# The runtime profiler (profiler.py) against the in-process load test:
+#
+#   overhead   loadtest throughput and latency with the profiler off, then
+#              on for every request with a trace being recorded
+#   control    /debug/profile refuses requests without the token, serves
+#              folded stacks filed per listener, and SIGUSR2 toggles it
+#   bounds     distinct stacks stay within PROFILE_MAX_STACKS per listener
+#   trace      holds no Slack ids or response URLs, and replaying it twice
+#              (benchmarks/replay_trace.py) gives the same digest
+#
+#   python benchmarks/bench_profiler.py [--players 30] [--games 3]
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import loadtest  # noqa: E402
+
+TOKEN = "bench-profile"
+failures = []
+
+
+def check(label: str, ok: bool, detail) -> None:
+    print(f"  {'ok  ' if ok else 'FAIL'} {label}: {detail}")
+    if not ok:
+        failures.append(label)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runtime profiler check")
+    parser.add_argument("--players", type=int, default=30)
+    parser.add_argument("--games", type=int, default=3)
+    parser.add_argument("--max-stacks", type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update({
+        "PROFILE_TOKEN": TOKEN, "PROFILE_MAX_STACKS": str(args.max_stacks),
+        "PROFILE_OUTPUT": os.path.join(tmp, "profile.folded"),
+        "PROFILE_TRACE": os.path.join(tmp, "trace.jsonl"),
+        "EVENTS_DB": os.path.join(tmp, "events.db"),
+    })
+    def load(seed: int):
+        # a new seed per run, so dedup.py never takes a delivery for a repeat
+        return loadtest.parse_args(["--players", str(args.players), "--games", str(args.games),
+                                    "--seed", str(seed)])
+    stub = loadtest.StubSlack().start()
+
+    off = loadtest.run(load(1), stub)
+    import slacky2
+    from profiler import profiler
+    web = slacky2.flask_app.test_client()
+    auth = {"Authorization": f"Bearer {TOKEN}"}
+
+    print("control:")
+    denied = web.post("/debug/profile?action=start")
+    check("no token refused", denied.status_code == 404 and not profiler.enabled, denied.status_code)
+    wrong = web.post("/debug/profile?action=start", headers={"Authorization": "Bearer nope"})
+    check("wrong token refused", wrong.status_code == 404 and not profiler.enabled, wrong.status_code)
+    started = web.post("/debug/profile", data={"action": "start", "rate": "1", "trace": "1"},
+                       headers=auth)
+    check("started over HTTP", started.status_code == 200 and profiler.enabled,
+          started.get_json())
+
+    on = loadtest.run(load(2), stub)
+    stats = profiler.stats()
+    folded = web.get("/debug/profile", headers=auth).get_data(as_text=True)
+    labels = {line.split(";", 1)[0] for line in folded.splitlines()}
+    # quick listeners may fall between samples; any one filed under its name will do
+    listeners = sorted(labels - {"slack_commands", "slack_interactive", "[bolt]", "[other]"})
+    check("stacks per listener", "slack_interactive" in labels and listeners,
+          ", ".join(sorted(labels)))
+    per_label = {}
+    for line in folded.splitlines():
+        label = line.split(";", 1)[0]
+        per_label[label] = per_label.get(label, 0) + 1
+    check("stacks bounded", max(per_label.values()) <= args.max_stacks + 1,
+          f"at most {max(per_label.values())} per listener, {stats['dropped']} samples "
+          f"over the cap")
+    name = (listeners or ["slack_interactive"])[0]
+    only = web.get(f"/debug/profile?listener={name}", headers=auth).get_data(as_text=True)
+    check("filter by listener", only and all(l.startswith(name + ";") for l in only.splitlines()),
+          f"{len(only.splitlines())} stacks for {name}")
+    web.post("/debug/profile?action=stop", headers=auth)
+    check("stopped, stacks written", not profiler.enabled and os.path.exists(
+        os.environ["PROFILE_OUTPUT"]), os.environ["PROFILE_OUTPUT"])
+
+    os.kill(os.getpid(), signal.SIGUSR2)
+    time.sleep(0.2)
+    toggled_on = profiler.enabled
+    os.kill(os.getpid(), signal.SIGUSR2)
+    time.sleep(0.2)
+    check("SIGUSR2 toggles", toggled_on and not profiler.enabled, "on, then off")
+
+    print("overhead (every request sampled, trace on):")
+    for label, r in (("off", off), ("on", on)):
+        print(f"  {label:<4} {r['throughput_rps']:>7} req/s   ack p99 {r['ack']['p99_ms']:>7} ms"
+              f"   reply p99 {r['response']['p99_ms']:>7} ms   errors {sum(r['errors'].values())}")
+    print(f"  {stats['sampled']} requests sampled, {stats['samples']} samples, "
+          f"sampler thread {stats['sampler_ms']} ms over {on['elapsed_s']} s")
+
+    print("trace:")
+    with open(os.environ["PROFILE_TRACE"]) as f:
+        trace = f.read()
+    records = trace.count("\n") - 1
+    check("records", records == on["requests"], f"{records} for {on['requests']} requests")
+    check("sanitized", "ULOAD" not in trace and "respond/" not in trace and "TLOAD" not in trace,
+          "no user/team ids or response URLs")
+    digests = []
+    for _ in range(2):
+        out = subprocess.run(
+            [sys.executable, os.path.join(os.path.dirname(__file__), "replay_trace.py"),
+             os.environ["PROFILE_TRACE"], "--timeout", "0.5"],
+            capture_output=True, text=True, timeout=600).stdout
+        digests.append(out.strip().splitlines()[-1])
+    print("  " + "\n  ".join(out.strip().splitlines()))
+    check("replay is deterministic", digests[0] == digests[1], " vs ".join(digests))
+
+    if failures:
+        print(f"FAILED: {', '.join(failures)}")
+        sys.exit(1)
+    print("profiler ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# benchmarks/bench_routing.py
+#
+# Adventure state as it grows: tags kept as a list of tag ids (duplicates
+# and all) against the bitset in game_state.py, over a --depth choice
+# playthrough of a story with --tags distinct tags. Then the per-click cost
+# of conditional choices and routes (see scene_graph.py): compiled
+# predicates against reading the condition dicts on every click.
+#
+#   python benchmarks/bench_routing.py [--depth 200] [--tags 64]
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from game_state import AdventureSession  # noqa: E402
+from payloads import ADVENTURE, Signer, bits_to_tail  # noqa: E402
+from scene_graph import compile_scenes  # noqa: E402
+
+USER = "U06N9F2BV4P"
+
+
+def conditional_scenes(n: int, n_tags: int, branching: int = 4) -> dict:
+    """A layered story where half the choices are conditional and half route."""
+    rng = random.Random(0)
+    tags = [f"t{i}" for i in range(n_tags)]
+    scenes = {}
+    for i in range(n):
+        ahead = [f"s{j}" for j in range(i + 1, min(n, i + 1 + branching * 3))]
+        choices = []
+        for k, target in enumerate(rng.sample(ahead, min(branching, len(ahead)))):
+            choice = {"text": f"Option {k}", "next_scene": target,
+                      "tags_added": [rng.choice(tags)], "score_change": rng.randint(-2, 2)}
+            if k % 2:
+                choice["if"] = {"has_tags": rng.sample(tags, 2), "no_tags": [rng.choice(tags)]}
+            else:
+                choice["next_scene"] = [
+                    {"if": {"any_tags": rng.sample(tags, 3), "min_score": 2}, "scene": rng.choice(ahead)},
+                    {"if": {"max_score": -3}, "scene": rng.choice(ahead)},
+                    {"scene": target}]
+            choices.append(choice)
+        scenes[f"s{i}"] = {"description": f"Scene {i}, {{player_name}}.", "choices": choices}
+    return scenes
+
+
+def interpret(spec: dict, names: set, score: int) -> bool:
+    """A condition checked straight from its JSON, with tags as a set of names."""
+    return (all(t in names for t in spec.get("has_tags", ()))
+            and (not spec.get("any_tags") or any(t in names for t in spec["any_tags"]))
+            and not any(t in names for t in spec.get("no_tags", ()))
+            and spec.get("min_score", -32768) <= score <= spec.get("max_score", 32767))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adventure tag state and routing benchmark")
+    parser.add_argument("--depth", type=int, default=200, help="choices in one playthrough")
+    parser.add_argument("--tags", type=int, default=64)
+    parser.add_argument("--scenes", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+    rng = random.Random(1)
+    signer = Signer(b"bench secret")
+    n = args.iterations
+
+    # ── state size after a long playthrough ──
+    tag_ids, bits = [], 0
+    for _ in range(args.depth):
+        t = rng.randrange(args.tags)
+        tag_ids.append(t)
+        bits |= 1 << t
+    old_payload = signer.sign(USER, ADVENTURE, (1, 2, 3, 0), tuple(tag_ids))
+    new_payload = signer.sign(USER, ADVENTURE, (1, 2, 3, 0), bits_to_tail(bits))
+    old_session = AdventureSession(1, 2, "Ada Lovelace", 0, 3)
+    old_session.tags = tag_ids
+    new_session = AdventureSession(1, 2, "Ada Lovelace", bits, 3)
+    old_mem = sys.getsizeof(tag_ids) + sum(sys.getsizeof(t) for t in set(tag_ids))
+    print(f"after {args.depth} choices, {len(set(tag_ids))} distinct of {args.tags} tags:")
+    print(f"  tags in memory    {old_mem:>6} B list   {sys.getsizeof(bits):>6} B int")
+    print(f"  button value      {len(old_payload):>6} ch      {len(new_payload):>6} ch")
+    old_packed = json.dumps([1, 2, "Ada Lovelace", tag_ids, 3], separators=(",", ":"))
+    print(f"  packed session    {len(old_packed):>6} B json   {len(new_session.pack()):>6} B")
+
+    def old_click():
+        tags = list(tag_ids) + [5]
+        return tuple(old_session.tags) == tuple(tag_ids), tags
+
+    def new_click():
+        return new_session.same_turn(1, 2, 3, bits), bits | 1 << 5
+
+    old_s = min(timeit.repeat(old_click, number=n, repeat=3)) / n
+    new_s = min(timeit.repeat(new_click, number=n, repeat=3)) / n
+    print(f"  same_turn + add   {old_s * 1e6:>6.2f} µs     {new_s * 1e6:>6.2f} µs")
+
+    # ── conditions per click ──
+    scenes = conditional_scenes(args.scenes, args.tags)
+    graph = compile_scenes(scenes, start="s0")
+    names = list(scenes)
+    bit = {name: i for i, name in enumerate(graph.tags)}
+    players = []
+    for _ in range(1000):
+        held = set(rng.sample(graph.tags, rng.randrange(len(graph.tags) // 2)))
+        players.append((sum(1 << bit[t] for t in held), held, rng.randint(-5, 5)))
+
+    def compiled(i):
+        tags, _, score = players[i % len(players)]
+        scene = graph[i % len(graph)]
+        blocks = scene.render("Ada", str, tags, score)
+        return [c.targets[c.route(tags, score)] for c in scene.choices], blocks
+
+    def interpreted(i):
+        _, held, score = players[i % len(players)]
+        scene = scenes[names[i % len(names)]]
+        shown = [c for c in scene["choices"] if "if" not in c or interpret(c["if"], held, score)]
+        routes = [c["next_scene"] if isinstance(c["next_scene"], str) else next(
+            r["scene"] for r in c["next_scene"] if "if" not in r or interpret(r["if"], held, score))
+            for c in scene["choices"]]
+        return shown, routes
+
+    for i in range(len(names)):
+        _, held, score = players[i % len(players)]
+        kept = {e["value"] for b in compiled(i)[1][1:] for e in b["elements"]}
+        assert kept == {str(j) for j, c in enumerate(scenes[names[i]]["choices"])
+                        if "if" not in c or interpret(c["if"], held, score)}
+        assert [graph[t].name for t in compiled(i)[0]] == interpreted(i)[1]
+
+    def run(fn):
+        i = 0
+
+        def once():
+            nonlocal i
+            fn(i)
+            i += 1
+        return min(timeit.repeat(once, number=n, repeat=3)) / n
+
+    # the same story with every choice a plain next_scene
+    plain = compile_scenes({
+        name: {**scene, "choices": [{"text": c["text"], "next_scene": f"s{i + 1}"}
+                                    for c in scene["choices"]]}
+        for i, (name, scene) in enumerate(scenes.items())}, start="s0")
+    print(f"{len(graph)} scenes, half the choices conditional and half routed:")
+    print(f"  render, no conditions    {run(lambda i: plain[i % len(plain)].render('Ada', str)) * 1e6:6.2f} µs")
+    print(f"  render + route, compiled {run(compiled) * 1e6:6.2f} µs")
+    print(f"  interpreted conditions   {run(interpreted) * 1e6:6.2f} µs (no render)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# benchmarks/bench_scenes.py
+#
+# Adventure scene rendering: str.format + rebuilding buttons on every click
+# (the original build_scene_blocks) against the compiled scene graph in
+# scene_graph.py, on a synthetic story with --scenes branching scenes.
+#
+#   python benchmarks/bench_scenes.py [--scenes N] [--renders N]
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from scene_graph import compile_scenes  # noqa: E402
+
+
+def synthetic_scenes(n: int, branching: int = 4) -> dict:
+    """A layered story: every scene branches forward, the last layer ends."""
+    rng = random.Random(0)
+    scenes = {}
+    for i in range(n):
+        targets = [j for j in range(i + 1, min(n, i + 1 + branching * 3))]
+        choices = [
+            {"text": f"Option {k} for scene {i}", "next_scene": f"s{t}",
+             "tags_added": [f"t{t % 50}"], "score_change": rng.randint(-2, 2)}
+            for k, t in enumerate(rng.sample(targets, min(branching, len(targets))))
+        ]
+        scenes[f"s{i}"] = {
+            "description": f"*Scene {i}*\n\nHello {{player_name}}, something happens. " * 3,
+            "choices": choices,
+        }
+    return scenes
+
+
+def legacy_build_scene_blocks(scenes, scene_name, user_id, player_name):
+    """build_scene_blocks as it was before scene_graph.py."""
+    scene = scenes[scene_name]
+    desc = scene["description"].format(player_name=player_name)
+    blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": desc}}]
+    if scene["choices"]:
+        buttons = []
+        for idx, choice in enumerate(scene["choices"]):
+            buttons.append({
+                "type": "button",
+                "text": {"type": "plain_text", "text": choice["text"]},
+                "action_id": f"adv_{idx}",
+                "value": f"{user_id}:{idx}"
+            })
+        blocks.append({"type": "actions", "elements": buttons})
+    return blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adventure scene render benchmark")
+    parser.add_argument("--scenes", type=int, default=500)
+    parser.add_argument("--renders", type=int, default=100_000)
+    args = parser.parse_args()
+
+    scenes = synthetic_scenes(args.scenes)
+    t0 = timeit.default_timer()
+    graph = compile_scenes(scenes, start="s0")
+    compile_s = timeit.default_timer() - t0
+
+    names = list(scenes)
+    for name in names:
+        assert graph[graph.ids[name]].render("Ada", lambda i: f"U1:{i}") == \
+            legacy_build_scene_blocks(scenes, name, "U1", "Ada")
+
+    def run(fn):
+        i = 0
+
+        def once():
+            nonlocal i
+            fn(i % len(names))
+            i += 1
+        return min(timeit.repeat(once, number=args.renders, repeat=3)) / args.renders
+
+    before = run(lambda i: legacy_build_scene_blocks(scenes, names[i], "U1", "Ada"))
+    after = run(lambda i: graph[i].render("Ada", lambda c: f"U1:{c}"))
+
+    print(f"scenes:            {len(graph)}")
+    print(f"compile (once):    {compile_s * 1e3:.2f} ms")
+    print(f"before per render: {before * 1e6:.2f} µs")
+    print(f"after per render:  {after * 1e6:.2f} µs")
+    print(f"speedup:           {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
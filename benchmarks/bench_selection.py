@@ -0,0 +1,87 @@
+# benchmarks/bench_selection.py
+#
+# Adaptive question selection on a large synthetic bank: selection.py
+# (Fenwick trees over the history + rejection sampling) against the naive
+# approach of recomputing every question's weight and calling
+# random.choices on each turn. Players miss each question with a fixed
+# per-question probability, so the weights actually move.
+#
+#   python benchmarks/bench_selection.py [--questions N] [--players N] [--turns N]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from game_state import QuestionHistory  # noqa: E402
+from selection import Selector  # noqa: E402
+
+
+def naive_pick(selector: Selector, h: QuestionHistory, bank_size: int, rng) -> int:
+    """Every question's weight, every turn: O(bank size)."""
+    weights = [1.0] * bank_size
+    if h is not None:
+        cooldown = selector._cooldown(bank_size)
+        for slot, q_idx in enumerate(h.questions):
+            weights[q_idx] = selector._weight(h, slot, cooldown)
+    return rng.choices(range(bank_size), weights)[0]
+
+
+def play(selector, pick, players, turns, bank_size, difficulty, rng):
+    """Returns (seconds spent picking, seconds spent recording, histories)."""
+    histories = [None] * players
+    pick_s = record_s = 0.0
+    for _ in range(turns):
+        for p in range(players):
+            h = histories[p]
+            t0 = time.perf_counter()
+            q_idx = pick(selector, h, bank_size, rng)
+            t1 = time.perf_counter()
+            histories[p] = selector.record(h, 1, q_idx, rng.random() < difficulty[q_idx], bank_size)
+            pick_s += t1 - t0
+            record_s += time.perf_counter() - t1
+    return pick_s, record_s, histories
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adaptive question selection benchmark")
+    parser.add_argument("--questions", type=int, default=50_000)
+    parser.add_argument("--players", type=int, default=10_000)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--naive-players", type=int, default=100,
+                        help="players for the O(bank) baseline, which is slow")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    difficulty = [rng.random() * 0.6 for _ in range(args.questions)]
+    selector = Selector()
+
+    def fast(selector, h, n, rng):
+        return selector.pick(h, n, rng)
+
+    pick_s, record_s, histories = play(
+        selector, fast, args.players, args.turns, args.questions, difficulty, rng)
+    turns = args.players * args.turns
+    naive_s, _, _ = play(
+        selector, naive_pick, args.naive_players, args.turns, args.questions, difficulty, rng)
+    naive_turns = args.naive_players * args.turns
+
+    # how the weights shape what gets asked again: repeats should favour misses
+    repeats = [h.misses[s] for h in histories for s in range(len(h)) if h.misses[s]]
+    packed = [len(h.pack()) for h in histories]
+
+    print(f"bank:              {args.questions:,} questions")
+    print(f"players × turns:   {args.players:,} × {args.turns}")
+    print(f"pick:              {pick_s / turns * 1e6:.2f} µs")
+    print(f"record:            {record_s / turns * 1e6:.2f} µs")
+    print(f"naive pick:        {naive_s / naive_turns * 1e6:.2f} µs")
+    print(f"speedup:           {naive_s / naive_turns / (pick_s / turns):.0f}x")
+    print(f"history (packed):  {sum(packed) / len(packed):.0f} B mean, {max(packed)} B max")
+    print(f"slots with misses: {len(repeats):,}")
+
+
+if __name__ == "__main__":
+    main()
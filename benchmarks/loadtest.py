@@ -0,0 +1,422 @@
+# benchmarks/loadtest.py
+#
+# Load test for the Slack endpoints. Simulates --players concurrent users,
+# each playing --games full quiz or adventure games, with correctly signed
+# slash-command and block_actions requests. Outbound Slack traffic (the
+# response_url replies and Web API calls) goes to a stub server started by
+# this script, which is also how a player "sees" the message it has to
+# click next.
+#
+# In-process (drives slacky2.flask_app through Flask's test client):
+#
+#   python benchmarks/loadtest.py --players 50 --games 4
+#
+# Over HTTP against a running server. Start the server with the stub as
+# its Slack API and the same signing secret, e.g.
+#
+#   SLACK_API_URL=http://127.0.0.1:8799/api/ SLACK_BOT_TOKEN=xoxb-load \
+#   SLACK_SIGNING_SECRET=loadtest ADVENTURE_USERS='*' \
+#   gunicorn -b 127.0.0.1:8080 slacky2:flask_app
+#
+#   python benchmarks/loadtest.py --url http://127.0.0.1:8080 --stub-port 8799
+#
+# Results are printed and, with --out, written as JSON; --compare prints the
+# change against an earlier JSON result.
+
+import argparse
+import hashlib
+import hmac
+import http.client
+import json
+import os
+import platform
+import queue
+import random
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+ACK_DEADLINE_MS = 3000
+
+
+# ── STUB SLACK ───────────────────────────────────────────────
+class StubSlack(ThreadingHTTPServer):
+    """Accepts response_url posts and answers the Web API methods we use."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port: int = 0, delay: float = 0.0):
+        super().__init__(("127.0.0.1", port), _StubHandler)
+        # seconds before each reply, to stand in for Slack's round trip
+        self.delay = delay
+        self.inboxes: dict = {}
+        self.api_calls = 0
+        # Web API method → [JSON bodies], for checks that look at what was sent
+        self.methods: dict = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def inbox(self, player: str) -> queue.Queue:
+        with self._lock:
+            return self.inboxes.setdefault(player, queue.Queue())
+
+    def handle_error(self, request, client_address):
+        # servers under test drop kept-alive connections when they stop
+        pass
+
+    def start(self) -> "StubSlack":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        # users.info from the async Web API client
+        self.do_POST()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.split("?")[0]
+        if path.startswith("/respond/"):
+            self.server.inbox(path.rsplit("/", 1)[1]).put((time.perf_counter(), json.loads(body)))
+            reply = b"ok"
+        else:
+            self.server.api_calls += 1
+            if body and self.headers.get("Content-Type", "").startswith("application/json"):
+                with self.server._lock:
+                    self.server.methods.setdefault(path.rsplit("/", 1)[1], []).append(
+                        json.loads(body))
+            user = {"id": "U0", "profile": {"display_name": "Load Tester"}}
+            reply = json.dumps({"ok": True, "user_id": "UBOT", "bot_id": "BBOT",
+                                "team_id": "TLOAD", "user": user, "ts": "1.0"}).encode()
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.wfile.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            + f"Content-Length: {len(reply)}\r\n\r\n".encode() + reply)
+
+    def log_message(self, *args):
+        pass
+
+
+# ── CLIENTS ──────────────────────────────────────────────────
+class SignedClient:
+    """Posts Slack-signed form bodies, in-process or over HTTP."""
+
+    def __init__(self, secret: str, url: str = None, flask_app=None, stats_token: str = ""):
+        self.secret = secret.encode()
+        # PROFILE_TOKEN, which /stats needs
+        self.stats_headers = {"Authorization": f"Bearer {stats_token}"}
+        self.url = url
+        self.flask_app = flask_app
+        self._local = threading.local()
+
+    def _headers(self, body: str) -> dict:
+        ts = str(int(time.time()))
+        sig = hmac.new(self.secret, f"v0:{ts}:{body}".encode(), hashlib.sha256).hexdigest()
+        return {"X-Slack-Request-Timestamp": ts, "X-Slack-Signature": f"v0={sig}",
+                "Content-Type": "application/x-www-form-urlencoded"}
+
+    def post(self, path: str, form: dict) -> int:
+        body = urlencode(form)
+        headers = self._headers(body)
+        if self.flask_app is not None:
+            client = getattr(self._local, "client", None)
+            if client is None:
+                client = self._local.client = self.flask_app.test_client()
+            return client.post(path, data=body, headers=headers).status_code
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            reused = conn is not None
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(
+                    urlsplit(self.url).netloc, timeout=30)
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                return resp.status
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._local.conn = None
+                # the server may have closed an idle keep-alive connection
+                if not reused or attempt:
+                    raise
+
+    def get_json(self, path: str) -> dict:
+        if self.flask_app is not None:
+            return self.flask_app.test_client().get(path, headers=self.stats_headers).get_json()
+        conn = http.client.HTTPConnection(urlsplit(self.url).netloc, timeout=30)
+        conn.request("GET", path, headers=self.stats_headers)
+        return json.loads(conn.getresponse().read())
+
+
+# ── PLAYERS ──────────────────────────────────────────────────
+class Player:
+    def __init__(self, n: int, client: SignedClient, stub: StubSlack, seed: int, results):
+        self.user = f"ULOAD{n:05d}"
+        self.client = client
+        self.inbox = stub.inbox(self.user)
+        self.response_url = f"{stub.base}/respond/{self.user}"
+        self.rng = random.Random(seed * 100_003 + n)
+        self.message_ts = "1.0"
+        self.results = results
+
+    def _timed(self, kind: str, path: str, form: dict) -> dict:
+        start = time.perf_counter()
+        status = self.client.post(path, form)
+        acked = time.perf_counter()
+        if status != 200:
+            self.results.error(kind, f"HTTP {status}")
+            return None
+        try:
+            received, message = self.inbox.get(timeout=30)
+        except queue.Empty:
+            self.results.error(kind, "no response")
+            return None
+        self.results.record(kind, (acked - start) * 1000, (received - start) * 1000)
+        return message
+
+    def command(self) -> dict:
+        # each /cyberquest posts a new message for the buttons that follow
+        self.message_ts = f"{time.time():.6f}"
+        return self._timed("slash_command", "/slack/commands", {
+            "command": "/cyberquest", "text": "", "user_id": self.user, "team_id": "TLOAD",
+            "channel_id": "CLOAD", "response_url": self.response_url,
+            "trigger_id": f"t{self.rng.random()}",
+        })
+
+    def click(self, kind: str, button: dict) -> dict:
+        payload = {
+            "type": "block_actions", "team": {"id": "TLOAD"},
+            "user": {"id": self.user}, "channel": {"id": "CLOAD"},
+            "response_url": self.response_url, "trigger_id": f"t{self.rng.random()}",
+            "container": {"type": "message", "message_ts": self.message_ts},
+            "actions": [{"type": "button", "block_id": "b", "action_id": button["action_id"],
+                         "value": button.get("value", ""), "action_ts": str(time.time())}],
+        }
+        return self._timed(kind, "/slack/interactive", {"payload": json.dumps(payload)})
+
+    @staticmethod
+    def buttons(message: dict) -> list:
+        for block in (message or {}).get("blocks") or []:
+            if block.get("type") == "actions":
+                return block["elements"]
+        return []
+
+    def play_quiz(self) -> None:
+        menu = self.command()
+        message = self.click("start_quiz", self.buttons(menu)[0])
+        while True:
+            answers = self.buttons(message)
+            if not answers:
+                break  # won or lost
+            message = self.click("answer", self.rng.choice(answers))
+            following = self.buttons(message)
+            if not following:
+                break
+            message = self.click("next", following[0])
+
+    def play_adventure(self) -> None:
+        menu = self.command()
+        message = self.click("start_adventure", self.buttons(menu)[1])
+        while True:
+            choices = self.buttons(message)
+            if not choices:
+                break  # reached an ending
+            message = self.click("adventure_choice", self.rng.choice(choices))
+
+
+class Results:
+    def __init__(self):
+        self.ack: dict = {}
+        self.e2e: dict = {}
+        self.errors: dict = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, ack_ms: float, e2e_ms: float) -> None:
+        with self._lock:
+            self.ack.setdefault(kind, []).append(ack_ms)
+            self.e2e.setdefault(kind, []).append(e2e_ms)
+
+    def error(self, kind: str, why: str) -> None:
+        with self._lock:
+            key = f"{kind}: {why}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))], 2)
+
+
+def summarize(values: list) -> dict:
+    return {"count": len(values), "p50_ms": percentile(values, 50),
+            "p90_ms": percentile(values, 90), "p99_ms": percentile(values, 99),
+            "max_ms": round(max(values), 2) if values else 0.0}
+
+
+# ── RUN ──────────────────────────────────────────────────────
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args, stub: StubSlack = None) -> dict:
+    """One load test; pass a running stub when the server was started against it."""
+    if stub is None:
+        stub = StubSlack(args.stub_port, args.slack_delay / 1000).start()
+    if args.url:
+        client = SignedClient(args.secret, url=args.url, stats_token=args.stats_token)
+        mode = "http"
+    else:
+        os.environ.update({
+            "SLACK_API_URL": f"{stub.base}/api/", "SLACK_BOT_TOKEN": "xoxb-load",
+            "SLACK_SIGNING_SECRET": args.secret, "ADVENTURE_USERS": "*",
+            "PROFILE_TOKEN": args.stats_token,
+        })
+        import slacky2
+        client = SignedClient(args.secret, flask_app=slacky2.flask_app,
+                              stats_token=args.stats_token)
+        mode = "inprocess"
+
+    results = Results()
+    peak = {"sessions": 0, "memory_bytes": 0}
+    done = threading.Event()
+
+    def sample_sessions():
+        # session memory, from the app's own /stats endpoint
+        while not done.wait(0.1):
+            try:
+                stats = client.get_json("/stats")
+            except Exception:
+                continue
+            n = sum(v.get("sessions", 0) for k, v in stats.items() if k != "outbound")
+            mem = sum(v.get("memory_bytes", 0) for k, v in stats.items() if k != "outbound")
+            if n > peak["sessions"]:
+                peak.update(sessions=n, memory_bytes=mem)
+
+    def play(n: int):
+        player = Player(n, client, stub, args.seed, results)
+        for g in range(args.games):
+            try:
+                if player.rng.random() < args.adventure_share:
+                    player.play_adventure()
+                else:
+                    player.play_quiz()
+            except Exception as e:
+                results.error("game", type(e).__name__)
+
+    sampler = threading.Thread(target=sample_sessions, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=play, args=(n,)) for n in range(args.players)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+
+    all_ack = [v for values in results.ack.values() for v in values]
+    all_e2e = [v for values in results.e2e.values() for v in values]
+    return {
+        "config": {
+            "mode": mode, "players": args.players, "games": args.games,
+            "adventure_share": args.adventure_share, "seed": args.seed,
+            "slack_delay_ms": args.slack_delay,
+            "revision": git_revision(), "python": platform.python_version(),
+        },
+        "requests": len(all_ack),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(all_ack) / elapsed, 1) if elapsed else 0.0,
+        "ack": summarize(all_ack),
+        "ack_over_deadline": sum(v > ACK_DEADLINE_MS for v in all_ack),
+        "response": summarize(all_e2e),
+        "per_action": {k: {"ack": summarize(v), "response": summarize(results.e2e[k])}
+                       for k, v in sorted(results.ack.items())},
+        "peak_sessions": peak["sessions"],
+        "bytes_per_session": round(peak["memory_bytes"] / peak["sessions"], 1) if peak["sessions"] else None,
+        "errors": results.errors,
+    }
+
+
+def print_report(r: dict, baseline: dict = None) -> None:
+    def delta(path):
+        if baseline is None:
+            return ""
+        old, new = baseline, r
+        for key in path:
+            old, new = (old or {}).get(key), (new or {}).get(key)
+        if not old or new is None:
+            return ""
+        return f"  ({(new - old) / old * 100:+.1f}%)"
+
+    c = r["config"]
+    print(f"mode={c['mode']} players={c['players']} games={c['games']} rev={c['revision']}")
+    print(f"requests:      {r['requests']} in {r['elapsed_s']} s")
+    print(f"throughput:    {r['throughput_rps']} req/s{delta(['throughput_rps'])}")
+    print(f"ack p50/p99:   {r['ack']['p50_ms']} / {r['ack']['p99_ms']} ms"
+          f"{delta(['ack', 'p99_ms'])}  (deadline {ACK_DEADLINE_MS} ms, "
+          f"{r['ack_over_deadline']} over)")
+    print(f"reply p50/p99: {r['response']['p50_ms']} / {r['response']['p99_ms']} ms"
+          f"{delta(['response', 'p99_ms'])}")
+    for kind, v in r["per_action"].items():
+        print(f"  {kind:<18} n={v['ack']['count']:<6} ack p99 {v['ack']['p99_ms']:>8} ms"
+              f"   reply p99 {v['response']['p99_ms']:>8} ms")
+    print(f"sessions:      peak {r['peak_sessions']}, {r['bytes_per_session']} bytes each")
+    if r["errors"]:
+        print(f"errors:        {r['errors']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CyberQuest Slack endpoint load test")
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--games", type=int, default=3, help="games per player")
+    parser.add_argument("--adventure-share", type=float, default=0.3,
+                        help="fraction of games that are adventures")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="base URL of a running server (default: in-process)")
+    parser.add_argument("--stub-port", type=int, default=0)
+    parser.add_argument("--slack-delay", type=float, default=0.0,
+                        help="ms the stub waits before answering each Slack call")
+    parser.add_argument("--secret", default=os.getenv("SLACK_SIGNING_SECRET", "loadtest"))
+    parser.add_argument("--stats-token", default=os.getenv("PROFILE_TOKEN") or "loadtest",
+                        help="the server's PROFILE_TOKEN, for /stats")
+    parser.add_argument("--out", help="write the result as JSON")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    result = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
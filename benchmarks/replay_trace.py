@@ -0,0 +1,157 @@
+# benchmarks/replay_trace.py
+#
+# Replays an interaction trace recorded by profiler.py (POST
+# /debug/profile?action=start&trace=1) against slacky2 in-process, with
+# Slack stubbed out as in loadtest.py:
+#
+#   python benchmarks/replay_trace.py /tmp/cyberquest-trace.1234.jsonl
+#
+# Requests go one at a time, in recorded order, each after the reply to the
+# one before; button values are signed again from the game state the trace
+# kept, for the pseudonymous users. With the global random seeded the
+# replies are the same on every run: the digest printed at the end changes
+# only if the game's behaviour does. Run it before and after a change, or
+# with --profile to see where a real traffic mix spends its time.
+# Tournament rounds close on a timer, so their standings aren't compared.
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import queue
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import SignedClient, StubSlack  # noqa: E402
+
+SECRET = "replay"
+
+
+def read_trace(path: str) -> tuple:
+    """(header, records) from a trace file; a torn last line is skipped."""
+    header, records = None, []
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if "trace" in entry:
+                header = header or entry
+            else:
+                records.append(entry)
+    return header or {}, records
+
+
+def canonical(message, user: str, signer):
+    """A reply with signed button values replaced by the state they carry."""
+    if isinstance(message, dict):
+        out = {}
+        for k, v in message.items():
+            if k == "value" and isinstance(v, str):
+                try:
+                    raw_kind = base64.urlsafe_b64decode(v + "=" * (-len(v) % 4))[0]
+                    fields, tail, _ = signer.verify(user, v, raw_kind)
+                    v = [raw_kind, list(fields), list(tail)]
+                except Exception:
+                    pass
+            out[k] = canonical(v, user, signer)
+        return out
+    if isinstance(message, list):
+        return [canonical(v, user, signer) for v in message]
+    return message
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a profiler.py interaction trace")
+    parser.add_argument("trace")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=2.0,
+                        help="seconds to wait for a reply that may not come")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile every replayed request and print the top stacks")
+    args = parser.parse_args()
+
+    header, records = read_trace(args.trace)
+    stub = StubSlack().start()
+    tmp = tempfile.mkdtemp()
+    os.environ.update({
+        "SLACK_API_URL": f"{stub.base}/api/", "SLACK_BOT_TOKEN": "xoxb-replay",
+        "SLACK_SIGNING_SECRET": SECRET, "PAYLOAD_SECRET": SECRET, "ADVENTURE_USERS": "*",
+        "EVENTS_DB": os.path.join(tmp, "events.db"), "SESSION_BACKEND": "memory",
+        "SESSION_JOURNAL_DIR": "", "CONTENT_POLL_SECONDS": "0",
+    })
+    import slacky2
+    from content import registry
+    from payloads import signer
+    from profiler import profiler
+
+    for name, version in (header.get("content") or {}).items():
+        source = registry.sources.get(name)
+        if source is not None and source.version != version:
+            print(f"warning: {name} is version {source.version:08x} here, "
+                  f"{version:08x} in the trace; replies will differ")
+    if args.profile:
+        profiler.start(rate=1.0, seconds=1e9)
+
+    client = SignedClient(SECRET, flask_app=slacky2.flask_app)
+    random.seed(args.seed)
+    digest = hashlib.sha256()
+    outcomes = Counter()
+    started = time.perf_counter()
+    for i, r in enumerate(records):
+        user, url = r["user"], f"{stub.base}/respond/{r['user']}"
+        if "command" in r:
+            path, form = "/slack/commands", {
+                "command": r["command"], "text": r.get("text", ""), "user_id": user,
+                "team_id": r.get("team", ""), "channel_id": r.get("channel", ""),
+                "response_url": url, "trigger_id": f"replay{i}"}
+            kind = "command"
+        else:
+            value = r.get("value") or {}
+            if "kind" in value:
+                signed = signer.sign(user, value["kind"], tuple(value["fields"]),
+                                     tuple(value["tail"]))
+            else:
+                signed = value.get("plain", "invalid")
+            payload = {
+                "type": "block_actions", "team": {"id": r.get("team", "")}, "user": {"id": user},
+                "channel": {"id": r.get("channel", "")}, "response_url": url,
+                "trigger_id": f"replay{i}",
+                "container": {"type": "message", "message_ts": r.get("message", "")},
+                "actions": [{"type": "button", "block_id": "b", "action_id": r["action"],
+                             "value": signed, "action_ts": str(i)}]}
+            path, form = "/slack/interactive", {"payload": json.dumps(payload)}
+            kind = r["action"]
+        status = client.post(path, form)
+        try:
+            _, reply = stub.inbox(user).get(timeout=args.timeout)
+            text = json.dumps(canonical(reply, user, signer), sort_keys=True, ensure_ascii=False)
+            outcomes[kind] += 1
+        except queue.Empty:
+            text = f"no reply ({status})"
+            outcomes[f"{kind}: no reply"] += 1
+        digest.update(f"{i}:{kind}:{text}\n".encode())
+    elapsed = time.perf_counter() - started
+
+    print(f"replayed {len(records)} interactions in {elapsed:.2f} s")
+    for kind, n in sorted(outcomes.items()):
+        print(f"  {kind:<28} {n}")
+    print(f"digest {digest.hexdigest()[:16]}")
+    if args.profile:
+        profiler.enabled = False
+        lines = sorted(profiler.folded().splitlines(), key=lambda l: -int(l.rsplit(" ", 1)[1]))
+        print(f"top stacks of {profiler.stats()['samples']} samples:")
+        for line in lines[:10]:
+            stack, n = line.rsplit(" ", 1)
+            print(f"  {n:>6}  {' ← '.join(reversed(stack.split(';')[-3:]))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# content.py
+#
+# Hot-reloadable game content (the question bank and adventure scenes).
+#
+# Each content file is registered with a loader that parses and validates
+# it. A background thread polls file mtimes every CONTENT_POLL_SECONDS;
+# when a file changes, the new version is loaded on that thread and swapped
+# in with a single assignment, so requests never see a half-loaded version.
+# A loader that raises leaves the current version in place. Requests never
+# load content themselves: a game pinned to a version this worker hasn't
+# seen yet only starts a reload in the background.
+#
+# Versions are identified by a 32-bit hash of the file bytes, so every
+# worker agrees on the id. Games pin the version they started with, and the
+# last CONTENT_KEEP_VERSIONS versions stay loaded for them. Replace content
+# files atomically (write a temp file, then rename over the old one).
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CONTENT_POLL_SECONDS = float(os.getenv("CONTENT_POLL_SECONDS", 5))
+CONTENT_KEEP_VERSIONS = int(os.getenv("CONTENT_KEEP_VERSIONS", 8))
+
+logger = logging.getLogger(__name__)
+
+
+def _file_version(path: str) -> int:
+    with open(path, "rb") as f:
+        return int.from_bytes(hashlib.blake2b(f.read(), digest_size=4).digest(), "big")
+
+
+class ContentSource:
+    """One watched file and the versions loaded from it."""
+
+    def __init__(self, name: str, path: str, load, keep: int = CONTENT_KEEP_VERSIONS,
+                 on_access=None):
+        self.name = name
+        self.path = path
+        self.load = load
+        self.keep = keep
+        self.reloads = 0
+        self.failures = 0
+        self._versions: OrderedDict = OrderedDict()
+        self._stat = None
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._on_access = on_access
+        # (version id, content), replaced as a whole so readers never pair
+        # one version's id with another version's content
+        self._head = (None, None)
+        if not self.check():
+            raise RuntimeError(f"could not load {name} from {path}")
+
+    def get(self, version: int = None):
+        """Content for a pinned version (or the current one); None if gone or not loaded yet."""
+        if self._on_access is not None:
+            self._on_access()
+        head_version, head = self._head
+        if version is None or version == head_version:
+            return head
+        content = self._versions.get(version)
+        if content is None:
+            # another worker may have picked up a newer file first
+            self.reload_soon()
+        return content
+
+    def reload_soon(self) -> None:
+        """check() on a background thread, unless one is already running."""
+        # two racing requests may both start one; check() serialises them
+        if self._reloading:
+            return
+        self._reloading = True
+        threading.Thread(target=self._reload, name=f"content-reload-{self.name}",
+                         daemon=True).start()
+
+    def _reload(self) -> None:
+        try:
+            self.check()
+        finally:
+            self._reloading = False
+
+    def check(self) -> bool:
+        """Reload the file if it changed. Returns False if loading failed."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except OSError as e:
+                logger.error("%s: cannot stat %s: %s", self.name, self.path, e)
+                return self._head[1] is not None
+            stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+            if stat == self._stat:
+                return True
+            try:
+                version = _file_version(self.path)
+                content = self._versions.get(version)
+                if content is None:
+                    content = self.load(self.path)
+            except Exception:
+                self.failures += 1
+                logger.exception("%s: keeping version %08x, new %s is invalid",
+                                 self.name, self.version or 0, self.path)
+                self._stat = stat  # don't retry until the file changes again
+                return self._head[1] is not None
+            self._stat = stat
+            self._versions[version] = content
+            self._versions.move_to_end(version)
+            while len(self._versions) > self.keep:
+                self._versions.popitem(last=False)
+            if version != self.version:
+                if self.version is not None:
+                    self.reloads += 1
+                    logger.info("%s: loaded version %08x from %s", self.name, version, self.path)
+                self._head = (version, content)
+            return True
+
+    def head(self) -> tuple:
+        """(version, content) of the current version, read together."""
+        if self._on_access is not None:
+            self._on_access()
+        return self._head
+
+    @property
+    def version(self) -> int:
+        return self._head[0]
+
+    @property
+    def current(self):
+        return self._head[1]
+
+
+class ContentRegistry:
+    """All content sources plus the thread that watches them."""
+
+    def __init__(self, poll_seconds: float = CONTENT_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.sources: dict = {}
+        self._pid = None
+        self._lock = threading.Lock()
+        # the watcher may be mid-reload when a preloaded master forks (see
+        # gunicorn.conf.py); forking with the locks held leaves the worker's
+        # copies locked for good, so the fork waits for the reload instead
+        os.register_at_fork(before=self._before_fork, after_in_parent=self._after_fork,
+                            after_in_child=self._after_fork_in_child)
+
+    def register(self, name: str, path: str, load) -> ContentSource:
+        source = self.sources[name] = ContentSource(name, path, load, on_access=self.start)
+        self.start()
+        return source
+
+    def __getitem__(self, name: str) -> ContentSource:
+        return self.sources[name]
+
+    def start(self) -> None:
+        """Start the watcher in this process (threads don't survive fork)."""
+        if self.poll_seconds <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._watch, name="content-watch", daemon=True).start()
+                self._pid = os.getpid()
+
+    def _before_fork(self) -> None:
+        self._lock.acquire()
+        for source in self.sources.values():
+            source._lock.acquire()
+
+    def _after_fork(self) -> None:
+        for source in self.sources.values():
+            source._lock.release()
+        self._lock.release()
+
+    def _after_fork_in_child(self) -> None:
+        self._after_fork()
+        # a reload thread running in the parent doesn't exist here
+        for source in self.sources.values():
+            source._reloading = False
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.poll_seconds)
+            for source in list(self.sources.values()):
+                source.check()
+
+
+registry = ContentRegistry()
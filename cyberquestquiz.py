@@ -0,0 +1,271 @@
+# cyberquestquiz.py
+#
+# Quiz game logic, shared by the Flask entry point (slacky2.py) and the
+# ASGI one (asgi_app.py). Each handler takes the clicking user and the
+# button value and returns the keyword arguments for respond(); none of
+# them make network calls, so they can be called from threads or coroutines.
+
+import os
+import random
+import time
+from collections import namedtuple
+
+from session_store import make_store
+from game_state import QuizSession, QuestionHistory
+from quiz_blocks import TemplateCache
+from question_bank import load_bank
+from content import registry
+from payloads import QUIZ_ANSWER, QUIZ_NEXT, InvalidPayload, signer
+from selection import selector
+import events
+
+# questions.json, or a memory-mapped .pack built with question_bank.py
+QUESTIONS_PATH = os.getenv(
+    "QUESTIONS_PATH", os.path.join(os.path.dirname(__file__), "questions.json"))
+
+# ── CONFIG ───────────────────────────────────────────────────
+WIN_AT = int(os.getenv("WIN_AT", 10))
+LOSE_AT = int(os.getenv("LOSE_AT", 5))
+BAR_LEN = int(os.getenv("BAR_LEN", 10))
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", 4096))
+# "adaptive": weight questions by the player's misses (see selection.py)
+# "shuffled": every question once per pass, in bank.order(seed)
+QUIZ_SELECTION = os.getenv("QUIZ_SELECTION", "adaptive")
+
+# ── LOAD QUESTIONS ───────────────────────────────────────────
+# the bank plus its compiled Block Kit templates (see quiz_blocks.py),
+# reloaded in the background when QUESTIONS_PATH changes (see content.py)
+QuizContent = namedtuple("QuizContent", ["bank", "templates"])
+
+
+def load_quiz_content(path: str) -> QuizContent:
+    bank = load_bank(path)
+    return QuizContent(bank, TemplateCache(bank, maxsize=TEMPLATE_CACHE_SIZE))
+
+
+QUIZ = registry.register("questions", QUESTIONS_PATH, load_quiz_content)
+
+# ── SESSION STORE ───────────────────────────────────────────
+# user_id → QuizSession(version, seed, step, correct, wrong)
+# questions are drawn per turn (see pick_question), so no queue is stored; version
+# pins the question bank the game started with. Buttons carry the same
+# state signed (see payloads.py), so the store only follows the game.
+# backend chosen by SESSION_BACKEND (see session_store.py)
+sessions = make_store("quiz", QuizSession)
+
+# user_id → QuestionHistory, kept across games for adaptive selection;
+# replaced when the bank version changes
+history = make_store("history", QuestionHistory)
+
+INVALID_BUTTON = "❗ That button has expired. Type `/cyberquest` to start a new game."
+CONTENT_CHANGED = "♻️ The questions were updated since this game started. Type `/cyberquest` to start a new one."
+STALE_BUTTON = "⏭️ You already answered that one. Keep going from the latest question."
+
+# ── INTRO UI ─────────────────────────────────────────────────
+start_ui = [
+    {
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            "text": (
+                "*🎮 Welcome to CyberQuest!*\n\n"
+                f"First to *{WIN_AT}* correct wins. First to *{LOSE_AT}* wrong loses.\n\n"
+                "*Think you're too smart to get phished? Think again.*\n"
+                "Every right answer gets you closer to victory.\n"
+                "Every wrong answer? Closer to being hacked 😬\n\n"
+                "Choose a mode to begin:"
+            )
+        }
+    },
+    {"type": "divider"},
+    {
+        "type": "actions",
+        "elements": [
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "🧠 Start Quiz", "emoji": True},
+                "action_id": "start_game_click",
+                "value": "start"
+            },
+            {
+                "type": "button",
+                "text": {"type": "plain_text", "text": "🚨 Start Adventure (Coming Soon)", "emoji": True},
+                "action_id": "start_adventure_click",
+                "value": "coming_soon",
+                "style": "danger"
+            }
+        ]
+    }
+]
+
+# ── HELPERS ──────────────────────────────────────────────────
+
+
+def progress_bar(correct: int, wrong: int) -> str:
+    filled = "█" * min(correct, BAR_LEN)
+    empty = "░" * (BAR_LEN - len(filled))
+    return f"[{filled}{empty}]  ✅ {correct}/{WIN_AT}  ❌ {wrong}/{LOSE_AT}"
+
+
+def build_question_blocks(user: str, quiz: QuizContent, state: QuizSession, q_idx: int):
+    # every answer button carries the whole game state, signed for this user
+    def sign_option(option: int) -> str:
+        return signer.sign(user, QUIZ_ANSWER, (
+            state.version, state.seed, state.step, state.correct, state.wrong, q_idx, option))
+
+    return quiz.templates.render(
+        q_idx, progress_bar(state.correct, state.wrong), state.step, sign_option)
+
+
+def pick_question(user: str, quiz: QuizContent, state: QuizSession) -> int:
+    if QUIZ_SELECTION == "shuffled":
+        return quiz.bank.order(state.seed)[state.step]
+    h = history.get(user)
+    if h is not None and h.version != state.version:
+        h = None
+    return selector.pick(h, len(quiz.bank))
+
+
+def record_answer(user: str, quiz: QuizContent, version: int, q_idx: int, missed: bool) -> None:
+    if QUIZ_SELECTION == "shuffled":
+        return
+    bank_size = len(quiz.bank)
+    history.update(user, lambda h: (
+        selector.record(h, version, q_idx, missed, bank_size), None))
+
+
+def question_message(user: str, quiz: QuizContent, state: QuizSession) -> dict:
+    q_idx = pick_question(user, quiz, state)
+    return dict(
+        replace_original=True,
+        blocks=build_question_blocks(user, quiz, state, q_idx),
+        text=quiz.bank[q_idx]["q"]
+    )
+
+
+def _advance(current, shown: QuizSession, new, issued: int):
+    """sessions.update() step: move from `shown` to `new` unless the game has moved on.
+
+    Returns None if it moved, else the reply for the click. A session at a
+    different turn means the button is from an older message (or was
+    clicked twice); no session means another worker or node ran the game so
+    far, and the signed button is trusted as it is – unless it was issued
+    longer ago than any session lives, as a finished or abandoned game's
+    buttons would otherwise score again on the leaderboards.
+    """
+    if current is None:
+        if time.time() - issued > sessions.ttl:
+            return None, INVALID_BUTTON
+        return new, None
+    if not current.same_turn(shown):
+        return current, STALE_BUTTON
+    return new, None
+
+# ── HANDLERS ─────────────────────────────────────────────────
+
+
+def start_menu() -> dict:
+    return dict(blocks=start_ui, text="Ready for CyberQuest!")
+
+
+# `where` is the (team, channel) the game is played in, for the event log
+# and leaderboards (see events.py)
+
+
+def start_game(user: str, where: tuple = ("", "")) -> dict:
+    version, quiz = QUIZ.head()
+    state = QuizSession(version, random.getrandbits(32))
+    sessions.set(user, state)
+    events.log.record(events.QUIZ_START, user, where, version)
+    return question_message(user, quiz, state)
+
+
+def answer(user: str, value: str, where: tuple = ("", "")) -> dict:
+    try:
+        fields, _, issued = signer.verify(user, value, QUIZ_ANSWER)
+    except InvalidPayload:
+        return dict(text=INVALID_BUTTON)
+    version, seed, step, correct, wrong, q_idx, option = fields
+    shown = QuizSession(version, seed, step, correct, wrong)
+
+    # resolve the answer against the bank this game started with
+    quiz = QUIZ.get(version)
+    if quiz is None:
+        sessions.delete(user)
+        return dict(text=CONTENT_CHANGED)
+    opt = quiz.bank[q_idx]["options"][option]
+
+    if opt["ok"]:
+        correct += 1
+        feedback_emoji = "🟢"
+        feedback_text = "*Correct!*"
+    else:
+        wrong += 1
+        feedback_emoji = "🔴"
+        feedback_text = "*Incorrect.*"
+
+    # a finished game keeps its final state until the next one starts, so
+    # late clicks on its buttons are still recognised as stale
+    refused = sessions.update(user, lambda current: _advance(
+        current, shown, QuizSession(version, seed, step, correct, wrong), issued))
+    if refused:
+        return dict(text=refused, replace_original=False)
+    record_answer(user, quiz, version, q_idx, not opt["ok"])
+    events.log.record(events.ANSWER, user, where, version, q_idx, option, int(opt["ok"]),
+                      int(time.time()) - issued)
+
+    if correct >= WIN_AT or wrong >= LOSE_AT:
+        events.log.record(events.QUIZ_END, user, where, version, correct, wrong,
+                          int(correct >= WIN_AT))
+    if correct >= WIN_AT:
+        return dict(
+            replace_original=True,
+            text=f"🏆 You win! {correct}/{WIN_AT} correct. Type `/cyberquest` to play again."
+        )
+    if wrong >= LOSE_AT:
+        return dict(
+            replace_original=True,
+            text=f"💀 Game over! {wrong}/{LOSE_AT} wrong. Type `/cyberquest` to try again."
+        )
+
+    feedback_blocks = [
+        {
+            "type": "section",
+            "text": {"type": "mrkdwn", "text": f"{feedback_emoji} {feedback_text}\n{opt['why']}"}
+        },
+        {
+            "type": "actions",
+            "elements": [
+                {
+                    "type": "button",
+                    "text": {"type": "plain_text", "text": "Next ▶️"},
+                    "action_id": "next_click",
+                    "value": signer.sign(user, QUIZ_NEXT, (version, seed, step, correct, wrong))
+                }
+            ]
+        }
+    ]
+    return dict(replace_original=True, blocks=feedback_blocks)
+
+
+def next_question(user: str, value: str) -> dict:
+    try:
+        fields, _, issued = signer.verify(user, value, QUIZ_NEXT)
+    except InvalidPayload:
+        return dict(text=INVALID_BUTTON)
+    shown = QuizSession(*fields)
+    state = QuizSession(*fields)
+
+    quiz = QUIZ.get(state.version)
+    if quiz is None:
+        sessions.delete(user)
+        return dict(text=CONTENT_CHANGED)
+    state.step += 1
+    if state.step >= len(quiz.bank):
+        # went through the whole bank; start over in a new order
+        state.seed = random.getrandbits(32)
+        state.step = 0
+    refused = sessions.update(user, lambda current: _advance(current, shown, state, issued))
+    if refused:
+        return dict(text=refused, replace_original=False)
+    return question_message(user, quiz, state)
@@ -0,0 +1,123 @@
+# dedup.py
+#
+# Drops repeated deliveries of the same interaction before any game logic
+# runs. Only two kinds of repeat are dropped:
+#
+#   retries       Slack re-sends a delivery it thinks timed out, with
+#                 X-Slack-Retry-Num; the retry gets a bare 200
+#   game buttons  a second click on a button whose value is a signed game
+#                 state (see payloads.py), e.g. a double-click on an answer;
+#                 the first click replied through response_url already
+#
+# Any other button (start a game, tournament answers) is handled every time
+# it is clicked, so a second click still gets its reply.
+#
+# Keys:
+#   events          event_id (the same on every retry)
+#   block_actions   user, message and the clicked button's action_id and
+#                   value; signed values differ between turns
+#   slash commands  trigger_id
+#
+# The cache is per process. Buttons clicked on another worker, or on an
+# older message, are caught by the step checks in cyberquestquiz.py and
+# cyberquestadv.py instead.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from slack_bolt.response import BoltResponse
+
+from payloads import signer
+
+DEDUP_TTL = int(os.getenv("DEDUP_TTL", 600))
+DEDUP_MAX = int(os.getenv("DEDUP_MAX", 50_000))
+
+
+def delivery_key(body: dict):
+    """Identity of one interaction across retries and double-clicks, or None."""
+    kind = body.get("type")
+    if kind == "event_callback":
+        return f"event:{body.get('event_id')}"
+    if kind == "block_actions" and body.get("actions"):
+        action = body["actions"][0]
+        message_ts = (body.get("container") or {}).get("message_ts", "")
+        return (f"action:{body['user']['id']}:{message_ts}:"
+                f"{action.get('action_id')}:{action.get('value', '')}")
+    if body.get("command") and body.get("trigger_id"):
+        return f"command:{body['trigger_id']}"
+    return None
+
+
+def is_game_button(body: dict) -> bool:
+    """Whether this is a click on a button carrying a signed game state."""
+    if body.get("type") != "block_actions" or not body.get("actions"):
+        return False
+    return signer.signed(body["user"]["id"], body["actions"][0].get("value") or "")
+
+
+class DedupCache:
+    """Keys seen in the last `ttl` seconds, at most `max_size` of them."""
+
+    def __init__(self, ttl: int = DEDUP_TTL, max_size: int = DEDUP_MAX):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.duplicates = 0
+        self.retries = 0
+        # key → first seen; never refreshed, so the oldest entry is first
+        self._seen: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, key: str) -> bool:
+        """True if key was already seen; otherwise remember it and return False."""
+        now = time.monotonic()
+        with self._lock:
+            first = self._seen.get(key)
+            if first is not None and now - first < self.ttl:
+                return True
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+            cutoff = now - self.ttl
+            while self._seen:
+                oldest_key, first = next(iter(self._seen.items()))
+                if first >= cutoff and len(self._seen) <= self.max_size:
+                    break
+                del self._seen[oldest_key]
+            return False
+
+    def check(self, body: dict, headers: dict) -> bool:
+        """True if this delivery is a retry or game-button click already handled."""
+        retry = bool(headers.get("x-slack-retry-num"))
+        if retry:
+            with self._lock:
+                self.retries += 1
+        key = delivery_key(body)
+        # every delivery is remembered, so a retry of any of them is caught
+        if key is None or not self.seen(key):
+            return False
+        if not retry and not is_game_button(body):
+            return False
+        with self._lock:
+            self.duplicates += 1
+        return True
+
+    def stats(self) -> dict:
+        return {"size": len(self._seen), "duplicates": self.duplicates, "retries": self.retries}
+
+
+deliveries = DedupCache()
+
+
+def skip_duplicates(body, request, next):
+    """App middleware answering repeated deliveries without running listeners."""
+    if deliveries.check(body, request.headers):
+        return BoltResponse(status=200, body="")
+    next()
+
+
+async def skip_duplicates_async(body, request, next):
+    """skip_duplicates for AsyncApp."""
+    if deliveries.check(body, request.headers):
+        return BoltResponse(status=200, body="")
+    await next()
@@ -0,0 +1,291 @@
+# events.py
+#
+# Append-only log of game events, plus the aggregates behind the
+# leaderboards and per-player stats (`/cyberquest stats`).
+#
+# Handlers call record(), which only puts a tuple on a bounded queue; a
+# writer thread per process drains it every EVENTS_FLUSH_INTERVAL seconds
+# (or every EVENTS_BATCH events) and writes the whole batch in one SQLite
+# WAL transaction. The same transaction folds the batch into the
+# aggregate tables with upserts, so they are always in step with the log:
+#
+#   events       one row per event (see the kinds below); analytics.py reads it
+#   players      (team, user) → answered, correct, games, wins, choices, points
+#   leaderboard  (scope, user) → points, scope "team:T…" or "channel:C…",
+#                indexed by points, so a top-N read touches N rows
+#
+# Points are one per correct answer plus the score_change of every
+# adventure choice. If the queue is full the event is dropped and counted
+# (see stats()); a slow disk never holds up a reply.
+
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+EVENTS_ENABLED = os.getenv("EVENTS_ENABLED", "1") == "1"
+EVENTS_DB = os.getenv("EVENTS_DB", "/tmp/cyberquest-events.db")
+EVENTS_BATCH = int(os.getenv("EVENTS_BATCH", 500))
+EVENTS_FLUSH_INTERVAL = float(os.getenv("EVENTS_FLUSH_INTERVAL", 1.0))
+EVENTS_QUEUE = int(os.getenv("EVENTS_QUEUE", 100_000))
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", 10))
+
+logger = logging.getLogger(__name__)
+
+# ── EVENT KINDS ──────────────────────────────────────────────
+#                    subject        option        value           elapsed
+QUIZ_START = 1     # -              -             -               -
+ANSWER = 2         # q_idx          option        1 if correct    s since shown
+QUIZ_END = 3       # correct        wrong         1 if won        -
+ADVENTURE_START = 4  # scene id     -             -               -
+CHOICE = 5         # scene id       choice¹       score_change    s since shown
+ADVENTURE_END = 6  # ending scene   -             final score     -
+# ¹ choice index + 256 × the route it took (see scene_graph.py), so 0..255
+#   for a choice with a plain next_scene
+
+KIND_NAMES = {
+    QUIZ_START: "quiz_start", ANSWER: "answer", QUIZ_END: "quiz_end",
+    ADVENTURE_START: "adventure_start", CHOICE: "choice", ADVENTURE_END: "adventure_end",
+}
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS events ("
+    " id INTEGER PRIMARY KEY, ts REAL NOT NULL, kind INTEGER NOT NULL,"
+    " team TEXT NOT NULL, channel TEXT NOT NULL, user TEXT NOT NULL,"
+    " version INTEGER, subject INTEGER, option INTEGER, value INTEGER, elapsed INTEGER)",
+    "CREATE TABLE IF NOT EXISTS players ("
+    " team TEXT NOT NULL, user TEXT NOT NULL,"
+    " answered INTEGER NOT NULL DEFAULT 0, correct INTEGER NOT NULL DEFAULT 0,"
+    " games INTEGER NOT NULL DEFAULT 0, wins INTEGER NOT NULL DEFAULT 0,"
+    " choices INTEGER NOT NULL DEFAULT 0, points INTEGER NOT NULL DEFAULT 0,"
+    " PRIMARY KEY (team, user))",
+    "CREATE TABLE IF NOT EXISTS leaderboard ("
+    " scope TEXT NOT NULL, user TEXT NOT NULL, points INTEGER NOT NULL,"
+    " PRIMARY KEY (scope, user))",
+    "CREATE INDEX IF NOT EXISTS leaderboard_points ON leaderboard (scope, points DESC)",
+)
+
+_PLAYER_FIELDS = ("answered", "correct", "games", "wins", "choices", "points")
+
+
+def origin(body: dict) -> tuple:
+    """(team, channel) of a slash command or interaction payload."""
+    if "team_id" in body:
+        return body["team_id"], body.get("channel_id", "")
+    return (body.get("team") or {}).get("id", ""), (body.get("channel") or {}).get("id", "")
+
+
+def _fold(batch: list):
+    """Aggregate deltas for a batch: {(team, user): [fields…]}, {(scope, user): points}."""
+    players = defaultdict(lambda: [0] * len(_PLAYER_FIELDS))
+    boards = defaultdict(int)
+    for _, kind, team, channel, user, _, _, _, value, _ in batch:
+        row = players[team, user]
+        points = 0
+        if kind == ANSWER:
+            row[0] += 1
+            row[1] += value
+            points = value
+        elif kind == QUIZ_END:
+            row[2] += 1
+            row[3] += value
+        elif kind == CHOICE:
+            row[4] += 1
+            points = value
+        else:
+            continue
+        if points:
+            row[5] += points
+            boards[f"team:{team}", user] += points
+            if channel:
+                boards[f"channel:{channel}", user] += points
+    return players, boards
+
+
+class EventLog:
+    """Buffered writer for the events table and its aggregates."""
+
+    def __init__(self, path: str = EVENTS_DB, batch: int = EVENTS_BATCH,
+                 interval: float = EVENTS_FLUSH_INTERVAL, max_queue: int = EVENTS_QUEUE):
+        self.path = path
+        self.batch = batch
+        self.interval = interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    # ── write path ──
+    def record(self, kind: int, user: str, where: tuple = ("", ""), version: int = None,
+               subject: int = None, option: int = None, value: int = 0,
+               elapsed: int = None) -> None:
+        """Queue one event; never blocks."""
+        self._ensure_started()
+        team, channel = where
+        try:
+            self._queue.put_nowait((time.time(), kind, team or "", channel or "", user,
+                                    version, subject, option, value, elapsed))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait up to timeout seconds for queued events to be written."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _ensure_started(self) -> None:
+        # threads don't survive fork, so start the writer lazily in each worker
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._writer, name="events", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _writer(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                self.written += len(batch)
+            except Exception:
+                logger.exception("writing %d events failed", len(batch))
+                self.failed += len(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: list) -> None:
+        players, boards = _fold(batch)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO events (ts, kind, team, channel, user, version, subject,"
+                " option, value, elapsed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            conn.executemany(
+                "INSERT INTO players (team, user, answered, correct, games, wins, choices, points)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (team, user) DO UPDATE SET"
+                " answered = answered + excluded.answered, correct = correct + excluded.correct,"
+                " games = games + excluded.games, wins = wins + excluded.wins,"
+                " choices = choices + excluded.choices, points = points + excluded.points",
+                [(team, user, *row) for (team, user), row in players.items()])
+            conn.executemany(
+                "INSERT INTO leaderboard VALUES (?, ?, ?) ON CONFLICT (scope, user)"
+                " DO UPDATE SET points = points + excluded.points",
+                [(scope, user, points) for (scope, user), points in boards.items()])
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self.batches += 1
+
+    # ── read path ──
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; readers never wait for the writer in WAL mode."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # a connection opened before a fork (gunicorn --preload) can't be
+            # used after it; the thread that forked keeps its thread-locals
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def player(self, team: str, user: str) -> dict:
+        row = self._conn().execute(
+            "SELECT answered, correct, games, wins, choices, points FROM players"
+            " WHERE team = ? AND user = ?", (team, user)).fetchone()
+        return dict(zip(_PLAYER_FIELDS, row or (0,) * len(_PLAYER_FIELDS)))
+
+    def leaderboard(self, scope: str, limit: int = LEADERBOARD_SIZE) -> list:
+        """[(user, points)] best first, for scope "team:T…" or "channel:C…"."""
+        return self._conn().execute(
+            "SELECT user, points FROM leaderboard WHERE scope = ?"
+            " ORDER BY points DESC LIMIT ?", (scope, limit)).fetchall()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+class _Disabled:
+    """Stand-in when EVENTS_ENABLED=0: records nothing, reads come back empty."""
+
+    def record(self, *args, **kwargs) -> None:
+        pass
+
+    def flush(self, timeout: float = 5.0) -> None:
+        pass
+
+    def player(self, team: str, user: str) -> dict:
+        return dict.fromkeys(_PLAYER_FIELDS, 0)
+
+    def leaderboard(self, scope: str, limit: int = LEADERBOARD_SIZE) -> list:
+        return []
+
+    def stats(self) -> dict:
+        return {"enabled": False}
+
+
+log = EventLog() if EVENTS_ENABLED else _Disabled()
+atexit.register(log.flush)
+
+# ── SLACK MESSAGE ────────────────────────────────────────────
+
+
+def _board_text(title: str, rows: list, user: str) -> str:
+    if not rows:
+        return f"*{title}*\nNo points yet. Be the first!"
+    medals = ["🥇", "🥈", "🥉"]
+    lines = [
+        f"{medals[i] if i < len(medals) else f'{i + 1}.'} <@{who}>  {points} pts"
+        + ("  ← you" if who == user else "")
+        for i, (who, points) in enumerate(rows)
+    ]
+    return f"*{title}*\n" + "\n".join(lines)
+
+
+def stats_message(user: str, where: tuple) -> dict:
+    """respond() kwargs for `/cyberquest stats`: the player's totals and both leaderboards."""
+    team, channel = where
+    me = log.player(team, user)
+    accuracy = f"{me['correct'] / me['answered']:.0%}" if me["answered"] else "–"
+    mine = (f"*📊 Your CyberQuest stats*\n"
+            f"{me['points']} pts · {me['correct']}/{me['answered']} correct ({accuracy}) · "
+            f"{me['wins']}/{me['games']} quizzes won · {me['choices']} adventure choices")
+    blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": mine}}, {"type": "divider"}]
+    if channel:
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": _board_text(
+            "🏆 This channel", log.leaderboard(f"channel:{channel}"), user)}})
+    blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": _board_text(
+        "🌐 This workspace", log.leaderboard(f"team:{team}"), user)}})
+    return dict(blocks=blocks, text=f"You have {me['points']} CyberQuest points")
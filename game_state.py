@@ -0,0 +1,116 @@
+# game_state.py
+#
+# Compact per-user session objects for both game modes. In-process stores
+# keep these objects as they are; shared stores (SQLite, Redis) keep the
+# bytes from pack() and rebuild the object with unpack().
+
+import struct
+from array import array
+
+
+class QuizSession:
+    """A quiz in progress on question bank `version` (see content.py).
+
+    The question order is bank.order(seed).
+    """
+
+    __slots__ = ("version", "seed", "step", "correct", "wrong")
+    _packer = struct.Struct("<IIIHH")
+
+    def __init__(self, version: int, seed: int, step: int = 0, correct: int = 0, wrong: int = 0):
+        self.version = version
+        self.seed = seed
+        self.step = step
+        self.correct = correct
+        self.wrong = wrong
+
+    def same_turn(self, other: "QuizSession") -> bool:
+        """True if both describe the same point of the same game."""
+        return (self.version, self.seed, self.step, self.correct, self.wrong) == (
+            other.version, other.seed, other.step, other.correct, other.wrong)
+
+    def pack(self) -> bytes:
+        return self._packer.pack(self.version, self.seed, self.step, self.correct, self.wrong)
+
+    @classmethod
+    def unpack(cls, raw: bytes) -> "QuizSession":
+        return cls(*cls._packer.unpack(raw))
+
+
+class AdventureSession:
+    """An adventure in progress on scene graph `version` (see content.py).
+
+    current_scene is a scene id and tags a bitset of that graph's tags
+    (bit i set = graph.tags[i] was added).
+    """
+
+    __slots__ = ("version", "current_scene", "tags", "score", "player_name")
+    # format, version, scene, score, tag bytes; then the tags and the name
+    _packer = struct.Struct("<BIHhB")
+    _FORMAT = 1
+
+    def __init__(self, version: int, current_scene: int, player_name: str,
+                 tags: int = 0, score: int = 0):
+        self.version = version
+        self.current_scene = current_scene
+        self.player_name = player_name
+        self.tags = tags
+        self.score = score
+
+    def same_turn(self, version: int, scene: int, score: int, tags: int) -> bool:
+        """True if this session is at the scene a (signed) button was shown on."""
+        return (self.current_scene == scene and self.version == version
+                and self.score == score and self.tags == tags)
+
+    def pack(self) -> bytes:
+        tags = self.tags.to_bytes((self.tags.bit_length() + 7) // 8, "little")
+        return (self._packer.pack(self._FORMAT, self.version, self.current_scene,
+                                  self.score, len(tags))
+                + tags + self.player_name.encode())
+
+    @classmethod
+    def unpack(cls, raw: bytes) -> "AdventureSession":
+        _, version, scene, score, n = cls._packer.unpack_from(raw)
+        offset = cls._packer.size
+        tags = int.from_bytes(raw[offset:offset + n], "little")
+        return cls(version, scene, raw[offset + n:].decode(), tags, score)
+
+
+class QuestionHistory:
+    """A user's recent answers on question bank `version`, for selection.py.
+
+    Parallel arrays, one slot per question: its index, how many times it
+    was missed (decaying), and the turn (clock) it was last answered on.
+    """
+
+    __slots__ = ("version", "clock", "questions", "misses", "seen", "tree", "slots", "turns")
+    _header = struct.Struct("<IIH")
+
+    def __init__(self, version: int, clock: int = 0, questions: array = None,
+                 misses: array = None, seen: array = None):
+        self.version = version
+        self.clock = clock
+        self.questions = questions if questions is not None else array("I")
+        self.misses = misses if misses is not None else array("B")
+        self.seen = seen if seen is not None else array("I")
+        # selection weights (selection.LineWeights) and lookups, question →
+        # slot and turn last answered → slot; rebuilt on demand, never packed
+        self.tree = None
+        self.slots = None
+        self.turns = None
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def pack(self) -> bytes:
+        return (self._header.pack(self.version, self.clock, len(self.questions))
+                + self.questions.tobytes() + self.misses.tobytes() + self.seen.tobytes())
+
+    @classmethod
+    def unpack(cls, raw: bytes) -> "QuestionHistory":
+        version, clock, n = cls._header.unpack_from(raw)
+        offset = cls._header.size
+        questions = array("I", raw[offset:offset + 4 * n])
+        misses = array("B", raw[offset + 4 * n:offset + 5 * n])
+        seen = array("I", raw[offset + 5 * n:offset + 9 * n])
+        return cls(version, clock, questions, misses, seen)
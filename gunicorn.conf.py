@@ -0,0 +1,56 @@
+# gunicorn.conf.py
+#
+# Read by gunicorn from the working directory (see Dockerfile).
+#
+# With GUNICORN_PRELOAD=1 (the default) the app is imported once, in the
+# master: the question bank, the compiled scenes and the Block Kit
+# templates are built there, and every worker is forked with them already
+# in memory. Workers share those pages copy-on-write, so more workers or a
+# bigger content pack don't multiply the memory, and a worker that is
+# restarted is serving again in milliseconds instead of reloading content.
+#
+# Two things would copy the shared pages anyway. A collection in a worker
+# writes to the GC header of every object it visits, so the master's heap
+# is frozen (gc.freeze) right before each fork and the collector never
+# visits it; and collections while the app loads would leave freed holes
+# that the workers fill, so the collector is off until then. Reference
+# counts are the other writer: the quiz templates, the bulk of the content,
+# are packed so that a render touches few objects (see quiz_blocks.py).
+#
+# Per-process startup (the session journal, the profiler's signal) runs in
+# each worker after the fork (see prefork.py), with or without preloading.
+#
+#   GUNICORN_PRELOAD=0   import the app in each worker instead
+
+import gc
+import os
+import time
+
+import prefork
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+prefork.defer_to_workers()
+if preload_app:
+    gc.disable()
+
+
+def when_ready(server):
+    # the app is loaded (when preloading) and no worker is forked yet
+    gc.freeze()
+    gc.enable()
+
+
+def pre_fork(server, worker):
+    # includes content the master reloaded since the last fork
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+    prefork.start_worker()
+    worker.log.info("worker %s ready in %.0f ms", worker.pid,
+                    (time.monotonic() - worker.forked_at) * 1000)
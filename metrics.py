@@ -0,0 +1,303 @@
+# metrics.py
+#
+# Prometheus metrics for the Bolt listeners, the session stores and the
+# outbound dispatcher, served as text from /metrics.
+#
+# Each listener is timed from the start of Bolt's middleware chain to
+#   • its ack() call – Slack retries or shows an error after 3 s
+#   • each respond() call – when the reply was sent or queued
+# and outbound.py reports every response_url / Web API call it makes.
+#
+# With METRICS_ENABLED off (the default) listener() returns the function
+# untouched and nothing is hooked in, so the handlers run exactly as before.
+# Values are per process: with several gunicorn workers, each scrape sees
+# the worker that happened to answer it.
+
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+
+from slack_bolt.context.ack import Ack
+from slack_bolt.context.ack.async_ack import AsyncAck
+
+from outbound import SLACK_API_URL
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+
+# seconds; 3 is Slack's ack deadline
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in sorted(values):
+            yield f"{self.name}{_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values → [count per bucket (+Inf last)], sum
+        self._series: dict = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(k, list(counts), total) for k, (counts, total) in self._series.items()]
+        names = self.labels + ("le",)
+        for label_values, counts, total in sorted(series):
+            running = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                running += n
+                yield f"{self.name}_bucket{_labels(names, label_values + (bound,))} {running}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {running}"
+
+
+class Gauge:
+    """Value read from a callback at scrape time: a number or {label values: number}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.read = read
+
+    def samples(self):
+        value = self.read()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for label_values, v in sorted(value.items()):
+            yield f"{self.name}{_labels(self.labels, label_values)} {v}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+        # render() calls so far, for gauges that share one read per scrape
+        self.scrapes = 0
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        self.scrapes += 1
+        lines = []
+        for m in self.metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+LISTENER_ACK = registry.add(Histogram(
+    "cyberquest_listener_ack_seconds", "Time from request to ack() per listener.", ("listener",)))
+LISTENER_RESPOND = registry.add(Histogram(
+    "cyberquest_listener_respond_seconds", "Time from request to each respond() per listener.",
+    ("listener",)))
+LISTENER_DURATION = registry.add(Histogram(
+    "cyberquest_listener_duration_seconds", "Time from request to listener return.",
+    ("listener",)))
+LISTENER_ERRORS = registry.add(Counter(
+    "cyberquest_listener_errors_total", "Listener calls that raised.", ("listener",)))
+OUTBOUND_LATENCY = registry.add(Histogram(
+    "cyberquest_outbound_seconds", "Time from queueing to completion of outbound Slack calls.",
+    ("target",)))
+OUTBOUND_ERRORS = registry.add(Counter(
+    "cyberquest_outbound_errors_total", "Outbound Slack calls that failed after retries.",
+    ("target",)))
+
+
+# ── BOLT HOOKS ───────────────────────────────────────────────
+class TimedAck(Ack):
+    """Bolt's Ack, recording when it was called for the listener that called it."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.perf_counter()
+        self.listener = None
+
+    def __call__(self, *args, **kwargs):
+        if self.listener is not None and self.response is None:
+            LISTENER_ACK.observe(self.listener, value=time.perf_counter() - self.started)
+        return super().__call__(*args, **kwargs)
+
+
+class TimedAsyncAck(AsyncAck):
+    """TimedAck for AsyncApp."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.perf_counter()
+        self.listener = None
+
+    async def __call__(self, *args, **kwargs):
+        if self.listener is not None and self.response is None:
+            LISTENER_ACK.observe(self.listener, value=time.perf_counter() - self.started)
+        return await super().__call__(*args, **kwargs)
+
+
+def start_timer(context, next):
+    """App middleware; register it first so timing starts as early as possible."""
+    context["ack"] = TimedAck()
+    next()
+
+
+async def start_timer_async(context, next):
+    """start_timer for AsyncApp."""
+    context["ack"] = TimedAsyncAck()
+    await next()
+
+
+def _start(name: str, kwargs: dict) -> float:
+    """Tag the request's ack with the listener name; returns the request start time."""
+    ack = kwargs.get("ack")
+    if isinstance(ack, (TimedAck, TimedAsyncAck)):
+        ack.listener = name
+        return ack.started
+    return time.perf_counter()
+
+
+def listener(name: str):
+    """Decorator timing a Bolt listener (plain or coroutine) under `name`. A no-op when disabled."""
+
+    def decorate(func):
+        if not METRICS_ENABLED:
+            return func
+
+        # Bolt reads the argument names through __wrapped__, so the wrappers
+        # get the same keyword arguments as the listener
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_async(**kwargs):
+                started = _start(name, kwargs)
+                respond = kwargs.get("respond")
+                if respond is not None:
+                    async def timed_respond(*args, **kw):
+                        try:
+                            return await respond(*args, **kw)
+                        finally:
+                            LISTENER_RESPOND.observe(name, value=time.perf_counter() - started)
+                    kwargs["respond"] = timed_respond
+                try:
+                    return await func(**kwargs)
+                except Exception:
+                    LISTENER_ERRORS.inc(name)
+                    raise
+                finally:
+                    LISTENER_DURATION.observe(name, value=time.perf_counter() - started)
+
+            return timed_async
+
+        @functools.wraps(func)
+        def timed(**kwargs):
+            started = _start(name, kwargs)
+            respond = kwargs.get("respond")
+            if respond is not None:
+                def timed_respond(*args, **kw):
+                    try:
+                        return respond(*args, **kw)
+                    finally:
+                        LISTENER_RESPOND.observe(name, value=time.perf_counter() - started)
+                kwargs["respond"] = timed_respond
+            try:
+                return func(**kwargs)
+            except Exception:
+                LISTENER_ERRORS.inc(name)
+                raise
+            finally:
+                LISTENER_DURATION.observe(name, value=time.perf_counter() - started)
+
+        return timed
+
+    return decorate
+
+
+# ── OUTBOUND / STORES ────────────────────────────────────────
+def outbound_result(url: str, ok: bool, elapsed: float) -> None:
+    """Record one finished outbound call, labelled by API method or response_url."""
+    target = url[len(SLACK_API_URL):] if url.startswith(SLACK_API_URL) else "response_url"
+    OUTBOUND_LATENCY.observe(target, value=elapsed)
+    if not ok:
+        OUTBOUND_ERRORS.inc(target)
+
+
+def watch_dispatcher(dispatcher) -> None:
+    """Record every call the dispatcher completes, plus its queue depth."""
+    dispatcher.on_result = outbound_result
+    registry.add(Gauge(
+        "cyberquest_outbound_queue_depth", "Outbound calls waiting to be sent.",
+        lambda: dispatcher.stats()["queue_depth"]))
+
+
+def watch_stores(stores) -> None:
+    """Session counts and memory use per store namespace, read at scrape time.
+
+    Each store's stats() is called once per scrape and shared by the gauges.
+    """
+    last = {"scrape": None, "stats": {}}
+
+    def read(field):
+        def values():
+            if last["scrape"] != registry.scrapes:
+                last["stats"] = {(s.namespace,): s.stats() for s in stores}
+                last["scrape"] = registry.scrapes
+            return {labels: stats[field] for labels, stats in last["stats"].items()}
+        return values
+
+    registry.add(Gauge("cyberquest_sessions", "Live sessions per store.",
+                       read("sessions"), ("store",)))
+    registry.add(Gauge("cyberquest_session_store_bytes", "Approximate session store size.",
+                       read("memory_bytes"), ("store",)))
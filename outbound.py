@@ -0,0 +1,241 @@
+# outbound.py
+#
+# Background dispatcher for outbound Slack HTTP calls (response_url
+# replies and Web API methods). Handlers enqueue a payload and return
+# straight away; a bounded pool of threads sends it over kept-alive
+# connections, retrying rate limits, 5xx and dropped connections with
+# exponential backoff.
+#
+# A Web API call answers HTTP 200 even when it fails, so its JSON body is
+# checked too: {"ok": false} is a failure, and "ratelimited" is retried.
+# When the queue is full the payload is dropped and counted; handlers never
+# wait for Slack.
+
+import atexit
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", 8))
+OUTBOUND_QUEUE = int(os.getenv("OUTBOUND_QUEUE", 1000))
+OUTBOUND_RETRIES = int(os.getenv("OUTBOUND_RETRIES", 3))
+OUTBOUND_BACKOFF = float(os.getenv("OUTBOUND_BACKOFF", 0.5))
+OUTBOUND_TIMEOUT = float(os.getenv("OUTBOUND_TIMEOUT", 10))
+SLACK_API_URL = os.getenv("SLACK_API_URL", "https://slack.com/api/")
+
+logger = logging.getLogger(__name__)
+
+
+class OutboundError(Exception):
+    """A request that failed after every retry."""
+
+
+class Dispatcher:
+    """Bounded thread pool that POSTs JSON payloads in the background."""
+
+    def __init__(self, workers: int = OUTBOUND_WORKERS, max_queue: int = OUTBOUND_QUEUE,
+                 retries: int = OUTBOUND_RETRIES, backoff: float = OUTBOUND_BACKOFF,
+                 timeout: float = OUTBOUND_TIMEOUT):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._threads: list = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        # optional on_result(url, ok, seconds) hook, e.g. metrics.watch_dispatcher
+        self.on_result = None
+
+    # ── public API ──
+    def post(self, url: str, payload: dict, headers: dict = None) -> None:
+        """Queue a JSON POST. Dropped, and counted, if the queue is full."""
+        self._ensure_started()
+        job = (url, json.dumps(payload).encode(), headers or {}, time.monotonic())
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            # sending it here would hold the request thread for up to
+            # timeout x retries while Slack is already backed up
+            with self._stats_lock:
+                self.dropped += 1
+            logger.warning("outbound queue full, dropped POST to %s", urlsplit(url).netloc)
+            if self.on_result is not None:
+                self.on_result(url, False, 0.0)
+
+    def api(self, method: str, token: str, **payload) -> None:
+        """Queue a Web API call such as chat.update."""
+        self.post(SLACK_API_URL + method, payload, {"Authorization": f"Bearer {token}"})
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            done = self.sent + self.failed
+            return {
+                "queue_depth": self._queue.qsize(),
+                "sent": self.sent,
+                "failed": self.failed,
+                "retried": self.retried,
+                "dropped": self.dropped,
+                "latency_avg_ms": round(self.latency_total / done * 1000, 2) if done else 0.0,
+                "latency_max_ms": round(self.latency_max * 1000, 2),
+            }
+
+    def drain(self, timeout: float = 5.0) -> None:
+        """Wait up to timeout seconds for queued payloads to be sent."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    # ── workers ──
+    def _ensure_started(self) -> None:
+        # threads don't survive fork, so start them lazily in each worker
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"outbound-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for t in self._threads:
+                t.start()
+            self._pid = os.getpid()
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job) -> None:
+        url, body, headers, queued_at = job
+        try:
+            self._send(url, body, headers)
+            ok = True
+        except Exception:
+            logger.exception("outbound POST to %s failed", urlsplit(url).netloc)
+            ok = False
+        elapsed = time.monotonic() - queued_at
+        with self._stats_lock:
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+        if self.on_result is not None:
+            self.on_result(url, ok, elapsed)
+
+    def _send(self, url: str, body: bytes, headers: dict) -> None:
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        headers = {"Content-Type": "application/json; charset=utf-8", **headers}
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            try:
+                conn = self._connection(parts.scheme, parts.netloc)
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                if resp.getheader("Connection", "").lower() == "close":
+                    self._drop(parts.scheme, parts.netloc)
+                if resp.status == 429 or resp.status >= 500:
+                    error = OutboundError(f"HTTP {resp.status}")
+                elif resp.status >= 400:
+                    raise OutboundError(f"HTTP {resp.status}")
+                else:
+                    api_error = _api_error(resp.getheader("Content-Type"), data)
+                    if api_error is None:
+                        return
+                    if api_error != "ratelimited":
+                        raise OutboundError(f"Slack API error: {api_error}")
+                    error = OutboundError(api_error)
+                retry_after = resp.getheader("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    delay = float(retry_after)
+            except (http.client.HTTPException, OSError) as e:
+                # stale keep-alive connection or network error; reconnect
+                self._drop(parts.scheme, parts.netloc)
+                error = e
+            if attempt < self.retries:
+                with self._stats_lock:
+                    self.retried += 1
+                time.sleep(delay)
+        raise OutboundError(f"giving up after {self.retries + 1} attempts") from error
+
+    def _connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        """Keep-alive connection per worker thread per host."""
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = conns[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+        return conn
+
+    def _drop(self, scheme: str, netloc: str) -> None:
+        conn = getattr(self._local, "conns", {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+
+def _api_error(content_type: str, data: bytes):
+    """The "error" of a Web API reply with "ok": false, else None."""
+    if not (content_type or "").startswith("application/json"):
+        return None  # response_url replies answer with plain "ok"
+    try:
+        reply = json.loads(data)
+    except ValueError:
+        return None
+    if isinstance(reply, dict) and reply.get("ok") is False:
+        return reply.get("error") or "unknown_error"
+    return None
+
+
+def response_message(text: str = "", blocks=None, attachments=None, response_type=None,
+                     replace_original=None, delete_original=None, unfurl_links=None,
+                     unfurl_media=None, thread_ts=None, metadata=None) -> dict:
+    """The response_url body for respond()'s arguments."""
+    message = {"text": text}
+    for key, value in (
+        ("blocks", blocks), ("attachments", attachments),
+        ("response_type", response_type), ("replace_original", replace_original),
+        ("delete_original", delete_original), ("unfurl_links", unfurl_links),
+        ("unfurl_media", unfurl_media), ("thread_ts", thread_ts), ("metadata", metadata),
+    ):
+        if value is not None:
+            message[key] = value
+    return message
+
+
+class QueuedRespond:
+    """Drop-in for Bolt's respond() that queues the reply on a Dispatcher."""
+
+    def __init__(self, response_url: str, dispatcher: Dispatcher):
+        self.response_url = response_url
+        self.dispatcher = dispatcher
+
+    def __call__(self, text: str = "", **kwargs):
+        self.dispatcher.post(self.response_url, response_message(text, **kwargs))
+
+
+dispatcher = Dispatcher()
+atexit.register(dispatcher.drain)
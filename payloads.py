@@ -0,0 +1,117 @@
+# payloads.py
+#
+# Compact, HMAC-signed button values.
+#
+# A button value carries all the game state needed to handle the click,
+# so any worker on any node can continue a game without a shared store.
+# Layout before base64url encoding (little-endian):
+#
+#   kind u8 | issued u32 (unix seconds) | kind-specific fields | [u16 tail] | mac
+#
+# The MAC is a truncated HMAC-SHA256 over the clicking user's id and the
+# bytes before it, so a value can't be edited or replayed by another user.
+
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import time
+
+# defaults to the Slack signing secret, which every node already shares
+PAYLOAD_SECRET = os.getenv("PAYLOAD_SECRET") or os.getenv("SLACK_SIGNING_SECRET", "")
+PAYLOAD_MAX_AGE = int(os.getenv("PAYLOAD_MAX_AGE", 7 * 24 * 3600))
+MAC_BYTES = 10
+
+# kinds and their fixed fields
+QUIZ_ANSWER = 1     # version, seed, step, correct, wrong, q_idx, option index
+QUIZ_NEXT = 2       # version, seed, step, correct, wrong
+ADVENTURE = 3       # version, scene, score, choice index; tail = tag bitset
+
+_HEADER = struct.Struct("<BI")
+# header and fixed fields packed in one call
+# (correct and wrong are u16, like QuizSession's, so any WIN_AT / LOSE_AT a
+# session can hold fits in a button too)
+_FIELDS = {
+    QUIZ_ANSWER: struct.Struct("<BIIIIHHIB"),
+    QUIZ_NEXT: struct.Struct("<BIIIIHH"),
+    ADVENTURE: struct.Struct("<BIIHhB"),
+}
+
+
+def bits_to_tail(bits: int) -> tuple:
+    """A bitset as u16 tail words, lowest first (empty for 0)."""
+    n = (bits.bit_length() + 15) // 16
+    return struct.unpack(f"<{n}H", bits.to_bytes(2 * n, "little"))
+
+
+def tail_to_bits(tail: tuple) -> int:
+    return int.from_bytes(struct.pack(f"<{len(tail)}H", *tail), "little")
+
+
+class InvalidPayload(ValueError):
+    """A button value that is malformed, forged, or too old."""
+
+
+class Signer:
+    """Packs and signs button values with one secret."""
+
+    def __init__(self, secret: bytes, max_age: int = PAYLOAD_MAX_AGE):
+        # derived key, so the raw secret is never used for two purposes
+        key = hmac.digest(secret, b"cyberquest button payloads", "sha256").ljust(64, b"\0")
+        # HMAC-SHA256 with the keyed inner/outer hash states computed once;
+        # copying them is about half the cost of hmac.digest() per call
+        self._inner = hashlib.sha256(bytes(b ^ 0x36 for b in key))
+        self._outer = hashlib.sha256(bytes(b ^ 0x5C for b in key))
+        self.max_age = max_age
+
+    def _mac(self, user_id: str, body: bytes) -> bytes:
+        inner = self._inner.copy()
+        inner.update(user_id.encode() + b"\0" + body)
+        outer = self._outer.copy()
+        outer.update(inner.digest())
+        return outer.digest()[:MAC_BYTES]
+
+    def sign(self, user_id: str, kind: int, fields: tuple, tail: tuple = ()) -> str:
+        body = _FIELDS[kind].pack(kind, int(time.time()), *fields)
+        if tail:
+            body += struct.pack(f"<{len(tail)}H", *tail)
+        return base64.urlsafe_b64encode(body + self._mac(user_id, body)).rstrip(b"=").decode()
+
+    def _open(self, user_id: str, value: str) -> bytes:
+        """The signed bytes of value, or raise InvalidPayload."""
+        try:
+            raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        except (ValueError, TypeError):
+            raise InvalidPayload("not base64") from None
+        body, mac = raw[:-MAC_BYTES], raw[-MAC_BYTES:]
+        if len(body) < _HEADER.size or not hmac.compare_digest(mac, self._mac(user_id, body)):
+            raise InvalidPayload("bad signature")
+        return body
+
+    def signed(self, user_id: str, value: str) -> bool:
+        """Whether value was signed for user_id, of any kind and age."""
+        try:
+            self._open(user_id, value)
+        except InvalidPayload:
+            return False
+        return True
+
+    def verify(self, user_id: str, value: str, kind: int):
+        """Return (fields, tail, issued) or raise InvalidPayload."""
+        body = self._open(user_id, value)
+        got_kind, issued = _HEADER.unpack_from(body)
+        if got_kind != kind:
+            raise InvalidPayload(f"expected payload kind {kind}, got {got_kind}")
+        if time.time() - issued > self.max_age:
+            raise InvalidPayload("expired")
+        fixed = _FIELDS[kind]
+        tail_raw = body[fixed.size:]
+        if len(body) < fixed.size or len(tail_raw) % 2:
+            raise InvalidPayload("truncated")
+        fields = fixed.unpack_from(body)[2:]
+        tail = struct.unpack(f"<{len(tail_raw) // 2}H", tail_raw)
+        return fields, tail, issued
+
+
+signer = Signer(PAYLOAD_SECRET.encode())
@@ -0,0 +1,42 @@
+# prefork.py
+#
+# Per-process startup for servers that fork their workers from a master
+# that has already imported the app (gunicorn.conf.py preloads by default).
+#
+# Threads, flocks and signal handlers don't carry over into a forked
+# worker, and gunicorn resets a worker's signal handlers before it serves.
+# Whatever a process has to set up for itself is passed to per_worker(): it
+# runs straight away when nothing forks (the Flask dev server, uvicorn, the
+# benchmarks), or in each worker once it has been forked and is about to
+# serve when gunicorn.conf.py has called defer_to_workers().
+
+import os
+
+# functions waiting for start_worker(); None while nothing forks
+_deferred = None
+_started_pid = None
+
+
+def defer_to_workers() -> None:
+    """From now on, per_worker() functions wait for start_worker()."""
+    global _deferred
+    if _deferred is None:
+        _deferred = []
+
+
+def per_worker(fn) -> None:
+    """Run fn in every process that serves requests, once."""
+    if _deferred is None:
+        fn()
+    else:
+        _deferred.append(fn)
+
+
+def start_worker() -> None:
+    """Run the deferred functions in this process (gunicorn's post_worker_init)."""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    _started_pid = os.getpid()
+    for fn in _deferred or ():
+        fn()
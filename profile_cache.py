@@ -0,0 +1,141 @@
+# profile_cache.py
+#
+# TTL-bounded LRU of Slack display names.
+#
+# Concurrent misses for the same user share one in-flight users.info call,
+# entries past PROFILE_REFRESH_AFTER of their TTL are served while a
+# background refresh runs, and user_change events overwrite entries
+# directly, so a lookup only blocks the first time a user is seen. The same
+# holds for aget() with an async fetch, as the ASGI app uses.
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+PROFILE_TTL = int(os.getenv("PROFILE_TTL", 3600))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 10_000))
+PROFILE_REFRESH_AFTER = float(os.getenv("PROFILE_REFRESH_AFTER", 0.8))
+DEFAULT_NAME = "Player"
+
+logger = logging.getLogger(__name__)
+
+
+def display_name(profile: dict) -> str:
+    """The name to greet a user with, from a users.info / user_change profile."""
+    return profile.get("display_name") or profile.get("real_name") or DEFAULT_NAME
+
+
+class DisplayNameCache:
+    """Display names by user id; fetch(user_id) -> name fills misses.
+
+    get() is for a plain fetch; with a coroutine function as fetch, call
+    aget() from the event loop instead.
+    """
+
+    def __init__(self, fetch, ttl: int = PROFILE_TTL, max_size: int = PROFILE_CACHE_SIZE,
+                 refresh_after: float = PROFILE_REFRESH_AFTER):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_size = max_size
+        self.refresh_after = refresh_after
+        self.hits = 0
+        self.misses = 0
+        # user_id → (fetched_at, name), least recently used first
+        self._names: OrderedDict = OrderedDict()
+        # user_id → future of the fetch in flight; None on failure
+        self._inflight: dict = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="profile-refresh")
+        self._tasks: set = set()
+
+    def get(self, user_id: str) -> str:
+        name, future, load = self._lookup(user_id, Future)
+        if name is not None:
+            if load:
+                self._refresher.submit(self._load, user_id, future)
+            return name
+        if load:
+            self._load(user_id, future)
+        return future.result() or DEFAULT_NAME
+
+    async def aget(self, user_id: str) -> str:
+        """get() for an async fetch; the fetch runs as its own task, so a
+        cancelled caller doesn't cancel it for everyone else waiting."""
+        name, future, load = self._lookup(user_id, asyncio.get_running_loop().create_future)
+        if load:
+            task = asyncio.ensure_future(self._aload(user_id, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if name is not None:
+            return name
+        return await asyncio.shield(future) or DEFAULT_NAME
+
+    def _lookup(self, user_id: str, new_future):
+        """(name, future, load): the name on a hit, and the future to wait
+        on otherwise; load is True when the caller should start the fetch
+        (a miss nobody is fetching yet, or a hit due for a refresh)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._names.get(user_id)
+            future = self._inflight.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._names.move_to_end(user_id)
+                self.hits += 1
+                if now - entry[0] > self.ttl * self.refresh_after and future is None:
+                    future = self._inflight[user_id] = new_future()
+                    return entry[1], future, True
+                return entry[1], None, False
+            self.misses += 1
+            if future is not None:
+                return None, future, False
+            future = self._inflight[user_id] = new_future()
+            return None, future, True
+
+    def peek(self, user_id: str):
+        """The cached name if still fresh, else None; never fetches."""
+        with self._lock:
+            entry = self._names.get(user_id)
+            if entry is None or time.monotonic() - entry[0] >= self.ttl:
+                return None
+            self._names.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id: str, name: str) -> None:
+        with self._lock:
+            self._names[user_id] = (time.monotonic(), name)
+            self._names.move_to_end(user_id)
+            while len(self._names) > self.max_size:
+                self._names.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._names.pop(user_id, None)
+
+    def _load(self, user_id: str, future: Future) -> None:
+        """Fetch one name and hand it to everyone waiting on it."""
+        try:
+            name = self.fetch(user_id)
+        except Exception as e:
+            name = None
+            logger.warning("profile lookup for %s failed: %s", user_id, e)
+        self._settle(user_id, future, name)
+
+    async def _aload(self, user_id: str, future: asyncio.Future) -> None:
+        try:
+            name = await self.fetch(user_id)
+        except Exception as e:
+            name = None
+            logger.warning("profile lookup for %s failed: %s", user_id, e)
+        self._settle(user_id, future, name)
+
+    def _settle(self, user_id: str, future, name) -> None:
+        if name is not None:
+            self.put(user_id, name)
+        with self._lock:
+            del self._inflight[user_id]
+        future.set_result(name)
@@ -0,0 +1,529 @@
+# profiler.py
+#
+# A sampling profiler for live Slack requests, off by default and switched
+# on at runtime without a restart:
+#
+#   POST /debug/profile?action=start[&rate=0.2][&seconds=60][&trace=1]
+#   POST /debug/profile?action=stop | reset
+#   GET  /debug/profile[?listener=handle_answer]     folded stacks
+#
+# with `Authorization: Bearer $PROFILE_TOKEN` (the route answers 404 while
+# PROFILE_TOKEN is unset; /stats is guarded the same way), or
+# `kill -USR2 <pid>` to toggle it in one process; a stop writes the stacks
+# to PROFILE_OUTPUT.
+#
+# While on, PROFILE_RATE of the requests to /slack/commands and
+# /slack/interactive are sampled: a background thread reads the stacks of
+# the threads serving them every PROFILE_INTERVAL seconds (the request
+# thread, running Bolt's middleware, and the listener thread it hands off
+# to). Each stack is filed under the outermost frame from this app, which
+# for a listener thread is the listener, and counted. The output is the
+# folded format flamegraph.pl and speedscope read:
+#
+#   handle_answer;cyberquestquiz:answer;quiz_blocks:TemplatePack.render 37
+#
+# Cost is bounded: nothing runs unless it is on, it turns itself off after
+# PROFILE_SECONDS, each sample walks at most PROFILE_DEPTH frames of the
+# sampled threads only, and at most PROFILE_MAX_STACKS distinct stacks are
+# kept per listener (the rest count as [other]). Under asyncio the event
+# loop thread is sampled only while a sampled request's task, or a task it
+# started (Bolt runs each listener in one), is the one running.
+#
+# With trace=1 every interaction (sampled or not) is also appended to a
+# JSONL trace, up to PROFILE_TRACE_MAX records, sanitized: ids are replaced
+# with pseudonyms, response URLs, tokens and free text are dropped, and
+# signed button values are stored as the game state they carry, which
+# benchmarks/replay_trace.py re-signs to replay the trace offline.
+
+import asyncio
+import base64
+import contextvars
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import signal
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from content import registry
+from payloads import _FIELDS, InvalidPayload, signer
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_RATE = float(os.getenv("PROFILE_RATE", 0.1))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", 300))
+PROFILE_DEPTH = int(os.getenv("PROFILE_DEPTH", 64))
+PROFILE_MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", 2000))
+PROFILE_OUTPUT = os.getenv("PROFILE_OUTPUT", "/tmp/cyberquest-profile.{pid}.folded")
+PROFILE_TRACE = os.getenv("PROFILE_TRACE", "/tmp/cyberquest-trace.{pid}.jsonl")
+PROFILE_TRACE_MAX = int(os.getenv("PROFILE_TRACE_MAX", 100_000))
+# whether SIGUSR2 also starts a trace
+PROFILE_SIGNAL_TRACE = os.getenv("PROFILE_SIGNAL_TRACE", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# wrappers whose frames never name a listener
+_SKIP_FILES = {os.path.join(APP_DIR, name) for name in ("metrics.py", "profiler.py")}
+# listeners are capped along with stacks; more than this is a bug
+_MAX_LABELS = 64
+OTHER = "[other]"
+# subcommands kept in a traced /cyberquest; anything else typed is dropped
+_COMMAND_WORDS = re.compile(r"^(stats|leaderboard|tournament|\d{1,3})$")
+# set while serving a sampled request; copied into the tasks and executor
+# jobs it starts
+_SAMPLED = contextvars.ContextVar("profile_sampled", default=False)
+
+
+def _frame_name(code) -> str:
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class Profiler:
+    """Sampled stacks per listener, plus the optional interaction trace."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, depth: int = PROFILE_DEPTH,
+                 max_stacks: int = PROFILE_MAX_STACKS):
+        self.interval = interval
+        self.depth = depth
+        self.max_stacks = max_stacks
+        self.enabled = False
+        self.rate = 0.0
+        self.deadline = 0.0
+        # thread ident → sampled requests it is serving
+        self._threads: dict = {}
+        # label → {(code, ...) root first: samples}
+        self._stacks: dict = {}
+        # code → whether its frames name a listener
+        self._app_code: dict = {}
+        # asyncio: the loop, and the tasks serving sampled requests
+        self._loop = None
+        self._loop_ident = None
+        self._tasks = weakref.WeakSet()
+        # kept apart from the global random, which the games use; reseeded
+        # in forked workers, so they don't all sample the same requests
+        self._rng = random.Random()
+        os.register_at_fork(after_in_child=self._rng.seed)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self.requests = 0
+        self.sampled = 0
+        self.samples = 0
+        self.dropped = 0
+        self.sampler_seconds = 0.0
+        self._trace = None
+
+    # ── control ──
+    def start(self, rate: float = PROFILE_RATE, seconds: float = PROFILE_SECONDS,
+              trace: bool = False) -> None:
+        self._ensure_started()
+        with self._lock:
+            self.rate = min(max(rate, 0.0), 1.0)
+            self.deadline = time.monotonic() + seconds
+            if trace and self._trace is None:
+                self._trace = Trace(PROFILE_TRACE.format(pid=os.getpid()))
+            self.enabled = True
+        self._wake.set()
+        logger.info("profiling %.0f%% of requests for %.0f s%s", self.rate * 100, seconds,
+                    f", tracing to {self._trace.path}" if self._trace else "")
+
+    def stop(self) -> str:
+        """Turn off; writes the stacks to PROFILE_OUTPUT and returns its path."""
+        with self._lock:
+            self.enabled = False
+            self._wake.clear()
+            trace, self._trace = self._trace, None
+        if trace is not None:
+            trace.close()
+        path = PROFILE_OUTPUT.format(pid=os.getpid())
+        if self._stacks:
+            with open(path, "w") as f:
+                f.write(self.folded())
+            logger.info("profile written to %s", path)
+        return path
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stacks = {}
+            self.requests = self.sampled = self.samples = self.dropped = 0
+            self.sampler_seconds = 0.0
+
+    def toggle(self) -> None:
+        if self.enabled:
+            self.stop()
+        else:
+            self.start(trace=PROFILE_SIGNAL_TRACE)
+
+    def install_signal(self, signum: int = signal.SIGUSR2) -> None:
+        """Toggle on `signum`; call from the main thread."""
+        if threading.current_thread() is not threading.main_thread():
+            return
+        # the handler runs between bytecodes of whatever the main thread is
+        # doing, so the work (and its locks) happens on a thread of its own
+        signal.signal(signum, lambda *_: threading.Thread(target=self.toggle, daemon=True).start())
+
+    def _ensure_started(self) -> None:
+        # threads don't survive fork, so start lazily in each worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._run, name="profiler", daemon=True).start()
+                self._pid = os.getpid()
+
+    # ── request path ──
+    def request(self):
+        """Context manager around one Slack request; samples PROFILE_RATE of them."""
+        if not self.enabled:
+            return _NOT_SAMPLED
+        self.requests += 1
+        if self._rng.random() >= self.rate:
+            return _NOT_SAMPLED
+        self.sampled += 1
+        return _Sampled(self)
+
+    def _track(self, ident: int, step: int) -> None:
+        with self._lock:
+            n = self._threads.get(ident, 0) + step
+            if n > 0:
+                self._threads[ident] = n
+            else:
+                self._threads.pop(ident, None)
+
+    def executor(self, max_workers: int = 5) -> ThreadPoolExecutor:
+        """Bolt's listener_executor; listeners of sampled requests are sampled too."""
+        return _ProfiledExecutor(self, max_workers=max_workers)
+
+    def watch_loop(self, loop) -> None:
+        """asyncio: count the tasks a sampled request starts as sampled too."""
+        self._loop = loop
+        self._loop_ident = threading.get_ident()
+        previous = loop.get_task_factory()
+
+        def factory(loop, coro, **kwargs):
+            if previous is not None:
+                task = previous(loop, coro, **kwargs)
+            else:
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+            if _SAMPLED.get():
+                self._tasks.add(task)
+                self._track(self._loop_ident, 1)
+                task.add_done_callback(lambda _: self._track(self._loop_ident, -1))
+            return task
+
+        loop.set_task_factory(factory)
+
+    def record(self, body: dict) -> None:
+        trace = self._trace
+        if trace is not None:
+            trace.record(body)
+
+    # ── sampling ──
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            try:
+                self._tick()
+            except Exception:
+                # started once per process, so this thread must outlive errors
+                logger.exception("profiler tick failed")
+
+    def _tick(self) -> None:
+        if not self.enabled:
+            return
+        if time.monotonic() > self.deadline:
+            self.stop()
+            return
+        with self._lock:
+            trace = self._trace
+        if trace is not None:
+            # stop() may close it meanwhile; a closed trace ignores the flush
+            trace.flush()
+        if not self._threads:
+            return
+        started = time.perf_counter()
+        self._sample()
+        self.sampler_seconds += time.perf_counter() - started
+
+    def _sample(self) -> None:
+        frames = sys._current_frames()
+        idents = list(self._threads)
+        for ident in idents:
+            if ident == self._loop_ident:
+                # the loop runs sampled and unsampled tasks by turns
+                task = asyncio.current_task(self._loop)
+                if task is None or task not in self._tasks:
+                    continue
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            codes = []
+            while frame is not None and len(codes) < self.depth:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            truncated = frame is not None
+            codes.reverse()
+            label = self._label(codes)
+            key = ((OTHER,) if truncated else ()) + tuple(codes)
+            with self._lock:
+                stacks = self._stacks.get(label)
+                if stacks is None:
+                    if len(self._stacks) >= _MAX_LABELS:
+                        label = OTHER
+                    stacks = self._stacks.setdefault(label, {})
+                if key not in stacks and len(stacks) >= self.max_stacks:
+                    key = (OTHER,)
+                    self.dropped += 1
+                stacks[key] = stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def _label(self, codes: list) -> str:
+        """The outermost frame from this app: the listener, or the Flask route."""
+        for code in codes:
+            is_app = self._app_code.get(code)
+            if is_app is None:
+                path = os.path.abspath(code.co_filename)
+                is_app = self._app_code[code] = (
+                    os.path.dirname(path) == APP_DIR and path not in _SKIP_FILES)
+            if is_app:
+                return code.co_name
+        return "[bolt]"
+
+    # ── output ──
+    def folded(self, label: str = None) -> str:
+        """Stacks in the folded format, `label;frame;...;frame count` per line."""
+        with self._lock:
+            stacks = {k: dict(v) for k, v in self._stacks.items() if label in (None, k)}
+        lines = []
+        for name, counts in sorted(stacks.items()):
+            for key, n in sorted(counts.items(), key=lambda kv: -kv[1]):
+                frames = [k if isinstance(k, str) else _frame_name(k) for k in key]
+                lines.append(f"{';'.join([name] + frames)} {n}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def stats(self) -> dict:
+        trace = self._trace
+        return {
+            "enabled": self.enabled,
+            "rate": self.rate,
+            "seconds_left": round(max(self.deadline - time.monotonic(), 0), 1) if self.enabled else 0,
+            "requests": self.requests,
+            "sampled": self.sampled,
+            "samples": self.samples,
+            "stacks": sum(len(s) for s in self._stacks.values()),
+            "dropped": self.dropped,
+            "sampler_ms": round(self.sampler_seconds * 1000, 1),
+            "trace": trace.stats() if trace else None,
+        }
+
+    # ── HTTP control ──
+    @staticmethod
+    def authorized(authorization: str) -> bool:
+        """Whether an Authorization header carries PROFILE_TOKEN; never while it is unset."""
+        expected = f"Bearer {PROFILE_TOKEN}"
+        return bool(PROFILE_TOKEN) and hmac.compare_digest(
+            (authorization or "").encode(), expected.encode())
+
+    def control(self, method: str, params: dict, authorization: str) -> tuple:
+        """(status, content type, body) for /debug/profile."""
+        if not self.authorized(authorization):
+            return 404, "text/plain; charset=utf-8", "Not Found"
+        if method == "GET":
+            return 200, "text/plain; charset=utf-8", self.folded(params.get("listener"))
+        action = params.get("action")
+        try:
+            if action == "start":
+                self.start(float(params.get("rate", PROFILE_RATE)),
+                           float(params.get("seconds", PROFILE_SECONDS)),
+                           params.get("trace") == "1")
+            elif action == "stop":
+                self.stop()
+            elif action == "reset":
+                self.reset()
+            else:
+                return 400, "text/plain; charset=utf-8", "action must be start, stop or reset"
+        except ValueError:
+            return 400, "text/plain; charset=utf-8", "rate and seconds must be numbers"
+        return 200, "application/json", json.dumps(self.stats())
+
+
+class _Sampled:
+    """Marks the current thread (or asyncio task) as serving a sampled request."""
+
+    __slots__ = ("profiler", "ident", "token", "task")
+
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+
+    def __enter__(self):
+        self.ident = threading.get_ident()
+        self.token = _SAMPLED.set(True)
+        try:
+            self.task = asyncio.current_task()
+        except RuntimeError:
+            self.task = None
+        if self.task is not None:
+            self.profiler._tasks.add(self.task)
+        self.profiler._track(self.ident, 1)
+        return self
+
+    def __exit__(self, *exc):
+        _SAMPLED.reset(self.token)
+        if self.task is not None:
+            self.profiler._tasks.discard(self.task)
+        self.profiler._track(self.ident, -1)
+
+
+class _NotSampled:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NOT_SAMPLED = _NotSampled()
+
+
+class _ProfiledExecutor(ThreadPoolExecutor):
+    """Runs a sampled request's listener as sampled too.
+
+    Bolt submits the listener from the request thread, so whether that
+    request was sampled is known at submit().
+    """
+
+    def __init__(self, profiler: Profiler, **kwargs):
+        super().__init__(**kwargs)
+        self.profiler = profiler
+
+    def submit(self, fn, *args, **kwargs):
+        if _SAMPLED.get():
+            inner = fn
+
+            def fn(*a, **kw):
+                with _Sampled(self.profiler):
+                    return inner(*a, **kw)
+        return super().submit(fn, *args, **kwargs)
+
+
+# ── TRACE ────────────────────────────────────────────────────
+class Trace:
+    """Sanitized interactions, appended to a JSONL file by the profiler thread."""
+
+    def __init__(self, path: str, max_records: int = PROFILE_TRACE_MAX):
+        self.path = path
+        self.max_records = max_records
+        self.records = 0
+        self.dropped = 0
+        self._pending: list = []
+        self._lock = threading.Lock()
+        # the profiler thread flushes while stop() may be closing
+        self._io_lock = threading.Lock()
+        # pseudonyms are keyed per trace, so traces can't be joined on them
+        self._salt = os.urandom(16)
+        self._started = time.monotonic()
+        self._file = open(path, "a")
+        self._file.write(json.dumps({
+            "trace": 1, "started": time.time(),
+            "content": {name: source.version for name, source in registry.sources.items()},
+        }) + "\n")
+
+    def _alias(self, value: str) -> str:
+        if not value:
+            return value
+        digest = hashlib.blake2b(value.encode(), key=self._salt, digest_size=5).hexdigest()
+        return value[0] + digest.upper()
+
+    def record(self, body: dict) -> None:
+        with self._lock:
+            if self.records >= self.max_records:
+                self.dropped += 1
+                return
+            self.records += 1
+        entry = self.sanitize(body)
+        if entry is not None:
+            entry["t"] = round(time.monotonic() - self._started, 4)
+            with self._lock:
+                self._pending.append(entry)
+
+    def sanitize(self, body: dict):
+        """The parts of a command or button click the game reads, with ids aliased."""
+        if body.get("command"):
+            words = (body.get("text") or "").lower().split()
+            return {"command": body["command"],
+                    "text": " ".join(w for w in words if _COMMAND_WORDS.match(w)),
+                    "user": self._alias(body.get("user_id", "")),
+                    "team": self._alias(body.get("team_id", "")),
+                    "channel": self._alias(body.get("channel_id", ""))}
+        if body.get("type") != "block_actions" or not body.get("actions"):
+            return None
+        user = (body.get("user") or {}).get("id", "")
+        action = body["actions"][0]
+        return {"action": action.get("action_id"),
+                "value": self._value(user, action.get("value", "")),
+                "user": self._alias(user),
+                "team": self._alias((body.get("team") or {}).get("id", "")),
+                "channel": self._alias((body.get("channel") or {}).get("id", "")),
+                "message": (body.get("container") or {}).get("message_ts", "")}
+
+    @staticmethod
+    def _value(user: str, value: str) -> dict:
+        """A signed value as its fields (the MAC binds it to the real user id)."""
+        try:
+            raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+            kind = raw[0]
+            if kind in _FIELDS:
+                fields, tail, _ = signer.verify(user, value, kind)
+                return {"kind": kind, "fields": list(fields), "tail": list(tail)}
+        except (ValueError, IndexError, InvalidPayload):
+            pass
+        # unsigned values are short plain strings, e.g. "tid:round:option"
+        if len(value) <= 32 and re.fullmatch(r"[\w:.-]*", value):
+            return {"plain": value}
+        return {"invalid": True}
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        with self._io_lock:
+            if pending and not self._file.closed:
+                self._file.write("".join(json.dumps(e, separators=(",", ":")) + "\n"
+                                         for e in pending))
+                self._file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        with self._io_lock:
+            self._file.close()
+
+    def stats(self) -> dict:
+        return {"path": self.path, "records": self.records, "dropped": self.dropped}
+
+
+profiler = Profiler()
+
+
+def trace_middleware(body, next):
+    """App middleware handing each interaction to the trace while one is on."""
+    if profiler._trace is not None:
+        profiler.record(body)
+    next()
+
+
+async def trace_middleware_async(body, next):
+    """trace_middleware for AsyncApp."""
+    if profiler._trace is not None:
+        profiler.record(body)
+    await next()
@@ -0,0 +1,263 @@
+# question_bank.py
+#
+# Question banks for quiz mode.
+#
+# Small banks are plain JSON lists (questions.json). Large content packs are
+# built into a compact binary .pack file with an offset index; the file is
+# memory-mapped and each question is decoded only when it is first needed.
+#
+# Pack layout (all integers little-endian):
+#
+#   header   b"CQPK" | version u16 | reserved u16 | count u32 | topics_len u32
+#   offsets  (count + 1) × u64, record start relative to the data section
+#   topic_ids count × u16, index into the topic table (0xFFFF = no topic)
+#   topics   topics_len bytes, JSON list of topic names
+#   data     concatenated UTF-8 JSON records, one per question
+#
+# Build one with:
+#   python question_bank.py build questions.json questions.pack
+#
+# Questions are validated when a pack is built; opening one only checks its
+# header and offsets, so loading a large pack never decodes its records.
+
+import functools
+import json
+import mmap
+import random
+import struct
+import sys
+from array import array
+
+MAGIC = b"CQPK"
+PACK_VERSION = 1
+_HEADER = struct.Struct("<4sHHII")
+_OFFSETS = struct.Struct("<QQ")
+NO_TOPIC = 0xFFFF
+
+
+# ── SHUFFLED ORDER ───────────────────────────────────────────
+def _mix(x: int) -> int:
+    """32-bit integer hash (splitmix-style finaliser)."""
+    x = (x ^ (x >> 16)) * 0x45D9F3B & 0xFFFFFFFF
+    x = (x ^ (x >> 16)) * 0x45D9F3B & 0xFFFFFFFF
+    return x ^ (x >> 16)
+
+
+class ShuffledOrder:
+    """A random permutation of range(n) computed on the fly from a seed.
+
+    order[i] is O(1) and nothing of size n is ever allocated, so a game only
+    has to remember its seed and step instead of a shuffled copy of the bank.
+    Uses a 4-round Feistel network with cycle walking.
+    """
+
+    __slots__ = ("n", "seed", "_half", "_mask", "_keys")
+
+    def __init__(self, n: int, seed: int):
+        bits = max(2, (n - 1).bit_length())
+        bits += bits & 1
+        self.n = n
+        self.seed = seed
+        self._half = bits // 2
+        self._mask = (1 << self._half) - 1
+        self._keys = [_mix(seed * 4 + r + 1) for r in range(4)]
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, i: int) -> int:
+        if not 0 <= i < self.n:
+            raise IndexError("order index out of range")
+        half, mask = self._half, self._mask
+        x = i
+        while True:
+            left, right = x >> half, x & mask
+            for key in self._keys:
+                left, right = right, left ^ (_mix(right ^ key) & mask)
+            x = (left << half) | right
+            if x < self.n:
+                return x
+
+
+# ── BANKS ────────────────────────────────────────────────────
+class QuestionBank:
+    """Common API for every bank: len(), bank[i] and sampling."""
+
+    topics: list = []
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __getitem__(self, q_idx: int) -> dict:
+        raise NotImplementedError
+
+    def topic_indices(self, topic: str):
+        """Indices of every question in a topic, computed once per topic."""
+        cache = self.__dict__.setdefault("_topic_cache", {})
+        idx = cache.get(topic)
+        if idx is None:
+            if topic not in self.topics:
+                raise KeyError(topic)
+            topic_id = self.topics.index(topic)
+            idx = cache[topic] = array(
+                "I", (i for i, t in enumerate(self._topic_ids()) if t == topic_id))
+        return idx
+
+    def _topic_ids(self):
+        raise NotImplementedError
+
+    def order(self, seed: int) -> ShuffledOrder:
+        """A lazily computed shuffle of the whole bank."""
+        return ShuffledOrder(len(self), seed)
+
+    def sample(self, k: int, rng=random, topic: str = None) -> list:
+        """k distinct question indices, optionally from a single topic."""
+        population = range(len(self)) if topic is None else self.topic_indices(topic)
+        return rng.sample(population, k)
+
+
+class JsonBank(QuestionBank):
+    """A bank held fully in memory, e.g. questions.json."""
+
+    def __init__(self, questions: list):
+        self._questions = questions
+        self.topics = sorted({q["topic"] for q in questions if "topic" in q})
+
+    @classmethod
+    def from_file(cls, path: str) -> "JsonBank":
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def __len__(self) -> int:
+        return len(self._questions)
+
+    def __getitem__(self, q_idx: int) -> dict:
+        return self._questions[q_idx]
+
+    def _topic_ids(self):
+        ids = {t: i for i, t in enumerate(self.topics)}
+        return (ids.get(q.get("topic"), NO_TOPIC) for q in self._questions)
+
+
+class PackedBank(QuestionBank):
+    """A memory-mapped .pack file, decoded one question at a time."""
+
+    def __init__(self, path: str, cache_size: int = 1024):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, topics_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != PACK_VERSION:
+            raise ValueError(f"{path} is not a version {PACK_VERSION} question pack")
+        self._count = count
+        self._offsets_at = _HEADER.size
+        self._topic_ids_at = self._offsets_at + (count + 1) * 8
+        topics_at = self._topic_ids_at + count * 2
+        self.topics = json.loads(self._mm[topics_at:topics_at + topics_len])
+        self._data_at = topics_at + topics_len
+        self._check_layout()
+        self._decode = functools.lru_cache(maxsize=cache_size)(self._decode_uncached)
+
+    def _check_layout(self) -> None:
+        """Raise ValueError if the offsets or topic ids don't fit the file."""
+        if not self._count:
+            raise ValueError(f"{self.path}: question bank is empty")
+        if len(self._mm) < self._data_at:
+            raise ValueError(f"{self.path}: truncated before the data section")
+        offsets = array("Q", self._mm[self._offsets_at:self._topic_ids_at])
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        if offsets[0] != 0 or self._data_at + offsets[-1] != len(self._mm):
+            raise ValueError(f"{self.path}: offsets don't match the data section")
+        if any(a >= b for a, b in zip(offsets, offsets[1:])):
+            raise ValueError(f"{self.path}: offsets are not increasing")
+        if any(t >= len(self.topics) for t in self._topic_ids() if t != NO_TOPIC):
+            raise ValueError(f"{self.path}: topic id out of range")
+
+    def _decode_uncached(self, q_idx: int):
+        if not 0 <= q_idx < self._count:
+            raise IndexError("question index out of range")
+        start, end = _OFFSETS.unpack_from(self._mm, self._offsets_at + q_idx * 8)
+        return json.loads(self._mm[self._data_at + start:self._data_at + end])
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, q_idx: int) -> dict:
+        return self._decode(q_idx)
+
+    def _topic_ids(self):
+        ids = array("H", self._mm[self._topic_ids_at:self._topic_ids_at + self._count * 2])
+        if sys.byteorder != "little":
+            ids.byteswap()
+        return ids
+
+
+# ── BUILD / LOAD ─────────────────────────────────────────────
+def build_pack(questions: list, path: str) -> None:
+    """Validate questions (a list of question dicts) and write them to a .pack file."""
+    validate_bank(JsonBank(questions))
+    topics = sorted({q["topic"] for q in questions if "topic" in q})
+    topic_ids = {t: i for i, t in enumerate(topics)}
+    topics_raw = json.dumps(topics).encode()
+
+    records, offsets, pos = [], array("Q", [0]), 0
+    for q in questions:
+        raw = json.dumps(q, ensure_ascii=False, separators=(",", ":")).encode()
+        records.append(raw)
+        pos += len(raw)
+        offsets.append(pos)
+    ids = array("H", (topic_ids.get(q.get("topic"), NO_TOPIC) for q in questions))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+        ids.byteswap()
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, PACK_VERSION, 0, len(questions), len(topics_raw)))
+        f.write(offsets.tobytes())
+        f.write(ids.tobytes())
+        f.write(topics_raw)
+        for raw in records:
+            f.write(raw)
+
+
+def validate_bank(bank: QuestionBank) -> None:
+    """Raise ValueError unless every question can be played."""
+    if not len(bank):
+        raise ValueError("question bank is empty")
+    for q_idx in range(len(bank)):
+        q = bank[q_idx]
+        opts = q.get("options", [])
+        if not q.get("q") or not 2 <= len(opts) <= 4:
+            raise ValueError(f"question {q_idx}: needs text and 2-4 options")
+        if len({o["id"] for o in opts}) != len(opts):
+            raise ValueError(f"question {q_idx}: duplicate option ids")
+        if sum(bool(o["ok"]) for o in opts) != 1:
+            raise ValueError(f"question {q_idx}: needs exactly one correct option")
+        for o in opts:
+            if not o.get("txt") or "why" not in o:
+                raise ValueError(f"question {q_idx}: option {o['id']!r} needs txt and why")
+
+
+def load_bank(path: str) -> QuestionBank:
+    """Open a .pack file with PackedBank, anything else as a JSON list.
+
+    Raises ValueError for a damaged pack or an unplayable JSON bank.
+    """
+    if path.endswith(".pack"):
+        return PackedBank(path)
+    bank = JsonBank.from_file(path)
+    validate_bank(bank)
+    return bank
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        sys.exit("usage: python question_bank.py build <questions.json> <out.pack>")
+    with open(sys.argv[2], "r") as f:
+        questions = json.load(f)
+    try:
+        build_pack(questions, sys.argv[3])
+    except ValueError as e:
+        sys.exit(f"{sys.argv[2]}: {e}")
+    print(f"wrote {len(questions)} questions to {sys.argv[3]}")
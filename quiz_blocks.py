@@ -0,0 +1,126 @@
+# quiz_blocks.py
+#
+# Precompiled Block Kit templates for quiz questions.
+#
+# Everything about a question that doesn't change between renders – the
+# question and option text, the button labels and action ids – is prepared
+# once. A render then only picks an option order and patches in the
+# progress header, the step number and each button's signed value.
+#
+# The text of a whole bank is packed into one string with an offset array,
+# like a .pack file (see question_bank.py): a few objects in all, however
+# big the bank, instead of a dict per option order. A render slices its
+# question out, so under a preloading server (see gunicorn.conf.py) it only
+# reads the pages the workers share; touching per-question objects would
+# write their reference counts and copy those pages into every worker.
+
+import itertools
+import random
+from array import array
+from collections import OrderedDict
+from threading import Lock
+
+LETTERS = ["A", "B", "C", "D"]
+# option orders per option count, and the parts every question shares
+ORDERS = {n: list(itertools.permutations(range(n))) for n in range(2, len(LETTERS) + 1)}
+PREFIXES = [f"*{letter}* – " for letter in LETTERS]
+BUTTON_TEXT = [{"type": "plain_text", "text": letter} for letter in LETTERS]
+ACTION_IDS = [f"answer_{letter}" for letter in LETTERS]
+
+
+class TemplatePack:
+    """The question and option text of some questions, in one string.
+
+    Question i is segment first[i] (the question) followed by one segment
+    per option; offsets[j]:offsets[j + 1] is segment j of `text`.
+    """
+
+    __slots__ = ("text", "offsets", "first")
+
+    def __init__(self, questions):
+        parts, offsets, first = [], array("Q", [0]), array("I")
+        for q in questions:
+            first.append(len(offsets) - 1)
+            for part in [q["q"]] + [o["txt"] for o in q["options"]]:
+                parts.append(part)
+                offsets.append(offsets[-1] + len(part))
+        first.append(len(offsets) - 1)
+        self.text = "".join(parts)
+        self.offsets = offsets
+        self.first = first
+
+    def __len__(self) -> int:
+        return len(self.first) - 1
+
+    def render(self, i: int, header: str, step: int, make_value, rng=random):
+        """Blocks for question i; make_value(option index) signs each button."""
+        text, offsets, at = self.text, self.offsets, self.first[i]
+        orders = ORDERS[self.first[i + 1] - at - 1]
+        order = orders[rng.randrange(len(orders))]
+        options_md = "\n".join([
+            PREFIXES[k] + text[offsets[at + 1 + o]:offsets[at + 2 + o]]
+            for k, o in enumerate(order)])
+        return [
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": f"{header}\n*Q{step+1}:* {text[offsets[at]:offsets[at + 1]]}"
+                }
+            },
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": options_md}
+            },
+            {
+                "type": "actions",
+                "elements": [
+                    {
+                        "type": "button",
+                        "text": BUTTON_TEXT[k],
+                        "action_id": ACTION_IDS[k],
+                        "value": make_value(o)
+                    }
+                    for k, o in enumerate(order)
+                ]
+            }
+        ]
+
+
+class TemplateCache:
+    """Compiled templates for a question bank.
+
+    Banks up to `maxsize` questions are packed eagerly, all in one
+    TemplatePack; bigger banks keep the most recently used `maxsize`
+    questions, each packed on its own when it is first needed.
+    """
+
+    def __init__(self, questions, maxsize: int = 4096):
+        self.questions = questions
+        self.maxsize = maxsize
+        self._pack = None
+        self._templates: OrderedDict = OrderedDict()
+        self._lock = Lock()
+        if len(questions) <= maxsize:
+            self._pack = TemplatePack(questions[q_idx] for q_idx in range(len(questions)))
+
+    def get(self, q_idx: int) -> tuple:
+        """(pack, index in the pack) for question q_idx."""
+        if self._pack is not None:
+            return self._pack, q_idx
+        pack = self._templates.get(q_idx)
+        if pack is not None:
+            with self._lock:
+                if q_idx in self._templates:
+                    self._templates.move_to_end(q_idx)
+            return pack, 0
+        pack = TemplatePack([self.questions[q_idx]])
+        with self._lock:
+            self._templates[q_idx] = pack
+            while len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+        return pack, 0
+
+    def render(self, q_idx: int, header: str, step: int, make_value):
+        pack, i = self.get(q_idx)
+        return pack.render(i, header, step, make_value)
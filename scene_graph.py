@@ -0,0 +1,330 @@
+# scene_graph.py
+#
+# Compiles adventure SCENES (see cyberquestadv.py) into an immutable graph
+# once at startup:
+#
+#   • every next_scene target is checked, so a typo fails the deploy instead
+#     of raising KeyError on some player's click
+#   • scenes that can't be reached from the start, and scenes from which no
+#     ending can be reached, are flagged
+#   • scene names are interned to integer ids and tags to bit positions, so
+#     a player's tags are one int; each scene's static Block Kit is
+#     pre-rendered, and a render only substitutes the player name, the
+#     per-user button values and (for conditional choices) which are shown
+#   • conditions are compiled to predicates over (tags, score)
+#
+# A choice can be conditional, and can route on the state it leaves behind:
+#
+#   {"text": "Call IT", "if": {"has_tags": ["reported"]},
+#    "tags_added": ["called_it"], "score_change": 1,
+#    "next_scene": [{"if": {"min_score": 5}, "scene": "promoted"},
+#                   {"if": {"any_tags": ["clicked_link", "gave_password"]},
+#                    "scene": "incident"},
+#                   {"scene": "quiet_day"}]}
+#
+# "if" on a choice hides its button unless the condition holds. A list
+# next_scene is tried in order after the choice's tags and score_change are
+# applied, and must end with an entry without "if". Conditions take
+# has_tags (all of), any_tags, no_tags, min_score and max_score; a tag in a
+# condition must be added by some choice. Scores, score_change included, are
+# signed 16-bit, and a player's score stops at either end of that range.
+
+import logging
+from collections import deque
+from string import Formatter
+
+logger = logging.getLogger(__name__)
+
+
+class SceneGraphError(ValueError):
+    """The scene definitions can't be compiled."""
+
+    def __init__(self, problems: list):
+        super().__init__("invalid adventure scenes:\n  " + "\n  ".join(problems))
+        self.problems = problems
+
+
+# scores are signed 16-bit in button values (see payloads.py)
+MIN_SCORE, MAX_SCORE = -(1 << 15), (1 << 15) - 1
+CONDITION_KEYS = {"has_tags", "any_tags", "no_tags", "min_score", "max_score"}
+
+
+def _predicate(need: int, any_of: int, none: int, lo: int, hi: int):
+    """fn(tags, score) -> bool with the masks and bounds bound in."""
+    if any_of:
+        return lambda tags, score: (tags & need == need and tags & any_of != 0
+                                    and not tags & none and lo <= score <= hi)
+    return lambda tags, score: tags & need == need and not tags & none and lo <= score <= hi
+
+
+class Choice:
+    """One button. targets[route(tags, score)] is the scene it leads to; the
+    last target is the fallback (the only one for a plain next_scene)."""
+
+    __slots__ = ("text", "next_id", "targets", "routes", "requires", "tag_mask", "score_change")
+
+    def __init__(self, text: str, targets: tuple, routes: tuple, requires,
+                 tag_mask: int, score_change: int):
+        self.text = text
+        self.targets = targets
+        self.next_id = targets[-1]
+        # one predicate per target but the last
+        self.routes = routes
+        # predicate for showing the button, None if always shown
+        self.requires = requires
+        self.tag_mask = tag_mask
+        self.score_change = score_change
+
+    def route(self, tags: int, score: int) -> int:
+        """Index into targets for a player with these tags and score."""
+        for i, when in enumerate(self.routes):
+            if when(tags, score):
+                return i
+        return len(self.routes)
+
+
+class CompiledScene:
+    """One scene with its description split around {player_name}."""
+
+    __slots__ = ("id", "name", "parts", "section", "choices", "buttons", "requires")
+
+    def __init__(self, scene_id: int, name: str, parts: list, choices: list):
+        self.id = scene_id
+        self.name = name
+        self.choices = choices
+        # literal pieces of the description; the name goes between them
+        self.parts = parts
+        # a description without {player_name} renders to the same block every time
+        self.section = (
+            {"type": "section", "text": {"type": "mrkdwn", "text": parts[0]}}
+            if len(parts) == 1 else None
+        )
+        # (label, action_id) per choice button
+        self.buttons = [
+            ({"type": "plain_text", "text": c.text}, f"adv_{i}")
+            for i, c in enumerate(choices)
+        ]
+        # per-choice predicates, or None when every button is always shown
+        self.requires = (
+            [c.requires for c in choices] if any(c.requires for c in choices) else None
+        )
+
+    @property
+    def is_ending(self) -> bool:
+        return not self.choices
+
+    def render(self, player_name: str, make_value, tags: int = 0, score: int = 0) -> list:
+        """Blocks for this scene; make_value(choice index) signs each button.
+
+        Conditional choices are left out unless the player's tags and score
+        meet them; a button keeps its index in choices either way.
+        """
+        section = self.section or {
+            "type": "section",
+            "text": {"type": "mrkdwn", "text": player_name.join(self.parts)}
+        }
+        if not self.buttons:
+            return [section]
+        return [
+            section,
+            {
+                "type": "actions",
+                "elements": [
+                    {"type": "button", "text": label, "action_id": action_id,
+                     "value": make_value(i)}
+                    for i, (label, action_id) in enumerate(self.buttons)
+                    if self.requires is None or self.requires[i] is None
+                    or self.requires[i](tags, score)
+                ]
+            }
+        ]
+
+
+class SceneGraph:
+    """Compiled scenes, indexed by integer id."""
+
+    def __init__(self, scenes: list, start: int, tags: list, unreachable: list, dead_ends: list):
+        self.scenes = scenes
+        # tag names by bit position
+        self.tags = tags
+        self.start = start
+        self.ids = {s.name: s.id for s in scenes}
+        self.unreachable = unreachable
+        self.dead_ends = dead_ends
+
+    def __getitem__(self, scene_id: int) -> CompiledScene:
+        return self.scenes[scene_id]
+
+    def __len__(self) -> int:
+        return len(self.scenes)
+
+    def tag_names(self, tags: int) -> list:
+        return [name for bit, name in enumerate(self.tags) if tags >> bit & 1]
+
+
+def _split_description(name: str, text: str, problems: list) -> list:
+    """Split a description on {player_name}, with str.format semantics."""
+    parts = [""]
+    try:
+        for literal, field, spec, conversion in Formatter().parse(text):
+            parts[-1] += literal
+            if field is None:
+                continue
+            if field != "player_name" or spec or conversion:
+                problems.append(f"{name}: unsupported placeholder {{{field}}} in description")
+                continue
+            parts.append("")
+    except ValueError as e:
+        problems.append(f"{name}: bad description template ({e})")
+    return parts
+
+
+def _is_score(value) -> bool:
+    return (isinstance(value, int) and not isinstance(value, bool)
+            and MIN_SCORE <= value <= MAX_SCORE)
+
+
+def _compile_condition(where: str, spec, bits: dict, problems: list):
+    """A predicate for one "if" object, or None if it is invalid."""
+    if not isinstance(spec, dict) or not spec:
+        problems.append(f"{where}: a condition must be a non-empty object")
+        return None
+    unknown = set(spec) - CONDITION_KEYS
+    if unknown:
+        problems.append(f"{where}: unknown condition {', '.join(sorted(unknown))}")
+        return None
+
+    def mask(field: str) -> int:
+        names = spec.get(field, ())
+        if isinstance(names, str):
+            names = [names]
+        m = 0
+        for name in names:
+            if name not in bits:
+                problems.append(f"{where}: {field} names tag {name!r}, which no choice adds")
+            else:
+                m |= 1 << bits[name]
+        return m
+
+    lo, hi = spec.get("min_score", MIN_SCORE), spec.get("max_score", MAX_SCORE)
+    if not _is_score(lo) or not _is_score(hi):
+        problems.append(f"{where}: min_score and max_score must be integers "
+                        f"from {MIN_SCORE} to {MAX_SCORE}")
+        return None
+    return _predicate(mask("has_tags"), mask("any_tags"), mask("no_tags"), lo, hi)
+
+
+def _compile_targets(where: str, target, ids: dict, bits: dict, problems: list):
+    """(targets, routes) for a next_scene string or route list, or None."""
+    if isinstance(target, str) or target is None:
+        if target not in ids:
+            problems.append(f"{where} goes to undefined scene {target!r}")
+            return None
+        return (ids[target],), ()
+    if not isinstance(target, list) or not target:
+        problems.append(f"{where}: next_scene must be a scene name or a list of routes")
+        return None
+    targets, routes, ok = [], [], True
+    for j, route in enumerate(target):
+        last = j == len(target) - 1
+        scene = route.get("scene") if isinstance(route, dict) else None
+        if scene not in ids:
+            problems.append(f"{where}: route {j} goes to undefined scene {scene!r}")
+            ok = False
+            continue
+        targets.append(ids[scene])
+        if last:
+            if "if" in route:
+                problems.append(f"{where}: the last route must have no \"if\" (the fallback)")
+                ok = False
+        elif "if" not in route:
+            problems.append(f"{where}: route {j} has no \"if\", so later routes never apply")
+            ok = False
+        else:
+            when = _compile_condition(f"{where}, route {j}", route["if"], bits, problems)
+            ok = ok and when is not None
+            routes.append(when)
+    return (tuple(targets), tuple(routes)) if ok else None
+
+
+def compile_scenes(scenes: dict, start: str = "choose_role") -> SceneGraph:
+    """Validate and compile a SCENES dict. Raises SceneGraphError."""
+    names = list(scenes)
+    ids = {name: i for i, name in enumerate(names)}
+    problems = []
+    if start not in ids:
+        problems.append(f"start scene {start!r} is not defined")
+
+    # tags get bits in order of first appearance, before any condition is
+    # compiled, so a condition can name a tag added further on
+    bits: dict = {}
+    for scene in scenes.values():
+        for choice in scene.get("choices", []):
+            for t in choice.get("tags_added", ()):
+                bits.setdefault(t, len(bits))
+
+    compiled = []
+    for name in names:
+        scene = scenes[name]
+        parts = _split_description(name, scene.get("description", ""), problems)
+        choices = []
+        for i, choice in enumerate(scene.get("choices", [])):
+            where = f"{name}: choice {i} ({choice.get('text')!r})"
+            text = choice.get("text")
+            if not isinstance(text, str) or not text.strip():
+                problems.append(f"{where}: text must be a non-empty string")
+                text = None
+            route = _compile_targets(where, choice.get("next_scene"), ids, bits, problems)
+            requires = None
+            if "if" in choice:
+                requires = _compile_condition(where, choice["if"], bits, problems)
+            score_change = choice.get("score_change", 0)
+            if not _is_score(score_change):
+                problems.append(f"{where}: score_change must be an integer "
+                                f"from {MIN_SCORE} to {MAX_SCORE}")
+                continue
+            if route is None or text is None:
+                continue
+            tag_mask = 0
+            for t in choice.get("tags_added", ()):
+                tag_mask |= 1 << bits[t]
+            choices.append(Choice(text, route[0], route[1], requires,
+                                  tag_mask, score_change))
+        if choices and all(c.requires for c in choices):
+            problems.append(f"{name}: every choice has an \"if\"; "
+                            f"add one without, so no player is left without a button")
+        compiled.append(CompiledScene(ids[name], name, parts, choices))
+    if problems:
+        raise SceneGraphError(problems)
+
+    # forward reachability from the start scene
+    seen = {ids[start]}
+    todo = deque(seen)
+    while todo:
+        for c in compiled[todo.popleft()].choices:
+            for target in c.targets:
+                if target not in seen:
+                    seen.add(target)
+                    todo.append(target)
+    unreachable = [s.name for s in compiled if s.id not in seen]
+
+    # backward reachability from the endings
+    incoming = [[] for _ in compiled]
+    for s in compiled:
+        for c in s.choices:
+            for target in c.targets:
+                incoming[target].append(s.id)
+    can_end = {s.id for s in compiled if s.is_ending}
+    todo = deque(can_end)
+    while todo:
+        for src in incoming[todo.popleft()]:
+            if src not in can_end:
+                can_end.add(src)
+                todo.append(src)
+    dead_ends = [s.name for s in compiled if s.id not in can_end]
+
+    if unreachable:
+        logger.warning("adventure scenes unreachable from %s: %s", start, ", ".join(unreachable))
+    if dead_ends:
+        logger.warning("adventure scenes that can never reach an ending: %s", ", ".join(dead_ends))
+    return SceneGraph(compiled, ids[start], list(bits), unreachable, dead_ends)
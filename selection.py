@@ -0,0 +1,253 @@
+# selection.py
+#
+# Adaptive question selection, in the spirit of spaced repetition.
+#
+# Each user keeps a QuestionHistory (game_state.py) of the last
+# QUIZ_HISTORY_SIZE questions they answered. A question's weight is
+#
+#   not in the history                      1
+#   answered within the last cooldown turns 0      (no quick repeats)
+#   answered before that                    full × ramp
+#
+#   full = QUIZ_KNOWN_WEIGHT if never missed, 1 + QUIZ_MISS_BOOST × m if
+#          missed m times (a miss count halves on every correct answer)
+#   ramp = grows by 1 / QUIZ_RAMP per turn since the question left its
+#          cooldown, up to 1
+#
+# so a question comes back more likely the longer it hasn't been seen, and
+# sooner if it was missed. The next question is drawn in proportion to
+# weight:
+#
+#   • history slots sit in Fenwick trees, so drawing one and changing a
+#     weight are O(log H). A ramping weight is a line in the turn clock t,
+#     c + a·t, kept as c in one tree and a in another, so time passing
+#     changes no weight; per turn only the answered slot, the slot leaving
+#     its cooldown and the slot reaching full weight change
+#   • all other questions weigh 1, so one of them is drawn by picking a
+#     random index and retrying while it's in the history
+#
+# so the cost depends on the history size, not on the bank size.
+
+import os
+import random
+from array import array
+
+from game_state import QuestionHistory
+
+QUIZ_HISTORY_SIZE = int(os.getenv("QUIZ_HISTORY_SIZE", 128))
+QUIZ_COOLDOWN = int(os.getenv("QUIZ_COOLDOWN", 20))
+QUIZ_MISS_BOOST = float(os.getenv("QUIZ_MISS_BOOST", 3.0))
+QUIZ_KNOWN_WEIGHT = float(os.getenv("QUIZ_KNOWN_WEIGHT", 0.5))
+QUIZ_RAMP = int(os.getenv("QUIZ_RAMP", 50))
+
+
+class Fenwick:
+    """Binary indexed tree of non-negative weights: prefix sums and weighted draws."""
+
+    __slots__ = ("n", "tree", "weights")
+
+    def __init__(self, weights):
+        self.n = len(weights)
+        self.weights = array("d", weights)
+        tree = array("d", [0.0]) + array("d", weights)
+        # O(n) build: push each node into its parent
+        for i in range(1, self.n + 1):
+            parent = i + (i & -i)
+            if parent <= self.n:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def set(self, i: int, weight: float) -> None:
+        delta = weight - self.weights[i]
+        if not delta:
+            return
+        self.weights[i] = weight
+        i += 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def append(self, weight: float) -> None:
+        """Add slot n (the tree grows by one node)."""
+        self.n += 1
+        self.weights.append(0.0)
+        # the new node covers (n - lowbit(n), n]; sum the children it covers
+        i, total, low = self.n, 0.0, self.n & -self.n
+        child = 1
+        while child < low:
+            total += self.tree[i - child]
+            child <<= 1
+        self.tree.append(total)
+        self.set(self.n - 1, weight)
+
+    def total(self) -> float:
+        i, s = self.n, 0.0
+        while i > 0:
+            s += self.tree[i]
+            i -= i & -i
+        return s
+
+    def find(self, u: float) -> int:
+        """Smallest slot whose prefix sum exceeds u."""
+        pos, step = 0, 1 << self.n.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.n and self.tree[nxt] <= u:
+                pos = nxt
+                u -= self.tree[nxt]
+            step >>= 1
+        # rounding can walk past the last positive slot
+        while pos > 0 and (pos >= self.n or not self.weights[pos]):
+            pos -= 1
+        return pos
+
+
+class LineWeights:
+    """Weights c + a·t of a clock t, as a Fenwick tree of c and one of a."""
+
+    __slots__ = ("c", "a")
+
+    def __init__(self, lines):
+        self.c = Fenwick([c for c, _ in lines])
+        self.a = Fenwick([a for _, a in lines])
+
+    def set(self, i: int, line: tuple) -> None:
+        self.c.set(i, line[0])
+        self.a.set(i, line[1])
+
+    def append(self, line: tuple) -> None:
+        self.c.append(line[0])
+        self.a.append(line[1])
+
+    def weight(self, i: int, t: float) -> float:
+        return self.c.weights[i] + t * self.a.weights[i]
+
+    def total(self, t: float) -> float:
+        return self.c.total() + t * self.a.total()
+
+    def find(self, u: float, t: float) -> int:
+        """Smallest slot whose prefix sum at t exceeds u (Fenwick.find on both)."""
+        c, a, n = self.c.tree, self.a.tree, self.c.n
+        pos, step = 0, 1 << n.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= n:
+                node = c[nxt] + t * a[nxt]
+                if node <= u:
+                    pos = nxt
+                    u -= node
+            step >>= 1
+        while pos > 0 and (pos >= n or self.weight(pos, t) <= 0):
+            pos -= 1
+        return pos
+
+
+class Selector:
+    """Draws questions by the weights above and records answers."""
+
+    def __init__(self, history_size: int = QUIZ_HISTORY_SIZE, cooldown: int = QUIZ_COOLDOWN,
+                 miss_boost: float = QUIZ_MISS_BOOST, known_weight: float = QUIZ_KNOWN_WEIGHT,
+                 ramp: int = QUIZ_RAMP):
+        self.history_size = history_size
+        self.cooldown = cooldown
+        self.miss_boost = miss_boost
+        self.known_weight = known_weight
+        self.ramp = max(ramp, 1)
+
+    def _cooldown(self, bank_size: int) -> int:
+        # a small bank would otherwise run out of eligible questions
+        return min(self.cooldown, bank_size // 2)
+
+    def _line(self, h: QuestionHistory, slot: int, cooldown: int) -> tuple:
+        """(c, a): the slot's weight is c + a·h.clock until its next change."""
+        since = h.clock - h.seen[slot] - cooldown + 1
+        if since <= 0:
+            return 0.0, 0.0
+        misses = h.misses[slot]
+        full = 1.0 + self.miss_boost * misses if misses else self.known_weight
+        if since >= self.ramp:
+            return full, 0.0
+        # full · since / ramp
+        a = full / self.ramp
+        return a * (1 - cooldown - h.seen[slot]), a
+
+    def _weight(self, h: QuestionHistory, slot: int, cooldown: int) -> float:
+        c, a = self._line(h, slot, cooldown)
+        return c + a * h.clock
+
+    def _index(self, h: QuestionHistory, bank_size: int) -> LineWeights:
+        """h's weights, and its question and turn lookups, built on first use."""
+        if h.tree is None:
+            cooldown = self._cooldown(bank_size)
+            h.tree = LineWeights([self._line(h, s, cooldown) for s in range(len(h))])
+            h.slots = {q_idx: slot for slot, q_idx in enumerate(h.questions)}
+            # oldest first, as dicts keep insertion order
+            h.turns = dict(sorted((turn, slot) for slot, turn in enumerate(h.seen)))
+        return h.tree
+
+    def pick(self, h: QuestionHistory, bank_size: int, rng=random) -> int:
+        """Index of the next question for a user with history h (None if new)."""
+        if h is None or not len(h):
+            return rng.randrange(bank_size)
+        tree = self._index(h, bank_size)
+        seen_mass = tree.total(h.clock)
+        if seen_mass < 1e-9:
+            # only rounding left over from cooled-down slots
+            seen_mass = 0.0
+        unseen = bank_size - len(h)
+        total = seen_mass + unseen
+        if total <= 0:
+            # every question is cooling down; take the one seen longest ago
+            return h.questions[next(iter(h.turns.values()))]
+        u = rng.random() * total
+        if u < seen_mass:
+            return h.questions[tree.find(u, h.clock)]
+        slots = h.slots
+        if unseen * 4 >= bank_size:
+            # at least a quarter of the bank is unseen: a few tries on average
+            while True:
+                q_idx = rng.randrange(bank_size)
+                if q_idx not in slots:
+                    return q_idx
+        # a small bank that's mostly in the history
+        return rng.choice([q for q in range(bank_size) if q not in slots])
+
+    def record(self, h: QuestionHistory, version: int, q_idx: int, missed: bool,
+               bank_size: int) -> QuestionHistory:
+        """h after answering q_idx; a new history if h is None or for another bank."""
+        if h is None or h.version != version:
+            h = QuestionHistory(version)
+        cooldown = self._cooldown(bank_size)
+        tree = self._index(h, bank_size)
+        h.clock += 1
+        slot = h.slots.get(q_idx)
+        if slot is not None:
+            del h.turns[h.seen[slot]]
+        elif len(h) < self.history_size:
+            slot = h.slots[q_idx] = len(h)
+            h.questions.append(q_idx)
+            h.misses.append(0)
+            h.seen.append(0)
+            tree.append((0.0, 0.0))
+        else:
+            # forget the question answered longest ago
+            turn, slot = next(iter(h.turns.items()))
+            del h.turns[turn]
+            del h.slots[h.questions[slot]]
+            h.slots[q_idx] = slot
+            h.questions[slot] = q_idx
+            h.misses[slot] = 0
+        h.misses[slot] = min(255, h.misses[slot] + 1) if missed else h.misses[slot] // 2
+        h.seen[slot] = h.clock
+        h.turns[h.clock] = slot
+        tree.set(slot, self._line(h, slot, cooldown))
+        # the slot answered `cooldown` turns ago leaves its cooldown, and the
+        # one answered `cooldown + ramp - 1` turns ago reaches full weight
+        for turn in {h.clock - cooldown, h.clock - cooldown - self.ramp + 1}:
+            expired = h.turns.get(turn)
+            if expired is not None and expired != slot:
+                tree.set(expired, self._line(h, expired, cooldown))
+        return h
+
+
+selector = Selector()
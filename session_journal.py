@@ -0,0 +1,345 @@
+# session_journal.py
+#
+# Keeps in-process sessions (SESSION_BACKEND=memory) across deploys and
+# worker restarts. Set SESSION_JOURNAL_DIR to turn it on.
+#
+# Every process that serves requests writes its own segment of the journal,
+# SESSION_JOURNAL_DIR/segment.<n>, held with an flock on its `lock` file:
+#
+#   journal.<gen>   every set/update/delete, appended in batches by a
+#                   background thread every SESSION_JOURNAL_FLUSH seconds;
+#                   a write only adds a tuple to a list on the request path
+#   snapshot.<gen>  every live session, written every
+#                   SESSION_SNAPSHOT_INTERVAL seconds (or once the journal
+#                   passes SESSION_SNAPSHOT_BYTES); journals older than the
+#                   newest snapshot are then deleted
+#
+# Both files are runs of the same compact binary record: crc32, op, wall
+# clock time, then the namespace, key and packed session (see game_state.py).
+#
+# On boot, start() claims the first segment no other process holds (a new
+# one if they all are) and restores from every segment: the newest
+# snapshot of each, then the journals after it, keeping the latest record
+# per session across all of them; a torn record at the end of a journal
+# ends that file's replay. Workers never wait for each other. A segment
+# that was held at boot belongs to a running worker or to one being
+# replaced in a rolling restart; once that process has flushed and exited
+# its lock is free, and the sessions it wrote last are loaded too, the
+# newer copy of each winning. The final flush runs at exit: SIGTERM ends
+# the process normally (after any handler already installed, such as
+# gunicorn's), so atexit runs.
+
+import atexit
+import fcntl
+import glob
+import itertools
+import logging
+import os
+import signal
+import struct
+import threading
+import time
+import zlib
+
+SESSION_JOURNAL_DIR = os.getenv("SESSION_JOURNAL_DIR", "")
+JOURNAL_FLUSH = float(os.getenv("SESSION_JOURNAL_FLUSH", 0.2))
+SNAPSHOT_INTERVAL = float(os.getenv("SESSION_SNAPSHOT_INTERVAL", 300))
+SNAPSHOT_BYTES = int(os.getenv("SESSION_SNAPSHOT_BYTES", 64 << 20))
+
+logger = logging.getLogger(__name__)
+
+# op, wall time, then lengths of namespace, key and value; a record is the
+# crc32 of the header and payload, the header, then the payload
+_HEADER = struct.Struct("<BdBHI")
+_CRC = struct.Struct("<I")
+_RECORD = struct.Struct("<IBdBHI")
+DELETE, PUT = 0, 1
+
+
+def encode(op: int, wall: float, namespace: bytes, key: bytes, value: bytes) -> bytes:
+    body = _HEADER.pack(op, wall, len(namespace), len(key), len(value)) + namespace + key + value
+    return _CRC.pack(zlib.crc32(body)) + body
+
+
+def decode(buf: bytes):
+    """(op, wall, namespace, key, value) per record, up to the first torn or corrupt one."""
+    offset, end, size = 0, len(buf), _RECORD.size
+    while offset + size <= end:
+        crc, op, wall, ns_len, key_len, value_len = _RECORD.unpack_from(buf, offset)
+        stop = offset + size + ns_len + key_len + value_len
+        if stop > end or zlib.crc32(buf[offset + 4:stop]) != crc:
+            return
+        at = offset + size
+        namespace = buf[at:at + ns_len].decode()
+        key = buf[at + ns_len:at + ns_len + key_len].decode()
+        yield op, wall, namespace, key, buf[at + ns_len + key_len:stop]
+        offset = stop
+
+
+def _generation(path: str) -> int:
+    return int(path.rsplit(".", 1)[1])
+
+
+def _numbered(directory: str, name: str) -> list:
+    """<directory>/<name>.<n> files, leaving out a snapshot.<n>.tmp being written."""
+    return [p for p in glob.glob(os.path.join(directory, f"{name}.[0-9]*"))
+            if p.rsplit(".", 1)[1].isdigit()]
+
+
+class SessionJournal:
+    """Journal and snapshots for the memory stores attached to it."""
+
+    def __init__(self, directory: str, flush_interval: float = JOURNAL_FLUSH,
+                 snapshot_interval: float = SNAPSHOT_INTERVAL,
+                 snapshot_bytes: int = SNAPSHOT_BYTES):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_bytes = snapshot_bytes
+        self.stores: dict = {}
+        # (op, wall, namespace, key, packed value) waiting for the flusher
+        self._pending: list = []
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._file = None
+        self._gen = 0
+        # this process's segment directory and its held lock file
+        self.segment = None
+        self._lock_file = None
+        self._pid = None
+        self._owned = threading.Event()
+        self._warned = False
+        self._last_snapshot = time.monotonic()
+        self.written = 0
+        self.snapshots = 0
+        self.restored = 0
+        self.adopted = 0
+        self.restore_seconds = 0.0
+
+    def attach(self, store) -> None:
+        self.stores[store.namespace] = store
+        store.journal = self
+
+    # ── request path ──
+    def write(self, namespace: str, key: str, value: bytes = None) -> None:
+        """Log a put (or, with value None, a delete); called under the key's stripe lock."""
+        if self._pid != os.getpid() or not self._owned.is_set():
+            # nothing would ever flush it; don't let it pile up
+            if not self._warned:
+                self._warned = True
+                logger.warning("session journal not started in process %d; "
+                               "its session writes are not journaled", os.getpid())
+            return
+        with self._lock:
+            self._pending.append((PUT if value is not None else DELETE, time.time(),
+                                  namespace, key, value or b""))
+
+    # ── startup ──
+    def start(self) -> None:
+        """Claim a segment, restore from all of them and start journaling in this process."""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        with self._lock:
+            self._pending = []
+        os.makedirs(self.directory, exist_ok=True)
+        busy = self._claim_segment()
+        self._take_over()
+        for segment in busy:
+            threading.Thread(target=self._adopt, args=(segment,), name="journal-adopt",
+                             daemon=True).start()
+        threading.Thread(target=self._flusher, name="journal", daemon=True).start()
+        atexit.register(self.close)
+        _chain_sigterm()
+
+    def _claim_segment(self) -> list:
+        """Lock the first free segment as this process's; returns the busy ones before it."""
+        busy = []
+        for n in itertools.count():
+            segment = os.path.join(self.directory, f"segment.{n}")
+            os.makedirs(segment, exist_ok=True)
+            lock_file = open(os.path.join(segment, "lock"), "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                busy.append(segment)
+                continue
+            self.segment, self._lock_file = segment, lock_file
+            return busy
+
+    def _take_over(self) -> None:
+        started = time.perf_counter()
+        self.restored = self.restore()
+        self.restore_seconds = time.perf_counter() - started
+        # always a new journal: the last one may end in a torn record, and
+        # replay stops at the first one in each file
+        journals = _numbered(self.segment, "journal")
+        self._gen = max([_generation(p) for p in journals]
+                        + [self._snapshot_gen(self.segment)]) + 1
+        self._file = open(self._journal_path(self._gen), "ab")
+        self._owned.set()
+        logger.info("restored %d sessions in %.3f s, journaling to %s",
+                    self.restored, self.restore_seconds, self.segment)
+
+    def _adopt(self, segment: str) -> None:
+        """Once the process holding `segment` has exited, load what it wrote last."""
+        with open(os.path.join(segment, "lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                restored = self.restore([segment])
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self.adopted += restored
+        logger.info("loaded %d sessions from %s after its worker exited", restored, segment)
+
+    # ── files ──
+    def _journal_path(self, gen: int) -> str:
+        return os.path.join(self.segment, f"journal.{gen}")
+
+    @staticmethod
+    def _snapshot_gen(segment: str) -> int:
+        snapshots = _numbered(segment, "snapshot")
+        return max((_generation(p) for p in snapshots), default=0)
+
+    def _read_segment(self, segment: str) -> list:
+        """Every record in a segment's newest snapshot and the journals after it."""
+        for _ in range(3):
+            gen = self._snapshot_gen(segment)
+            paths = [os.path.join(segment, f"snapshot.{gen}")] if gen else []
+            paths += [p for p in sorted(_numbered(segment, "journal"),
+                                        key=_generation) if _generation(p) >= gen]
+            records = []
+            try:
+                for path in paths:
+                    with open(path, "rb") as f:
+                        records.extend(decode(f.read()))
+            except FileNotFoundError:
+                continue  # its owner wrote a snapshot meanwhile; read it again
+            return records
+        return records
+
+    def restore(self, segments: list = None) -> int:
+        """Load the latest record of every session in the segments (all of
+        them by default) into the attached stores."""
+        if segments is None:
+            segments = _numbered(self.directory, "segment")
+        latest: dict = {}
+        for segment in segments:
+            for op, wall, namespace, key, value in self._read_segment(segment):
+                seen = latest.get((namespace, key))
+                if seen is None or wall >= seen[1]:
+                    latest[namespace, key] = (op, wall, value)
+
+        by_store: dict = {}
+        for (namespace, key), record in latest.items():
+            if record[0] == PUT and namespace in self.stores:
+                by_store.setdefault(namespace, []).append((record[1], key, record[2]))
+        restored = 0
+        for namespace, entries in by_store.items():
+            restored += self.stores[namespace].restore(entries)
+        return restored
+
+    def flush(self) -> None:
+        """Write buffered records to this process's journal."""
+        with self._io_lock:
+            if not self._owned.is_set():
+                return
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            self._file.write(b"".join(
+                encode(op, wall, namespace.encode(), key.encode(), value)
+                for op, wall, namespace, key, value in pending))
+            self._file.flush()
+            self.written += len(pending)
+
+    def snapshot(self) -> None:
+        """Write every live session to a new snapshot and drop the journals it covers."""
+        with self._io_lock:
+            if not self._owned.is_set():
+                return
+            # later writes go to the next journal, which is replayed after this snapshot
+            with self._lock:
+                pending, self._pending = self._pending, []
+            self._file.write(b"".join(
+                encode(op, wall, namespace.encode(), key.encode(), value)
+                for op, wall, namespace, key, value in pending))
+            self._file.close()
+            self._gen += 1
+            gen = self._gen
+            self._file = open(self._journal_path(gen), "ab")
+            self.written += len(pending)
+
+        path = os.path.join(self.segment, f"snapshot.{gen}")
+        with open(path + ".tmp", "wb") as f:
+            for namespace, store in self.stores.items():
+                ns = namespace.encode()
+                f.write(b"".join(encode(PUT, wall, ns, key.encode(), value)
+                                 for wall, key, value in store.dump()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        for old in _numbered(self.segment, "snapshot") + \
+                _numbered(self.segment, "journal"):
+            if _generation(old) < gen:
+                os.remove(old)
+        self._last_snapshot = time.monotonic()
+        self.snapshots += 1
+
+    def _flusher(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                with self._io_lock:
+                    due = self._owned.is_set() and (
+                        time.monotonic() - self._last_snapshot > self.snapshot_interval
+                        or self._file.tell() > self.snapshot_bytes)
+                if due:
+                    self.snapshot()
+            except Exception:
+                logger.exception("session journal write failed")
+
+    def close(self) -> None:
+        """Final flush, then release the segment for the next process."""
+        if self._pid != os.getpid() or not self._owned.is_set():
+            return
+        self.flush()
+        with self._io_lock:
+            self._owned.clear()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+
+    def stats(self) -> dict:
+        return {
+            "owned": self._owned.is_set(),
+            "segment": self.segment,
+            "pending": len(self._pending),
+            "written": self.written,
+            "snapshots": self.snapshots,
+            "restored": self.restored,
+            "adopted": self.adopted,
+            "restore_ms": round(self.restore_seconds * 1000, 1),
+        }
+
+
+def _chain_sigterm() -> None:
+    """Exit normally on SIGTERM, so atexit flushes; keeps a handler already set."""
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def on_sigterm(signum, frame):
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+
+journal = SessionJournal(SESSION_JOURNAL_DIR) if SESSION_JOURNAL_DIR else None
@@ -0,0 +1,426 @@
+# session_store.py
+#
+# Pluggable session backends shared by the quiz (slacky2.py) and adventure
+# (cyberquestadv.py) modes. Pick one with SESSION_BACKEND:
+#
+#   memory  – plain in-process dict (default, single gunicorn worker only)
+#   sqlite  – SQLite in WAL mode at SESSION_DB, shared by every worker on a host
+#   redis   – any Redis-compatible server at REDIS_URL, shared across hosts
+#
+# Every backend exposes the same small API. All writes go through
+# update(), which is an atomic read-modify-write for a single user.
+#
+# Sessions that sit idle for SESSION_TTL seconds are evicted, and each store
+# holds at most SESSION_MAX sessions (least recently used go first).
+# Eviction is amortised over writes, so there is no sweeper thread.
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from session_journal import journal
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB = os.getenv("SESSION_DB", "/tmp/cyberquest-sessions.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL = int(os.getenv("SESSION_TTL", 3600))
+SESSION_MAX = int(os.getenv("SESSION_MAX", 100_000))
+# shared stores sweep once every this many writes
+SWEEP_EVERY = int(os.getenv("SESSION_SWEEP_EVERY", 256))
+# per-key lock stripes for the in-process store
+LOCK_STRIPES = int(os.getenv("SESSION_LOCK_STRIPES", 64))
+# Redis has no per-namespace key count; stats() rescans at most this often
+REDIS_COUNT_SECONDS = float(os.getenv("SESSION_REDIS_COUNT_SECONDS", 60))
+
+
+class _JsonCodec:
+    """Used when a store is created without a session class."""
+
+    @staticmethod
+    def pack(value) -> bytes:
+        return json.dumps(value).encode()
+
+    @staticmethod
+    def unpack(raw: bytes):
+        return json.loads(raw)
+
+
+# ── IN-PROCESS ───────────────────────────────────────────────
+class MemoryStore:
+    """Sessions kept in an LRU-ordered dict inside the current process.
+
+    Writes to one key are serialised by that key's stripe lock, so update()
+    callbacks for different users run in parallel on threaded workers; the
+    dict itself is only locked for the final store.
+    """
+
+    def __init__(self, namespace: str, cls=None, ttl: int = SESSION_TTL, max_size: int = SESSION_MAX,
+                 stripes: int = LOCK_STRIPES):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_size = max_size
+        self.evicted_idle = 0
+        self.evicted_full = 0
+        self._codec = cls or _JsonCodec
+        # SessionJournal this store's writes are logged to, if any (see session_journal.py)
+        self.journal = None
+        # key → (last_touched, value), oldest first
+        self._data: OrderedDict = OrderedDict()
+        # running total of _entry_bytes() over _data, kept under _lock
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # always taken before _lock, never the other way round
+        self._stripes = [threading.Lock() for _ in range(max(1, stripes))]
+
+    def _stripe(self, key: str) -> threading.Lock:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def get(self, key: str, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic() - self.ttl:
+            return default
+        return entry[1]
+
+    def set(self, key: str, value) -> None:
+        with self._stripe(key):
+            with self._lock:
+                self._put(key, value)
+            self._log(key, value)
+
+    def delete(self, key: str) -> None:
+        with self._stripe(key):
+            with self._lock:
+                self._pop(key)
+            self._log(key, None)
+
+    def update(self, key: str, fn):
+        """Run fn(value) -> (new_value, result) atomically and return result.
+
+        fn receives None when there is no session. Returning None as the
+        new value deletes the session.
+        """
+        with self._stripe(key):
+            new, result = fn(self.get(key))
+            with self._lock:
+                if new is None:
+                    self._pop(key)
+                else:
+                    self._put(key, new)
+            self._log(key, new)
+            return result
+
+    def _log(self, key: str, value) -> None:
+        # still under the key's stripe lock, so the journal sees one key's
+        # writes in the order they were made
+        if self.journal is not None:
+            self.journal.write(self.namespace, key,
+                               None if value is None else self._codec.pack(value))
+
+    @staticmethod
+    def _entry_bytes(key: str, entry: tuple) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(entry) + sys.getsizeof(entry[1])
+
+    def _pop(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= self._entry_bytes(key, entry)
+
+    def _put(self, key: str, value) -> None:
+        now = time.monotonic()
+        data = self._data
+        self._pop(key)
+        entry = data[key] = (now, value)
+        self._bytes += self._entry_bytes(key, entry)
+        # the front of the dict is always the least recently touched entry,
+        # so eviction only ever looks at entries it is about to remove
+        cutoff = now - self.ttl
+        while data:
+            oldest_key, oldest = next(iter(data.items()))
+            if oldest[0] >= cutoff:
+                break
+            del data[oldest_key]
+            self._bytes -= self._entry_bytes(oldest_key, oldest)
+            self.evicted_idle += 1
+        while len(data) > self.max_size:
+            oldest_key, oldest = data.popitem(last=False)
+            self._bytes -= self._entry_bytes(oldest_key, oldest)
+            self.evicted_full += 1
+
+    def dump(self) -> list:
+        """[(wall clock time last touched, key, packed value)] for a snapshot."""
+        with self._lock:
+            entries = list(self._data.items())
+        offset = time.time() - time.monotonic()
+        return [(touched + offset, key, self._codec.pack(value))
+                for key, (touched, value) in entries]
+
+    def restore(self, entries: list) -> int:
+        """Load [(wall clock time, key, packed value)] from a snapshot or journal.
+
+        A session already here is kept if it was touched more recently.
+        Returns how many were loaded.
+        """
+        offset = time.time() - time.monotonic()
+        cutoff = time.monotonic() - self.ttl
+        loaded = {}
+        for wall, key, raw in entries:
+            touched = wall - offset
+            if touched >= cutoff:
+                loaded[key] = (touched, self._codec.unpack(raw))
+        count = len(loaded)
+        with self._lock:
+            for key, entry in self._data.items():
+                if key not in loaded or entry[0] >= loaded[key][0]:
+                    loaded[key] = entry
+            merged = sorted(loaded.items(), key=lambda item: item[1][0])
+            self._data = OrderedDict(merged[-self.max_size:])
+            self._bytes = sum(self._entry_bytes(k, e) for k, e in self._data.items())
+        return count
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the sessions, kept as writes happen."""
+        return sys.getsizeof(self._data) + self._bytes
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self),
+            "evicted_idle": self.evicted_idle,
+            "evicted_full": self.evicted_full,
+            "memory_bytes": self.memory_bytes(),
+        }
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# ── SQLITE (WAL) ─────────────────────────────────────────────
+_local = threading.local()
+
+
+def _sqlite_conn(path: str) -> sqlite3.Connection:
+    """One connection per thread per database file."""
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.pid != os.getpid():
+        # a connection opened before a fork (gunicorn --preload) can't be
+        # used after it; the thread that forked keeps its thread-locals
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " ns TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+            " updated REAL NOT NULL, PRIMARY KEY (ns, key))"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (ns, updated)")
+        conns[path] = conn
+    return conn
+
+
+class SQLiteStore:
+    """Sessions in a SQLite WAL database shared by all workers on a host."""
+
+    def __init__(self, namespace: str, cls=None, path: str = SESSION_DB,
+                 ttl: int = SESSION_TTL, max_size: int = SESSION_MAX):
+        self.namespace = namespace
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.evicted_idle = 0
+        self.evicted_full = 0
+        self._codec = cls or _JsonCodec
+        self._writes = 0
+        _sqlite_conn(path)
+
+    def _conn(self) -> sqlite3.Connection:
+        return _sqlite_conn(self.path)
+
+    def _read(self, conn, key: str):
+        row = conn.execute(
+            "SELECT value FROM sessions WHERE ns = ? AND key = ? AND updated >= ?",
+            (self.namespace, key, time.time() - self.ttl),
+        ).fetchone()
+        return self._codec.unpack(row[0]) if row else None
+
+    def _write(self, conn, key: str, value) -> None:
+        if value is None:
+            conn.execute(
+                "DELETE FROM sessions WHERE ns = ? AND key = ?", (self.namespace, key))
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                (self.namespace, key, self._codec.pack(value), time.time()),
+            )
+        self._writes += 1
+        if self._writes % SWEEP_EVERY == 0:
+            self._sweep(conn)
+
+    def _sweep(self, conn) -> None:
+        cur = conn.execute(
+            "DELETE FROM sessions WHERE ns = ? AND updated < ?",
+            (self.namespace, time.time() - self.ttl),
+        )
+        self.evicted_idle += cur.rowcount
+        cur = conn.execute(
+            "DELETE FROM sessions WHERE ns = ? AND key IN ("
+            " SELECT key FROM sessions WHERE ns = ? ORDER BY updated DESC"
+            " LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_size),
+        )
+        self.evicted_full += cur.rowcount
+
+    def get(self, key: str, default=None):
+        value = self._read(self._conn(), key)
+        return default if value is None else value
+
+    def set(self, key: str, value) -> None:
+        self.update(key, lambda _: (value, None))
+
+    def delete(self, key: str) -> None:
+        self.update(key, lambda _: (None, None))
+
+    def update(self, key: str, fn):
+        """Run fn(value) -> (new_value, result) atomically and return result."""
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can
+        # never interleave their read and write for the same user.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            new, result = fn(self._read(conn, key))
+            self._write(conn, key, new)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "sessions": len(self),
+            "evicted_idle": self.evicted_idle,
+            "evicted_full": self.evicted_full,
+            "memory_bytes": page_count * page_size,
+        }
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM sessions WHERE ns = ? AND updated >= ?",
+            (self.namespace, time.time() - self.ttl),
+        ).fetchone()[0]
+
+
+# ── REDIS ────────────────────────────────────────────────────
+class RedisStore:
+    """Sessions in Redis (or anything speaking the redis-py client API).
+
+    Pass `client` to use an existing connection or a local fake (see
+    tests/fake_redis.py); otherwise the `redis` package is imported and
+    connected to REDIS_URL. Idle sessions expire through Redis key TTLs;
+    the size limit is left to the server's maxmemory policy.
+    """
+
+    def __init__(self, namespace: str, cls=None, client=None, url: str = REDIS_URL,
+                 ttl: int = SESSION_TTL, count_seconds: float = REDIS_COUNT_SECONDS):
+        if client is None:
+            import redis  # optional dependency, only needed for this backend
+            client = redis.Redis.from_url(url)
+        self.namespace = namespace
+        self.ttl = ttl
+        self._codec = cls or _JsonCodec
+        self._client = client
+        self._prefix = f"cyberquest:{namespace}:"
+        self.count_seconds = count_seconds
+        self._count = (float("-inf"), 0)  # (monotonic time counted, sessions)
+
+    def get(self, key: str, default=None):
+        raw = self._client.get(self._prefix + key)
+        return self._codec.unpack(raw) if raw is not None else default
+
+    def set(self, key: str, value) -> None:
+        self._client.set(self._prefix + key, self._codec.pack(value), ex=self.ttl)
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self._prefix + key)
+
+    def update(self, key: str, fn):
+        """Run fn(value) -> (new_value, result) atomically and return result.
+
+        Uses WATCH/MULTI optimistic locking and retries when another worker
+        wrote the same key in between.
+        """
+        name = self._prefix + key
+        while True:
+            with self._client.pipeline() as pipe:
+                try:
+                    pipe.watch(name)
+                    raw = pipe.get(name)
+                    new, result = fn(self._codec.unpack(raw) if raw is not None else None)
+                    pipe.multi()
+                    if new is None:
+                        pipe.delete(name)
+                    else:
+                        pipe.set(name, self._codec.pack(new), ex=self.ttl)
+                    pipe.execute()
+                    return result
+                except Exception as e:
+                    # redis.exceptions.WatchError, matched by name so that
+                    # fakes don't have to import redis
+                    if type(e).__name__ != "WatchError":
+                        raise
+
+    def stats(self) -> dict:
+        """The session count is from the last scan, at most count_seconds old."""
+        counted, sessions = self._count
+        if time.monotonic() - counted >= self.count_seconds:
+            sessions = len(self)
+            self._count = (time.monotonic(), sessions)
+        return {"sessions": sessions, "evicted_idle": 0, "evicted_full": 0,
+                "memory_bytes": 0}
+
+    def __contains__(self, key: str) -> bool:
+        return bool(self._client.exists(self._prefix + key))
+
+    def __len__(self) -> int:
+        """Scans every key in the namespace; stats() caches this."""
+        return sum(1 for _ in self._client.scan_iter(match=self._prefix + "*"))
+
+
+# ── FACTORY ──────────────────────────────────────────────────
+BACKENDS = {"memory": MemoryStore, "sqlite": SQLiteStore, "redis": RedisStore}
+
+
+def make_store(namespace: str, cls=None, backend: str = None):
+    """Create the session store configured by SESSION_BACKEND.
+
+    cls is the session class (see game_state.py); shared backends use its
+    pack()/unpack() to store sessions as compact bytes.
+    """
+    backend = backend or SESSION_BACKEND
+    try:
+        store_cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            f"Unknown SESSION_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}"
+        ) from None
+    store = store_cls(namespace, cls)
+    if journal is not None and store_cls is MemoryStore:
+        journal.attach(store)
+    return store
+
@@ -1,295 +1,236 @@
 import os
-import json
 import re
-import random
-from flask import Flask, request
+from flask import Flask, Response, request
 from slack_bolt import App
 from slack_bolt.adapter.flask import SlackRequestHandler
-from cyberquestadv import handle_adventure_start, handle_adventure_choice
-
-# ── LOAD QUESTIONS ───────────────────────────────────────────
-QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), "questions.json")
-with open(QUESTIONS_PATH, "r") as f:
-    QUESTIONS = json.load(f)
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+import cyberquestquiz as quiz
+from cyberquestadv import (
+    COMING_SOON, STALE_BUTTON, adventure_allowed, adventure_sessions, handle_adventure_choice,
+    handle_adventure_start,
+)
+import events
+from dedup import deliveries, skip_duplicates
+from outbound import dispatcher, QueuedRespond, SLACK_API_URL
+from profile_cache import DisplayNameCache, display_name
+from tournament import NOT_IN_CHANNEL, TOURNAMENT_ROUNDS, Tournaments
+import metrics
+import prefork
+from profiler import profiler, trace_middleware
+from session_journal import journal
 
 # ── CONFIG ───────────────────────────────────────────────────
-WIN_AT = int(os.getenv("WIN_AT", 10))
-LOSE_AT = int(os.getenv("LOSE_AT", 5))
-BAR_LEN = int(os.getenv("BAR_LEN", 10))
 SLACK_BOT_TOKEN = os.environ["SLACK_BOT_TOKEN"]
 SLACK_SIGNING_SECRET = os.environ["SLACK_SIGNING_SECRET"]
+# send respond() payloads from a background pool instead of the request thread
+OUTBOUND_ASYNC = os.getenv("OUTBOUND_ASYNC", "1") == "1"
 
 # ── APP INIT ─────────────────────────────────────────────────
-app = App(token=SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET)
+app = App(
+    # named, or Bolt inspects the caller's stack for one (~100 ms per import)
+    name="slacky2",
+    signing_secret=SLACK_SIGNING_SECRET,
+    client=WebClient(token=SLACK_BOT_TOKEN, base_url=SLACK_API_URL),
+    # listeners of profiled requests are profiled too (see profiler.py)
+    listener_executor=profiler.executor(),
+)
 flask_app = Flask(__name__)
 handler = SlackRequestHandler(app)
 
-# ── IN-MEMORY SESSION STORE ─────────────────────────────────
-# user_id → { queue: [...], step: int, correct: int, wrong: int }
-sessions: dict[str, dict] = {}
-
-# ── INTRO UI ─────────────────────────────────────────────────
-start_ui = [
-    {
-        "type": "section",
-        "text": {
-            "type": "mrkdwn",
-            "text": (
-                "*🎮 Welcome to CyberQuest!*\n\n"
-                f"First to *{WIN_AT}* correct wins. First to *{LOSE_AT}* wrong loses.\n\n"
-                "*Think you're too smart to get phished? Think again.*\n"
-                "Every right answer gets you closer to victory.\n"
-                "Every wrong answer? Closer to being hacked 😬\n\n"
-                "Choose a mode to begin:"
-            )
-        }
-    },
-    {"type": "divider"},
-    {
-        "type": "actions",
-        "elements": [
-            {
-                "type": "button",
-                "text": {"type": "plain_text", "text": "🧠 Start Quiz", "emoji": True},
-                "action_id": "start_game_click",
-                "value": "start"
-            },
-            {
-                "type": "button",
-                "text": {"type": "plain_text", "text": "🚨 Start Adventure (Coming Soon)", "emoji": True},
-                "action_id": "start_adventure_click",
-                "value": "coming_soon",
-                "style": "danger"
-            }
-        ]
-    }
-]
-
-# ── HELPERS ──────────────────────────────────────────────────
-
-
-def progress_bar(correct: int, wrong: int) -> str:
-    filled = "█" * min(correct, BAR_LEN)
-    empty = "░" * (BAR_LEN - len(filled))
-    return f"[{filled}{empty}]  ✅ {correct}/{WIN_AT}  ❌ {wrong}/{LOSE_AT}"
-
-
-def build_question_blocks(q_idx: int, correct: int, wrong: int, step: int):
-    q = QUESTIONS[q_idx]
-    opts = q["options"].copy()
-    random.shuffle(opts)
-    letters = ["A", "B", "C", "D"]
-
-    options_md = "\n".join(
-        f"*{letters[i]}* – {opt['txt']}" for i, opt in enumerate(opts))
-    buttons = []
-    for i, opt in enumerate(opts):
-        buttons.append({
-            "type": "button",
-            "text": {"type": "plain_text", "text": letters[i]},
-            "action_id": f"answer_{letters[i]}",
-            "value": json.dumps({
-                "q_idx":      q_idx,
-                "step":       step,
-                "c":          correct,
-                "w":          wrong,
-                "choice_idx": i,
-                "orig_id":    opt["id"]
-            })
-        })
-
-    return [
-        {
-            "type": "section",
-            "text": {
-                "type": "mrkdwn",
-                "text": f"{progress_bar(correct, wrong)}\n*Q{step+1}:* {q['q']}"
-            }
-        },
-        {
-            "type": "section",
-            "text": {"type": "mrkdwn", "text": options_md}
-        },
-        {
-            "type": "actions",
-            "elements": buttons
-        }
-    ]
+if metrics.METRICS_ENABLED:
+    # first, so listener timings include the rest of the middleware
+    app.middleware(metrics.start_timer)
+
+# repeated deliveries (Slack retries, double-clicks) stop here (see dedup.py)
+app.middleware(skip_duplicates)
+# while a trace is being recorded, interactions are appended to it
+app.middleware(trace_middleware)
+
+
+@app.middleware
+def queue_responses(context, next):
+    # listeners keep calling respond(...); with OUTBOUND_ASYNC the reply is
+    # queued on the outbound dispatcher (see outbound.py)
+    if OUTBOUND_ASYNC and context.response_url:
+        context["respond"] = QueuedRespond(context.response_url, dispatcher)
+    next()
+
+
+if metrics.METRICS_ENABLED:
+    metrics.watch_stores([quiz.sessions, quiz.history, adventure_sessions])
+    metrics.watch_dispatcher(dispatcher)
+
+# memory-store sessions survive restarts with SESSION_JOURNAL_DIR set
+# (see session_journal.py); under gunicorn, in each worker (see prefork.py)
+if journal is not None:
+    prefork.per_worker(journal.start)
+
+# `kill -USR2 <pid>` turns the profiler on or off
+prefork.per_worker(profiler.install_signal)
 
 # ── SLASH COMMAND ────────────────────────────────────────────
+# game logic lives in cyberquestquiz.py; listeners only ack and respond
 
 
 @app.command("/cyberquest")
+@metrics.listener("start_quiz")
 def start_quiz(ack, respond, command):
     ack()
-    respond(blocks=start_ui, text="Ready for CyberQuest!")
+    words = command.get("text", "").lower().split()
+    # `/cyberquest stats`: your totals and the leaderboards (see events.py)
+    if words[:1] in (["stats"], ["leaderboard"]):
+        return respond(**events.stats_message(command["user_id"], events.origin(command)))
+    # `/cyberquest tournament [rounds]`: the whole channel plays (see tournament.py)
+    if words[:1] == ["tournament"]:
+        return start_tournament(command, respond, words[1:])
+    respond(**quiz.start_menu())
 
 # ── START QUIZ BUTTON ────────────────────────────────────────
 
 
 @app.action("start_game_click")
+@metrics.listener("handle_start_click")
 def handle_start_click(ack, body, respond):
     ack()
-    user = body["user"]["id"]
-    queue = list(range(len(QUESTIONS)))
-    random.shuffle(queue)
-    sessions[user] = {"queue": queue, "step": 0, "correct": 0, "wrong": 0}
-
-    q_idx = queue[0]
-    blocks = build_question_blocks(q_idx, 0, 0, 0)
-    respond(
-        replace_original=True,
-        blocks=blocks,
-        text=QUESTIONS[q_idx]["q"]
-    )
+    respond(**quiz.start_game(body["user"]["id"], events.origin(body)))
 
 # ── ANSWER HANDLER ──────────────────────────────────────────
 
 
 @app.action(re.compile(r"^answer_[A-D]$"))
+@metrics.listener("handle_answer")
 def handle_answer(ack, body, respond):
     ack()
-    user = body["user"]["id"]
-    state = sessions.get(user)
-    if not state:
-        return respond(text="❗ No active game. Type `/cyberquest` to start.")
-
-    data = json.loads(body["actions"][0]["value"])
-    q_idx = data["q_idx"]
-    step = data["step"]
-    correct = data["c"]
-    wrong = data["w"]
-    orig_id = data["orig_id"]
-
-    q = QUESTIONS[q_idx]
-    opt = next(o for o in q["options"] if o["id"] == orig_id)
-
-    if opt["ok"]:
-        correct += 1
-        feedback_emoji = "🟢"
-        feedback_text = "*Correct!*"
-    else:
-        wrong += 1
-        feedback_emoji = "🔴"
-        feedback_text = "*Incorrect.*"
-
-    sessions[user]["correct"] = correct
-    sessions[user]["wrong"] = wrong
-
-    if correct >= WIN_AT:
-        del sessions[user]
-        return respond(
-            replace_original=True,
-            text=f"🏆 You win! {correct}/{WIN_AT} correct. Type `/cyberquest` to play again."
-        )
-    if wrong >= LOSE_AT:
-        del sessions[user]
-        return respond(
-            replace_original=True,
-            text=f"💀 Game over! {wrong}/{LOSE_AT} wrong. Type `/cyberquest` to try again."
-        )
-
-    feedback_blocks = [
-        {
-            "type": "section",
-            "text": {"type": "mrkdwn", "text": f"{feedback_emoji} {feedback_text}\n{opt['why']}"}
-        },
-        {
-            "type": "actions",
-            "elements": [
-                {
-                    "type": "button",
-                    "text": {"type": "plain_text", "text": "Next ▶️"},
-                    "action_id": "next_click",
-                    "value": json.dumps({"step": step})
-                }
-            ]
-        }
-    ]
-    respond(replace_original=True, blocks=feedback_blocks)
+    respond(**quiz.answer(body["user"]["id"], body["actions"][0]["value"], events.origin(body)))
 
 # ── NEXT BUTTON ──────────────────────────────────────────────
 
 
 @app.action("next_click")
+@metrics.listener("handle_next")
 def handle_next(ack, body, respond):
     ack()
-    user = body["user"]["id"]
-    state = sessions.get(user)
-    if not state:
-        return respond(text="❗ No active game. Type `/cyberquest` to start.")
-
-    state["step"] += 1
-    idx = state["step"]
-    queue = state["queue"]
-    if idx >= len(queue):
-        random.shuffle(queue)
-        state["step"], idx = 0, 0
-    q_idx = queue[idx]
-
-    blocks = build_question_blocks(
-        q_idx,
-        state["correct"],
-        state["wrong"],
-        state["step"]
-    )
-    respond(
-        replace_original=True,
-        blocks=blocks,
-        text=QUESTIONS[q_idx]["q"]
-    )
+    respond(**quiz.next_question(body["user"]["id"], body["actions"][0]["value"]))
+
+
+# ── TOURNAMENT MODE ─────────────────────────────────────────
+# standings edits are coalesced and sent through the outbound dispatcher
+tournaments = Tournaments(
+    lambda method, **payload: dispatcher.api(method, SLACK_BOT_TOKEN, **payload))
+
+
+def start_tournament(command, respond, args):
+    rounds = int(args[0]) if args and args[0].isdigit() else TOURNAMENT_ROUNDS
+    t = tournaments.create(events.origin(command), command["user_id"], rounds)
+    try:
+        posted = app.client.chat_postMessage(channel=t.channel, **tournaments.message(t))
+    except SlackApiError:
+        return respond(text=NOT_IN_CHANNEL)
+    tournaments.posted(t, posted["ts"])
+
+
+@app.action(re.compile(r"^tourney_[A-D]$"))
+@metrics.listener("tournament_answer")
+def handle_tournament_answer(ack, body, respond):
+    ack()
+    respond(**tournaments.answer(body["user"]["id"], body["actions"][0]["value"]))
 
 
 # ── ADVENTURE MODE ──────────────────────────────────────────
-MY_USER_ID = "U06N9F2BV4P"  # your Slack user ID here
+# display names, cached and refreshed off the request path (see profile_cache.py)
+PROFILES = DisplayNameCache(
+    lambda user_id: display_name(app.client.users_info(user=user_id)["user"]["profile"]))
 
 
 @app.action("start_adventure_click")
-def start_adventure_click(ack, body, respond, client):
+@metrics.listener("start_adventure_click")
+def start_adventure_click(ack, body, respond):
     ack()
     user_id = body["user"]["id"]
 
-    # fetch the user's Slack display name
-    profile = client.users_info(user=user_id)["user"]["profile"]
-    display_name = profile.get("display_name") or profile.get(
-        "real_name") or "Player"
-
-    if user_id != MY_USER_ID:
-        return respond(
-            text="🛠️ *Adventure Mode is coming soon!* Stay tuned for a more immersive training experience.",
-            replace_original=False
-        )
+    if not adventure_allowed(user_id):
+        return respond(text=COMING_SOON, replace_original=False)
 
     # launch the adventure for you
-    blocks = handle_adventure_start(user_id, display_name)
+    blocks = handle_adventure_start(user_id, PROFILES.get(user_id), events.origin(body))
     respond(replace_original=True, blocks=blocks)
 
 
 # ── ADVENTURE CHOICE HANDLER ─────────────────────────────────
 # note: regex is r"^adv_\d+$", not with a double backslash
 @app.action(re.compile(r"^adv_\d+$"))
+@metrics.listener("adventure_choice")
 def handle_adventure_choice_action(ack, body, respond):
     ack()
 
-    # value has "user_id:choice_idx"
+    # value is the signed game state (see payloads.py)
     value = body["actions"][0]["value"]
 
-    blocks = handle_adventure_choice(None, value)
+    blocks = handle_adventure_choice(body["user"]["id"], value, PROFILES.get, events.origin(body))
+
+    # a stale button gets a separate note, so the current scene stays
+    respond(replace_original=blocks is not STALE_BUTTON, blocks=blocks)
 
-    respond(replace_original=True, blocks=blocks)
+
+# ── PROFILE UPDATES ─────────────────────────────────────────
+@app.event("user_change")
+def refresh_profile(event):
+    user = event["user"]
+    PROFILES.put(user["id"], display_name(user.get("profile", {})))
 
 
 # ── FLASK ROUTES & HEALTH ───────────────────────────────────
 @flask_app.route("/slack/commands", methods=["POST"])
 def slack_commands():
-    return handler.handle(request)
+    with profiler.request():
+        return handler.handle(request)
 
 
 @flask_app.route("/slack/interactive", methods=["POST"])
 def slack_interactive():
+    with profiler.request():
+        return handler.handle(request)
+
+
+@flask_app.route("/slack/events", methods=["POST"])
+def slack_events():
     return handler.handle(request)
 
 
+@flask_app.route("/stats", methods=["GET"])
+def stats():
+    # session counts, evictions and memory use per store, outbound queue;
+    # needs PROFILE_TOKEN like /debug/profile
+    if not profiler.authorized(request.headers.get("Authorization")):
+        return "Not Found", 404
+    stats = {s.namespace: s.stats() for s in (quiz.sessions, quiz.history, adventure_sessions)}
+    stats["outbound"] = dispatcher.stats()
+    stats["dedup"] = deliveries.stats()
+    stats["events"] = events.log.stats()
+    stats["tournaments"] = tournaments.stats()
+    if journal is not None:
+        stats["journal"] = journal.stats()
+    stats["profiler"] = profiler.stats()
+    return stats
+
+
+@flask_app.route("/debug/profile", methods=["GET", "POST"])
+def debug_profile():
+    # on/off and folded stacks; needs PROFILE_TOKEN (see profiler.py)
+    status, content_type, body = profiler.control(
+        request.method, request.values, request.headers.get("Authorization"))
+    return Response(body, status=status, content_type=content_type)
+
+
+@flask_app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    # Prometheus text format; set METRICS_ENABLED=1 to collect (see metrics.py)
+    if not metrics.METRICS_ENABLED:
+        return "metrics are disabled", 404
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
 @flask_app.route("/", methods=["GET"])
 def health():
     return "🟢 CyberQuest is alive", 200
@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# slacky2 and asgi_app call auth.test when they are imported, so everything
+# is pointed at the load test's stub Slack before any app module loads
+from loadtest import StubSlack  # noqa: E402
+
+stub = StubSlack().start()
+os.environ.update({"SLACK_API_URL": f"{stub.base}/api/", "SLACK_BOT_TOKEN": "xoxb-test",
+                   "SLACK_SIGNING_SECRET": "test", "ADVENTURE_USERS": "*",
+                   "EVENTS_DB": os.path.join(tempfile.mkdtemp(), "events.db")})
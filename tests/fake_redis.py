@@ -0,0 +1,124 @@
+# tests/fake_redis.py
+#
+# Just enough of the redis-py client for RedisStore: get/set/delete/exists,
+# scan_iter, and pipelines with WATCH/MULTI/EXEC. A watched key written by
+# anyone else before execute() makes it raise WatchError, like the server.
+
+import fnmatch
+import threading
+import time
+
+
+class WatchError(Exception):
+    pass
+
+
+class FakeRedis:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._data = {}      # name → (value, expires at or None)
+        self._versions = {}  # name → writes so far
+        self._lock = threading.Lock()
+        self.watch_errors = 0
+
+    def _live(self, name):
+        entry = self._data.get(name)
+        if entry is not None and entry[1] is not None and entry[1] <= self.clock():
+            del self._data[name]
+            self._bump(name)
+            return None
+        return entry
+
+    def _bump(self, name):
+        self._versions[name] = self._versions.get(name, 0) + 1
+
+    def _set(self, name, value, ex=None):
+        self._data[name] = (value, None if ex is None else self.clock() + ex)
+        self._bump(name)
+
+    def _delete(self, name):
+        if self._data.pop(name, None) is not None:
+            self._bump(name)
+
+    def get(self, name):
+        with self._lock:
+            entry = self._live(name)
+            return entry[0] if entry else None
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._set(name, value, ex)
+
+    def delete(self, name):
+        with self._lock:
+            self._delete(name)
+
+    def exists(self, name):
+        with self._lock:
+            return int(self._live(name) is not None)
+
+    def scan_iter(self, match="*"):
+        with self._lock:
+            names = [n for n in list(self._data) if self._live(n) and fnmatch.fnmatchcase(n, match)]
+        yield from names
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self._client = client
+        self._watched = {}
+        self._queue = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._watched, self._queue = {}, None
+
+    def watch(self, *names):
+        with self._client._lock:
+            for name in names:
+                self._client._live(name)
+                self._watched[name] = self._client._versions.get(name, 0)
+
+    def get(self, name):
+        if self._queue is not None:
+            self._queue.append(("get", name))
+            return self
+        return self._client.get(name)
+
+    def multi(self):
+        self._queue = []
+
+    def set(self, name, value, ex=None):
+        self._queue.append(("set", name, value, ex))
+        return self
+
+    def delete(self, name):
+        self._queue.append(("delete", name))
+        return self
+
+    def execute(self):
+        client = self._client
+        with client._lock:
+            for name, version in self._watched.items():
+                client._live(name)
+                if client._versions.get(name, 0) != version:
+                    client.watch_errors += 1
+                    raise WatchError(f"Watched variable changed: {name}")
+            results = []
+            for op, name, *args in self._queue or ():
+                if op == "set":
+                    client._set(name, *args)
+                    results.append(True)
+                elif op == "delete":
+                    client._delete(name)
+                    results.append(1)
+                else:
+                    entry = client._live(name)
+                    results.append(entry[0] if entry else None)
+        self._watched, self._queue = {}, None
+        return results
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import threading
+
+import pytest
+
+from test_outbound import OK, api_reply, server  # noqa: F401  (fixture)
+
+
+@pytest.fixture(scope="module")
+def asgi_app():
+    import asgi_app
+    return asgi_app
+
+
+def post(asgi_app, url: str) -> dict:
+    http = asgi_app.SlackHTTP(asgi_app.app.client, retries=3, backoff=0.01, timeout=5)
+
+    async def run():
+        try:
+            await http.post(url, {"text": "hi"})
+        finally:
+            await http.close()
+    asyncio.run(run())
+    return http.stats()
+
+
+def test_plain_ok_is_sent(asgi_app, server):  # noqa: F811
+    srv = server(OK)
+    stats = post(asgi_app, srv.url + "/respond")
+    assert (stats["sent"], stats["failed"], stats["retried"]) == (1, 0, 0)
+
+
+def test_api_ok_false_is_a_failure(asgi_app, server):  # noqa: F811
+    srv = server(api_reply(ok=False, error="channel_not_found"))
+    stats = post(asgi_app, srv.url + "/chat.postMessage")
+    assert (stats["sent"], stats["failed"], stats["retried"]) == (0, 1, 0)
+    assert len(srv.requests) == 1
+
+
+def test_api_ratelimited_is_retried(asgi_app, server):  # noqa: F811
+    srv = server(api_reply(ok=False, error="ratelimited"), api_reply(ok=True))
+    stats = post(asgi_app, srv.url + "/chat.update")
+    assert (stats["sent"], stats["failed"], stats["retried"]) == (1, 0, 1)
+    assert len(srv.requests) == 2
+
+
+def test_cancelled_scheduler_call_is_logged(asgi_app, monkeypatch, caplog):
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    started = threading.Event()
+
+    async def api_call(method, json):
+        started.set()
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(asgi_app.app.client, "api_call", api_call)
+    monkeypatch.setattr(asgi_app, "_loop", loop)
+    futures = []
+    submit = asyncio.run_coroutine_threadsafe
+    monkeypatch.setattr(asyncio, "run_coroutine_threadsafe",
+                        lambda coro, loop: futures.append(submit(coro, loop)) or futures[-1])
+    with caplog.at_level(logging.WARNING):
+        asgi_app._api_from_scheduler("chat.update", channel="C1", ts="1.0")
+        assert started.wait(5)
+        # e.g. the loop shutting down; done callbacks run in cancel()
+        futures[0].cancel()
+    assert [r.getMessage() for r in caplog.records] == ["chat.update cancelled"]
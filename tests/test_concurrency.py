@@ -0,0 +1,192 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import cyberquestadv as adv
+import cyberquestquiz as quiz
+import events
+from game_state import QuizSession
+from scene_graph import MAX_SCORE, MIN_SCORE
+from session_store import MemoryStore, SQLiteStore
+
+THREADS = 8
+ROUNDS = 20
+
+
+@pytest.fixture(autouse=True)
+def interleave():
+    # switch often, so threads interleave inside the read-modify-write
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    log = events.EventLog(str(tmp_path / "events.db"))
+    monkeypatch.setattr(events, "log", log)
+    return log
+
+
+def counts(log, user: str) -> dict:
+    """{kind: (events, sum of value)} for one user."""
+    log.flush()
+    rows = log._conn().execute(
+        "SELECT kind, count(*), sum(value) FROM events WHERE user = ? GROUP BY kind", (user,))
+    return {kind: (n, total) for kind, n, total in rows}
+
+
+def hammer(threads: int, target) -> None:
+    """Run target(i) on `threads` threads released together."""
+    barrier = threading.Barrier(threads)
+
+    def run(i):
+        barrier.wait()
+        target(i)
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+
+def race(click) -> list:
+    """All threads make the same click; returns the replies that weren't stale."""
+    replies = [None] * THREADS
+    hammer(THREADS, lambda i: replies.__setitem__(i, click()))
+    return [r for r in replies if r is not None]
+
+
+def first_button(blocks) -> str:
+    return blocks[-1]["elements"][0]["value"]
+
+
+def bump(current):
+    state = current or QuizSession(0, 0)
+    # a little work between read and write widens any race
+    state = QuizSession(state.version, state.seed, state.step, state.correct + 1, state.wrong)
+    time.sleep(0)
+    return state, None
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_store_keeps_every_update(backend, tmp_path):
+    if backend == "memory":
+        store = MemoryStore("stress", QuizSession)
+    else:
+        store = SQLiteStore("stress", QuizSession, path=os.path.join(tmp_path, "s.db"))
+
+    def work(i):
+        for _ in range(ROUNDS):
+            store.update("hot", bump)
+            store.update(f"user-{i}", bump)
+
+    hammer(THREADS, work)
+    assert store.get("hot").correct == THREADS * ROUNDS
+    assert [store.get(f"user-{i}").correct for i in range(THREADS)] == [ROUNDS] * THREADS
+    assert len(store) == THREADS + 1
+
+
+def test_quiz_counts_one_click_per_turn(log):
+    user = "USTRESSQUIZ"
+    games, answered, correct, ended, won = 1, 0, 0, 0, 0
+
+    def answer(value):
+        reply = quiz.answer(user, value)
+        return None if reply.get("text") == quiz.STALE_BUTTON else reply
+
+    def next_question(value):
+        reply = quiz.next_question(user, value)
+        return None if reply.get("text") == quiz.STALE_BUTTON else reply
+
+    message = quiz.start_game(user)
+    for _ in range(ROUNDS):
+        value = first_button(message["blocks"])
+        fresh = race(lambda: answer(value))
+        assert len(fresh) == 1
+        answered += 1
+        session = quiz.sessions.get(user)
+        assert session.correct + session.wrong == answered
+        if "blocks" not in fresh[0]:
+            # won or lost; the final score stays until the next game
+            assert session.correct >= quiz.WIN_AT or session.wrong >= quiz.LOSE_AT
+            correct += session.correct
+            ended += 1
+            won += session.correct >= quiz.WIN_AT
+            games += 1
+            message, answered = quiz.start_game(user), 0
+            continue
+        fresh = race(lambda: next_question(first_button(fresh[0]["blocks"])))
+        assert len(fresh) == 1
+        message = fresh[0]
+    if answered:
+        correct += quiz.sessions.get(user).correct
+
+    got = counts(log, user)
+    assert got[events.QUIZ_START] == (games, 0)
+    assert got[events.ANSWER] == (ROUNDS, correct)
+    assert got.get(events.QUIZ_END, (0, 0)) == (ended, won)
+
+
+def test_adventure_counts_one_choice_per_scene(log):
+    user = "USTRESSADV"
+    starts, chosen, ended, score, changes = 1, 0, 0, 0, 0
+    blocks = adv.handle_adventure_start(user, "Stress")
+    graph = adv.STORY.head()[1]
+
+    def choose(value):
+        result = adv.handle_adventure_choice(user, value, lambda _: "Stress")
+        return None if result is adv.STALE_BUTTON else result
+
+    for _ in range(ROUNDS):
+        if len(blocks) < 2:
+            # reached an ending
+            ended += 1
+            blocks, score = adv.handle_adventure_start(user, "Stress"), 0
+            starts += 1
+            continue
+        scene = adv.adventure_sessions.get(user).current_scene
+        change = graph[scene].choices[0].score_change
+        fresh = race(lambda: choose(first_button(blocks)))
+        assert len(fresh) == 1
+        chosen += 1
+        changes += change
+        score = min(MAX_SCORE, max(MIN_SCORE, score + change))
+        assert adv.adventure_sessions.get(user).score == score
+        blocks = fresh[0]
+
+    got = counts(log, user)
+    assert got[events.ADVENTURE_START][0] == starts
+    assert got[events.CHOICE] == (chosen, changes)
+    assert got.get(events.ADVENTURE_END, (0, 0))[0] == ended + (len(blocks) < 2)
+
+
+def test_quiz_players_on_separate_threads(log):
+    answered = [0] * THREADS
+    games = [1] * THREADS
+
+    def play(i):
+        user = f"USTRESSPLAYER{i}"
+        message = quiz.start_game(user)
+        for _ in range(ROUNDS):
+            reply = quiz.answer(user, first_button(message["blocks"]))
+            answered[i] += 1
+            if "blocks" not in reply:
+                message, answered[i] = quiz.start_game(user), 0
+                games[i] += 1
+                continue
+            message = quiz.next_question(user, first_button(reply["blocks"]))
+
+    hammer(THREADS, play)
+    for i in range(THREADS):
+        user = f"USTRESSPLAYER{i}"
+        session = quiz.sessions.get(user)
+        assert session.correct + session.wrong == answered[i]
+        got = counts(log, user)
+        assert got[events.QUIZ_START][0] == games[i]
+        assert got[events.ANSWER][0] == ROUNDS
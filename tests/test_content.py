@@ -0,0 +1,38 @@
+import os
+import threading
+import time
+
+from content import ContentSource
+
+
+def slow_loader(loaded: list, gate: threading.Event):
+    def load(path):
+        if loaded:
+            gate.wait(5)
+        with open(path) as f:
+            loaded.append(f.read())
+        return loaded[-1]
+    return load
+
+
+def test_unknown_version_reloads_in_the_background(tmp_path):
+    path = tmp_path / "content.txt"
+    path.write_text("one")
+    loaded, gate = [], threading.Event()
+    source = ContentSource("test", str(path), slow_loader(loaded, gate))
+    first = source.version
+
+    path.write_text("two")
+    os.utime(path, ns=(0, time.time_ns() + 10**9))
+    started = time.monotonic()
+    assert source.get(first + 1) is None  # doesn't wait for the loader
+    assert time.monotonic() - started < 1
+    assert source.version == first
+
+    gate.set()
+    deadline = time.monotonic() + 5
+    while source.version == first and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert source.current == "two"
+    assert source.get(first) == "one"
+    assert loaded == ["one", "two"]
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import cyberquestquiz
+from dedup import DedupCache, skip_duplicates
+
+
+def click(user: str, action_id: str, value: str, message_ts: str = "1.0") -> dict:
+    return {"type": "block_actions", "user": {"id": user},
+            "container": {"message_ts": message_ts},
+            "actions": [{"action_id": action_id, "value": value}]}
+
+
+def answer_values(user: str) -> list:
+    blocks = cyberquestquiz.start_game(user)["blocks"]
+    return [e["value"] for e in blocks[-1]["elements"]]
+
+
+def test_slack_retry_is_dropped():
+    cache = DedupCache()
+    event = {"type": "event_callback", "event_id": "Ev1", "event": {"type": "user_change"}}
+    assert not cache.check(event, {})
+    assert cache.check(event, {"x-slack-retry-num": ["1"]})
+    assert cache.check(event, {"x-slack-retry-num": ["2"]})
+    assert cache.stats() == {"size": 1, "duplicates": 2, "retries": 2}
+
+
+def test_retry_of_a_plain_button_is_dropped():
+    cache = DedupCache()
+    body = click("U1", "start_adventure_click", "start_adventure")
+    assert not cache.check(body, {})
+    assert cache.check(body, {"x-slack-retry-num": ["1"]})
+
+
+def test_double_click_on_a_game_button_is_dropped():
+    cache = DedupCache()
+    body = click("UDEDUP", "answer_click_0", answer_values("UDEDUP")[0])
+    assert not cache.check(body, {})
+    assert cache.check(body, {})
+    assert cache.stats()["duplicates"] == 1
+
+
+def test_second_click_on_a_plain_button_is_handled():
+    # e.g. someone not allowed into the adventure trying again
+    cache = DedupCache()
+    body = click("U1", "start_adventure_click", "start_adventure")
+    assert not cache.check(body, {})
+    assert not cache.check(body, {})
+    # a value signed for someone else is not a game button for this user
+    forged = click("U2", "answer_click_0", answer_values("UDEDUP")[0])
+    assert not cache.check(forged, {})
+    assert not cache.check(forged, {})
+    assert cache.stats()["duplicates"] == 0
+
+
+def test_separate_turns_have_separate_keys():
+    cache = DedupCache()
+    first, second = answer_values("UDEDUP"), answer_values("UDEDUP")
+    # two options of one question, and the same option of the next game
+    for value in (first[0], first[1], second[0]):
+        assert not cache.check(click("UDEDUP", "answer_click_0", value), {})
+    # the same button on another message
+    assert not cache.check(click("UDEDUP", "answer_click_0", first[0], "2.0"), {})
+    assert cache.stats()["size"] == 4
+
+
+def test_middleware_answers_repeats_without_running_listeners(monkeypatch):
+    monkeypatch.setattr("dedup.deliveries", DedupCache())
+    body = click("UDEDUP", "answer_click_0", answer_values("UDEDUP")[0])
+    request = SimpleNamespace(headers={})
+    calls = []
+    assert skip_duplicates(body, request, lambda: calls.append(1)) is None
+    resp = skip_duplicates(body, request, lambda: calls.append(1))
+    assert (resp.status, resp.body, calls) == (200, "", [1])
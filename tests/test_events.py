@@ -0,0 +1,9 @@
+import events
+
+
+def test_event_log_reconnects_after_fork(tmp_path, monkeypatch):
+    log = events.EventLog(str(tmp_path / "events.db"))
+    conn = log._conn()
+    assert log._conn() is conn
+    monkeypatch.setattr(events.os, "getpid", lambda: -1)
+    assert log._conn() is not conn
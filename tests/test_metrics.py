@@ -0,0 +1,28 @@
+import metrics
+from game_state import QuizSession
+from session_store import MemoryStore
+
+
+class CountingStore(MemoryStore):
+    calls = 0
+
+    def stats(self) -> dict:
+        self.calls += 1
+        return super().stats()
+
+
+def test_store_stats_are_read_once_per_scrape(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, "registry", registry)
+    quiz, history = CountingStore("quiz", QuizSession), CountingStore("history")
+    quiz.set("U1", QuizSession(1, 0))
+    metrics.watch_stores([quiz, history])
+
+    text = registry.render()
+    assert (quiz.calls, history.calls) == (1, 1)
+    assert 'cyberquest_sessions{store="quiz"} 1' in text
+    assert 'cyberquest_sessions{store="history"} 0' in text
+    assert f'cyberquest_session_store_bytes{{store="quiz"}} {quiz.memory_bytes()}' in text
+
+    registry.render()
+    assert (quiz.calls, history.calls) == (2, 2)
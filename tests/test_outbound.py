@@ -0,0 +1,189 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from outbound import Dispatcher
+
+OK = (200, {"Content-Type": "text/plain"}, b"ok")
+
+
+def api_reply(**body):
+    return 200, {"Content-Type": "application/json"}, json.dumps(body).encode()
+
+
+class StubServer(ThreadingHTTPServer):
+    """Answers each POST with the next scripted reply, then with OK.
+
+    A reply is (status, headers, body), or "drop" to close the connection
+    without answering.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, *script):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.script = list(script)
+        self.requests = []  # (client port, path, JSON body)
+        self.received = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_reply(self, port: int, path: str, body: bytes):
+        with self._lock:
+            self.requests.append((port, path, json.loads(body)))
+            reply = self.script.pop(0) if self.script else OK
+        self.received.set()
+        self.release.wait(5)
+        return reply
+
+    def ports(self) -> list:
+        return [port for port, _, _ in self.requests]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        reply = self.server.next_reply(self.client_address[1], self.path, body)
+        if reply == "drop":
+            self.close_connection = True
+            return
+        status, headers, data = reply
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if headers.get("Connection") == "close":
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def make(*script):
+        servers.append(StubServer(*script))
+        return servers[-1]
+    yield make
+    for s in servers:
+        s.shutdown()
+        s.server_close()
+
+
+def dispatcher(**kwargs):
+    return Dispatcher(**{"workers": 1, "retries": 3, "backoff": 0.01, "timeout": 5, **kwargs})
+
+
+def send(d: Dispatcher, url: str, n: int = 1) -> dict:
+    for i in range(n):
+        d.post(url + "/respond", {"i": i})
+    d.drain()
+    return d.stats()
+
+
+def test_429_waits_for_retry_after(server):
+    srv = server((429, {"Retry-After": "1"}, b""))
+    d = dispatcher(backoff=30)  # only Retry-After can make this quick
+    started = time.monotonic()
+    stats = send(d, srv.url)
+    assert 1 <= time.monotonic() - started < 5
+    assert (stats["sent"], stats["failed"], stats["retried"]) == (1, 0, 1)
+    assert len(srv.requests) == 2
+
+
+def test_5xx_is_retried_with_backoff(server):
+    srv = server((503, {}, b""), (502, {}, b""))
+    stats = send(dispatcher(), srv.url)
+    assert (stats["sent"], stats["failed"], stats["retried"]) == (1, 0, 2)
+
+
+def test_gives_up_after_every_retry(server):
+    srv = server(*[(500, {}, b"")] * 4)
+    results = []
+    d = dispatcher()
+    d.on_result = lambda url, ok, elapsed: results.append(ok)
+    stats = send(d, srv.url)
+    assert (stats["sent"], stats["failed"], stats["retried"]) == (0, 1, 3)
+    assert len(srv.requests) == 4
+    assert results == [False]
+
+
+def test_4xx_is_not_retried(server):
+    srv = server((404, {}, b""))
+    stats = send(dispatcher(), srv.url)
+    assert (stats["sent"], stats["failed"], stats["retried"]) == (0, 1, 0)
+
+
+def test_dropped_connection_is_retried(server):
+    srv = server("drop")
+    stats = send(dispatcher(), srv.url)
+    assert (stats["sent"], stats["failed"], stats["retried"]) == (1, 0, 1)
+    assert len(srv.requests) == 2
+
+
+def test_connection_is_kept_alive(server):
+    srv = server()
+    stats = send(dispatcher(), srv.url, n=5)
+    assert stats["sent"] == 5
+    assert len(set(srv.ports())) == 1
+
+
+def test_connection_close_opens_a_new_connection(server):
+    srv = server((200, {"Connection": "close"}, b"ok"))
+    stats = send(dispatcher(), srv.url, n=3)
+    assert (stats["sent"], stats["failed"], stats["retried"]) == (3, 0, 0)
+    ports = srv.ports()
+    assert ports[0] != ports[1] and ports[1] == ports[2]
+
+
+def test_api_ok_false_is_a_failure(server, monkeypatch):
+    monkeypatch.setattr("outbound.SLACK_API_URL", "")
+    srv = server(api_reply(ok=False, error="message_not_found"))
+    d = dispatcher()
+    d.api(srv.url + "/chat.update", "xoxb-test", channel="C1", ts="1.0", text="hi")
+    d.drain()
+    stats = d.stats()
+    assert (stats["sent"], stats["failed"], stats["retried"]) == (0, 1, 0)
+
+
+def test_api_ratelimited_is_retried(server, monkeypatch):
+    monkeypatch.setattr("outbound.SLACK_API_URL", "")
+    srv = server(api_reply(ok=False, error="ratelimited"), api_reply(ok=True, ts="1.0"))
+    d = dispatcher()
+    d.api(srv.url + "/chat.update", "xoxb-test", channel="C1", ts="1.0", text="hi")
+    d.drain()
+    stats = d.stats()
+    assert (stats["sent"], stats["failed"], stats["retried"]) == (1, 0, 1)
+    assert [path for _, path, _ in srv.requests] == ["/chat.update"] * 2
+
+
+def test_full_queue_drops_instead_of_blocking(server):
+    srv = server()
+    srv.release.clear()
+    d = dispatcher(max_queue=1)
+    d.post(srv.url + "/respond", {"i": 0})
+    assert srv.received.wait(5)  # the worker is busy with the first job
+    d.post(srv.url + "/respond", {"i": 1})  # queued
+    started = time.monotonic()
+    d.post(srv.url + "/respond", {"i": 2})  # no room
+    assert time.monotonic() - started < 0.5
+    srv.release.set()
+    d.drain()
+    stats = d.stats()
+    assert (stats["sent"], stats["dropped"]) == (2, 1)
+    assert [body["i"] for _, _, body in srv.requests] == [0, 1]
@@ -0,0 +1,41 @@
+import pytest
+
+import cyberquestquiz
+from game_state import QuizSession
+from payloads import ADVENTURE, QUIZ_ANSWER, QUIZ_NEXT, InvalidPayload, Signer
+
+signer = Signer(b"test")
+
+
+@pytest.mark.parametrize("kind, fields, tail", [
+    (QUIZ_ANSWER, (7, 2**32 - 1, 123456, 65535, 300, 49999, 3), ()),
+    (QUIZ_NEXT, (7, 12345, 0, 256, 65535), ()),
+    (ADVENTURE, (7, 65535, -32768, 255), (1, 0, 65535)),
+])
+def test_round_trip(kind, fields, tail):
+    value = signer.sign("U1", kind, fields, tail)
+    got, got_tail, _ = signer.verify("U1", value, kind)
+    assert (got, got_tail) == (fields, tail)
+    assert signer.signed("U1", value)
+    assert not signer.signed("U2", value)
+    with pytest.raises(InvalidPayload):
+        signer.verify("U2", value, kind)
+
+
+def test_quiz_counts_past_255(monkeypatch):
+    # a long game: more than a u8 of answers on either side
+    monkeypatch.setattr(cyberquestquiz, "WIN_AT", 1000)
+    monkeypatch.setattr(cyberquestquiz, "LOSE_AT", 1000)
+    user = "ULONGGAME"
+    cyberquestquiz.start_game(user)
+    version, quiz = cyberquestquiz.QUIZ.head()
+    state = QuizSession(version, 1, 0, 400, 300)
+    cyberquestquiz.sessions.set(user, state)
+    message = cyberquestquiz.question_message(user, quiz, state)
+    value = message["blocks"][-1]["elements"][0]["value"]
+
+    reply = cyberquestquiz.answer(user, value)
+    session = cyberquestquiz.sessions.get(user)
+    assert (session.correct, session.wrong) in ((401, 300), (400, 301))
+    value = reply["blocks"][-1]["elements"][0]["value"]
+    assert "blocks" in cyberquestquiz.next_question(user, value)
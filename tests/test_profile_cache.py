@@ -0,0 +1,149 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import profile_cache
+from profile_cache import DEFAULT_NAME, DisplayNameCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def install(self, monkeypatch):
+        # only profile_cache sees it; asyncio and threading keep real time
+        monkeypatch.setattr(profile_cache, "time", SimpleNamespace(monotonic=self))
+        return self
+
+
+class SlowFetch:
+    """fetch() that blocks until released and counts its calls."""
+
+    def __init__(self, name: str = "Ada"):
+        self.name = name
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, user_id):
+        self.calls.append(user_id)
+        assert self.release.wait(5)
+        return self.name
+
+
+def test_concurrent_misses_share_one_fetch():
+    fetch = SlowFetch()
+    cache = DisplayNameCache(fetch)
+    names = []
+    threads = [threading.Thread(target=lambda: names.append(cache.get("U1"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    while cache.misses < 8:
+        time.sleep(0.001)
+    fetch.release.set()
+    for t in threads:
+        t.join()
+
+    assert names == ["Ada"] * 8
+    assert fetch.calls == ["U1"]
+    assert cache.get("U1") == "Ada"
+    assert (cache.hits, cache.misses) == (1, 8)
+
+
+def test_failed_fetch_gives_the_default_and_is_retried():
+    calls = []
+
+    def fetch(user_id):
+        calls.append(user_id)
+        if len(calls) == 1:
+            raise OSError("users.info timed out")
+        return "Ada"
+
+    cache = DisplayNameCache(fetch)
+    assert cache.get("U1") == DEFAULT_NAME
+    assert cache.get("U1") == "Ada"
+    assert len(calls) == 2
+
+
+def test_refresh_after_serves_the_old_name_while_fetching(monkeypatch):
+    clock = Clock().install(monkeypatch)
+    fetch = SlowFetch("Ada Lovelace")
+    cache = DisplayNameCache(fetch, ttl=100, refresh_after=0.8)
+    cache.put("U1", "Ada")
+
+    clock.now += 79
+    assert cache.get("U1") == "Ada"
+    assert fetch.calls == []
+
+    clock.now += 2
+    assert cache.get("U1") == "Ada"
+    assert cache.get("U1") == "Ada"
+    fetch.release.set()
+    cache._refresher.shutdown(wait=True)
+    assert fetch.calls == ["U1"]
+    assert cache.peek("U1") == "Ada Lovelace"
+
+    # refreshed, so good for another full TTL
+    clock.now += 99
+    assert cache.peek("U1") == "Ada Lovelace"
+
+
+def test_put_and_invalidate():
+    fetch = SlowFetch("Fetched")
+    fetch.release.set()
+    cache = DisplayNameCache(fetch, max_size=2)
+
+    # a user_change event overwrites the entry without a fetch
+    cache.put("U1", "Ada")
+    cache.put("U1", "Grace")
+    assert cache.get("U1") == "Grace"
+    assert fetch.calls == []
+
+    cache.invalidate("U1")
+    assert cache.peek("U1") is None
+    assert cache.get("U1") == "Fetched"
+    assert fetch.calls == ["U1"]
+
+    # least recently used goes first
+    cache.put("U2", "Bea")
+    cache.get("U1")
+    cache.put("U3", "Cy")
+    assert cache.peek("U2") is None
+    assert cache.peek("U1") == "Fetched"
+
+
+def test_async_misses_share_one_fetch(monkeypatch):
+    clock = Clock().install(monkeypatch)
+    calls = []
+
+    async def fetch(user_id):
+        calls.append(user_id)
+        await asyncio.sleep(0.01)
+        return f"name-{len(calls)}"
+
+    cache = DisplayNameCache(fetch, ttl=100, refresh_after=0.8)
+
+    async def play():
+        names = await asyncio.gather(*(cache.aget("U1") for _ in range(8)))
+        assert names == ["name-1"] * 8
+        assert calls == ["U1"]
+
+        # past refresh_after: the old name now, the new one once fetched
+        clock.now += 90
+        assert await cache.aget("U1") == "name-1"
+        await asyncio.gather(*cache._tasks)
+        assert await cache.aget("U1") == "name-2"
+
+        # a cancelled caller doesn't cancel the fetch the others wait on
+        cache.invalidate("U1")
+        first = asyncio.ensure_future(cache.aget("U1"))
+        second = asyncio.ensure_future(cache.aget("U1"))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "name-3"
+
+    asyncio.run(play())
+    assert calls == ["U1"] * 3
@@ -0,0 +1,59 @@
+import json
+import time
+
+import profiler
+from profiler import Profiler, Trace
+
+CLICK = {"type": "block_actions", "user": {"id": "U1"}, "team": {"id": "T1"},
+         "actions": [{"action_id": "next_click", "value": "tid:1:2"}]}
+
+
+def test_trace_flush_after_close_is_ignored(tmp_path):
+    trace = Trace(str(tmp_path / "trace.jsonl"))
+    trace.record(CLICK)
+    trace.close()
+    trace.record(CLICK)
+    trace.flush()
+    lines = (tmp_path / "trace.jsonl").read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[1])["value"] == {"plain": "tid:1:2"}
+
+
+def test_stop_during_a_tick_leaves_the_sampler_running(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_TRACE", str(tmp_path / "trace.{pid}.jsonl"))
+    monkeypatch.setattr(profiler, "PROFILE_OUTPUT", str(tmp_path / "profile.{pid}.folded"))
+    p = Profiler(interval=0.001)
+    p.start(rate=1.0, seconds=60, trace=True)
+    trace = p._trace
+
+    # stop() closes the file just as the sampler thread flushes it, with a
+    # click still pending
+    original = trace.flush
+
+    def flush():
+        if p.enabled:
+            p.stop()
+            trace.record(CLICK)
+        original()
+
+    monkeypatch.setattr(trace, "flush", flush)
+    time.sleep(0.05)
+    assert not p.enabled
+
+    p.start(rate=1.0, seconds=60, trace=True)
+    p.record(CLICK)
+    deadline = time.monotonic() + 5
+    while p._trace._pending and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert p._trace._pending == []
+    p.stop()
+
+
+def test_sampler_turns_itself_off_after_the_deadline(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_OUTPUT", str(tmp_path / "profile.{pid}.folded"))
+    p = Profiler(interval=0.001)
+    p.start(rate=1.0, seconds=0.01)
+    deadline = time.monotonic() + 5
+    while p.enabled and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert not p.enabled
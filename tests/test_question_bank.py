@@ -0,0 +1,50 @@
+import json
+import os
+
+import pytest
+
+from question_bank import PackedBank, build_pack, load_bank
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def questions():
+    with open(os.path.join(ROOT, "questions.json")) as f:
+        return json.load(f)
+
+
+def test_pack_round_trip(questions, tmp_path):
+    path = str(tmp_path / "q.pack")
+    build_pack(questions, path)
+    bank = load_bank(path)
+    assert isinstance(bank, PackedBank)
+    assert len(bank) == len(questions)
+    assert [bank[i] for i in range(len(bank))] == questions
+
+
+def test_build_rejects_unplayable_questions(questions, tmp_path):
+    questions[3]["options"][0]["ok"] = not questions[3]["options"][0]["ok"]
+    path = tmp_path / "q.pack"
+    with pytest.raises(ValueError, match="question 3"):
+        build_pack(questions, str(path))
+    assert not path.exists()
+
+
+def test_load_rejects_damaged_pack(questions, tmp_path):
+    path = str(tmp_path / "q.pack")
+    build_pack(questions, path)
+    with open(path, "rb") as f:
+        raw = f.read()
+    with open(path, "wb") as f:
+        f.write(raw[:-10])
+    with pytest.raises(ValueError, match="offsets"):
+        load_bank(path)
+
+
+def test_load_validates_json_banks(questions, tmp_path):
+    questions[0]["options"] = questions[0]["options"][:1]
+    path = tmp_path / "q.json"
+    path.write_text(json.dumps(questions))
+    with pytest.raises(ValueError, match="question 0"):
+        load_bank(str(path))
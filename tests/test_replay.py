@@ -0,0 +1,43 @@
+import cyberquestadv
+import cyberquestquiz
+
+
+def buttons(blocks) -> list:
+    return [e["value"] for b in blocks if b["type"] == "actions" for e in b["elements"]]
+
+
+def test_quiz_button_without_session_expires_with_the_session_ttl(monkeypatch):
+    user = "UQUIZREPLAY"
+    value = buttons(cyberquestquiz.start_game(user)["blocks"])[0]
+
+    # another worker ran the game: the button is trusted
+    cyberquestquiz.sessions.delete(user)
+    assert cyberquestquiz.answer(user, value).get("text") != cyberquestquiz.INVALID_BUTTON
+    # the game ended long ago: it isn't
+    cyberquestquiz.sessions.delete(user)
+    monkeypatch.setattr(cyberquestquiz.sessions, "ttl", -1)
+    assert cyberquestquiz.answer(user, value)["text"] == cyberquestquiz.INVALID_BUTTON
+    assert user not in cyberquestquiz.sessions
+
+
+def test_quiz_replayed_button_is_stale_while_the_session_lives():
+    user = "UQUIZSTALE"
+    value = buttons(cyberquestquiz.start_game(user)["blocks"])[0]
+    cyberquestquiz.answer(user, value)
+    assert cyberquestquiz.answer(user, value)["text"] == cyberquestquiz.STALE_BUTTON
+
+
+def test_adventure_button_without_session_expires_with_the_session_ttl(monkeypatch):
+    user = "UADVREPLAY"
+    sessions = cyberquestadv.adventure_sessions
+    value = buttons(cyberquestadv.handle_adventure_start(user, "Tester"))[0]
+
+    def click():
+        return cyberquestadv.handle_adventure_choice(user, value, lambda u: "Tester")
+
+    sessions.delete(user)
+    assert click() not in (cyberquestadv.INVALID_BUTTON, cyberquestadv.STALE_BUTTON)
+    assert click() == cyberquestadv.STALE_BUTTON
+    sessions.delete(user)
+    monkeypatch.setattr(sessions, "ttl", -1)
+    assert click() == cyberquestadv.INVALID_BUTTON
@@ -0,0 +1,60 @@
+import pytest
+
+import cyberquestadv
+from game_state import AdventureSession
+from scene_graph import MAX_SCORE, MIN_SCORE, SceneGraphError, compile_scenes
+
+
+def story(score_change=1, condition=None):
+    choice = {"text": "Go", "next_scene": "end", "score_change": score_change}
+    if condition is not None:
+        choice["next_scene"] = [{"if": condition, "scene": "end"}, {"scene": "end"}]
+    return {"choose_role": {"description": "Start", "choices": [choice]},
+            "end": {"description": "The end", "choices": []}}
+
+
+@pytest.mark.parametrize("score_change", [MAX_SCORE + 1, MIN_SCORE - 1, "2", 1.5, True])
+def test_out_of_range_score_change_is_rejected(score_change):
+    with pytest.raises(SceneGraphError, match="score_change"):
+        compile_scenes(story(score_change))
+
+
+@pytest.mark.parametrize("condition", [{"min_score": MIN_SCORE - 1}, {"max_score": 1 << 15}])
+def test_out_of_range_score_condition_is_rejected(condition):
+    with pytest.raises(SceneGraphError, match="min_score and max_score"):
+        compile_scenes(story(condition=condition))
+
+
+@pytest.mark.parametrize("text", [None, "", "  ", 3])
+def test_choice_without_text_is_reported(text):
+    scenes = story()
+    scenes["choose_role"]["choices"].append({"next_scene": "nowhere"})
+    choice = scenes["choose_role"]["choices"][0]
+    if text is None:
+        del choice["text"]
+    else:
+        choice["text"] = text
+    with pytest.raises(SceneGraphError) as e:
+        compile_scenes(scenes)
+    # reported with the other problems, not as a KeyError
+    assert sum("text must be a non-empty string" in p for p in e.value.problems) == 2
+    assert any("nowhere" in p for p in e.value.problems)
+
+
+def test_limits_compile():
+    compile_scenes(story(MAX_SCORE, {"min_score": MIN_SCORE, "max_score": MAX_SCORE}))
+
+
+@pytest.mark.parametrize("start, change, expected", [
+    (MAX_SCORE - 1, 5, MAX_SCORE), (MIN_SCORE + 1, -5, MIN_SCORE), (10, -3, 7)])
+def test_score_is_clamped(monkeypatch, start, change, expected):
+    graph = compile_scenes(story(change))
+    monkeypatch.setattr(cyberquestadv.STORY, "get", lambda version=None: graph)
+    user = f"USCORE{start}"
+    session = AdventureSession(1, 0, "Tester", 0, start)
+    cyberquestadv.adventure_sessions.set(user, session)
+    value = cyberquestadv.build_scene_blocks(user, session, graph)
+    button = next(e["value"] for b in value if b["type"] == "actions" for e in b["elements"])
+
+    cyberquestadv.handle_adventure_choice(user, button, lambda u: "Tester")
+    assert cyberquestadv.adventure_sessions.get(user).score == expected
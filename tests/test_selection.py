@@ -0,0 +1,150 @@
+import random
+
+import pytest
+
+from game_state import QuestionHistory
+from selection import Fenwick, LineWeights, Selector
+
+
+def prefix_find(weights, u):
+    """Fenwick.find by a linear scan."""
+    for i, w in enumerate(weights):
+        if u < w:
+            return i
+        u -= w
+    return max(i for i, w in enumerate(weights) if w > 0)
+
+
+def test_fenwick_find_matches_a_linear_scan():
+    rng = random.Random(1)
+    for n in (1, 2, 7, 8, 9, 100):
+        weights = [rng.choice([0.0, 0.5, 1.0, 4.0]) for _ in range(n)]
+        weights[rng.randrange(n)] = 1.0
+        tree = Fenwick(weights)
+        assert tree.total() == pytest.approx(sum(weights))
+        for _ in range(200):
+            u = rng.random() * sum(weights)
+            assert tree.find(u) == prefix_find(weights, u)
+
+
+def test_fenwick_append_and_set_match_a_fresh_build():
+    rng = random.Random(2)
+    tree = Fenwick([])
+    weights = []
+    for _ in range(70):
+        w = rng.random()
+        tree.append(w)
+        weights.append(w)
+        i = rng.randrange(len(weights))
+        weights[i] = rng.random()
+        tree.set(i, weights[i])
+        assert list(tree.tree) == pytest.approx(list(Fenwick(weights).tree))
+
+
+def test_fenwick_find_never_lands_on_a_zero_weight():
+    tree = Fenwick([1.0, 2.0, 0.0, 0.0])
+    # rounding can leave u at or past the total
+    assert tree.find(3.0) == 1
+    assert tree.find(3.5) == 1
+    assert tree.find(0.0) == 0
+
+
+def test_line_weights_find_at_any_time():
+    rng = random.Random(3)
+    # constant weights, and ramps a·(t - s) that started at some s < 10
+    lines = []
+    for i in range(40):
+        a = rng.random()
+        lines.append((a, 0.0) if i % 3 else (-a * rng.randrange(10), a))
+    tree = LineWeights(lines)
+    for t in (10.0, 20.0, 100.0):
+        weights = [c + a * t for c, a in lines]
+        assert tree.total(t) == pytest.approx(sum(weights))
+        for _ in range(100):
+            u = rng.random() * sum(weights)
+            assert tree.find(u, t) == prefix_find(weights, u)
+
+
+def play(selector, turns, bank_size, missed=lambda q: False, h=None, rng=None):
+    rng = rng or random.Random(4)
+    for _ in range(turns):
+        q_idx = selector.pick(h, bank_size, rng)
+        h = selector.record(h, 1, q_idx, missed(q_idx), bank_size)
+    return h
+
+
+def weight_of(selector, h, q_idx, bank_size):
+    return selector._weight(h, list(h.questions).index(q_idx), selector._cooldown(bank_size))
+
+
+def test_weight_grows_with_time_since_seen():
+    selector = Selector(cooldown=3, ramp=4, known_weight=0.5, miss_boost=3.0)
+    h = selector.record(None, 1, 0, False, 100)
+    h = selector.record(h, 1, 1, True, 100)
+    weights = {0: [], 1: []}
+    for q_idx in range(10, 20):
+        for q in weights:
+            weights[q].append(weight_of(selector, h, q, 100))
+        h = selector.record(h, 1, q_idx, False, 100)
+
+    # cooling down, then a quarter more of the full weight per turn
+    assert weights[0] == pytest.approx([0, 0, 0.125, 0.25, 0.375, 0.5, 0.5, 0.5, 0.5, 0.5])
+    # a missed question ramps the same way, to 1 + 3 × 1
+    assert weights[1] == pytest.approx([0, 0, 0, 1, 2, 3, 4, 4, 4, 4])
+
+
+def test_incremental_weights_match_a_rebuild():
+    bank_size = 60
+    selector = Selector(history_size=32, cooldown=5, ramp=7)
+    h = play(selector, 500, bank_size, missed=lambda q: q % 4 == 0)
+    assert len(h) == 32
+
+    cooldown = selector._cooldown(bank_size)
+    expected = [selector._weight(h, s, cooldown) for s in range(len(h))]
+    assert [h.tree.weight(s, h.clock) for s in range(len(h))] == pytest.approx(expected, abs=1e-9)
+    assert h.tree.total(h.clock) == pytest.approx(sum(expected))
+
+    # the lookups agree with the arrays, and are rebuilt after a round trip
+    assert h.slots == {q: s for s, q in enumerate(h.questions)}
+    assert list(h.turns) == sorted(h.seen)
+    restored = QuestionHistory.unpack(h.pack())
+    selector.pick(restored, bank_size)
+    assert restored.slots == h.slots
+    assert restored.turns == h.turns
+
+
+def test_evicts_the_question_answered_longest_ago():
+    selector = Selector(history_size=4, cooldown=0)
+    h = None
+    for q_idx in (1, 2, 3, 4, 2, 5):
+        h = selector.record(h, 1, q_idx, False, 100)
+    assert sorted(h.questions) == [2, 3, 4, 5]
+    h = selector.record(h, 1, 6, False, 100)
+    assert sorted(h.questions) == [2, 4, 5, 6]
+
+
+def test_pick_skips_questions_cooling_down():
+    bank_size = 10
+    selector = Selector(cooldown=5)
+    rng = random.Random(5)
+    h, recent = None, []
+    for _ in range(300):
+        q_idx = selector.pick(h, bank_size, rng)
+        assert q_idx not in recent[-5:]
+        recent.append(q_idx)
+        h = selector.record(h, 1, q_idx, False, bank_size)
+
+
+def test_missed_questions_come_back_more_often():
+    bank_size = 40
+    selector = Selector(cooldown=5, ramp=10)
+    hard = set(range(10))
+    rng = random.Random(6)
+    h, asked = None, []
+    for _ in range(2000):
+        q_idx = selector.pick(h, bank_size, rng)
+        asked.append(q_idx)
+        h = selector.record(h, 1, q_idx, q_idx in hard, bank_size)
+    share = sum(q in hard for q in asked[500:]) / len(asked[500:])
+    # a quarter of the bank; uniform picks would give 0.25
+    assert share > 0.5
@@ -0,0 +1,55 @@
+import time
+
+from game_state import QuizSession
+from session_journal import SessionJournal
+from session_store import MemoryStore
+
+
+def worker(directory):
+    journal = SessionJournal(str(directory), flush_interval=60, snapshot_interval=1e9)
+    store = MemoryStore("quiz", QuizSession)
+    journal.attach(store)
+    return journal, store
+
+
+def test_each_worker_journals_to_its_own_segment(tmp_path):
+    (a, quiz_a), (b, quiz_b) = worker(tmp_path), worker(tmp_path)
+    a.start()
+    b.start()
+    assert a.stats()["owned"] and b.stats()["owned"]
+    assert a.segment != b.segment
+
+    quiz_a.set("UA", QuizSession(1, 1))
+    quiz_b.set("UB", QuizSession(1, 2))
+    quiz_a.set("shared", QuizSession(1, 3))
+    time.sleep(0.01)
+    quiz_b.set("shared", QuizSession(1, 4))
+    a.close()
+    b.close()
+
+    c, quiz = worker(tmp_path)
+    c.start()
+    assert (quiz.get("UA").seed, quiz.get("UB").seed, quiz.get("shared").seed) == (1, 2, 4)
+    c.close()
+
+
+def test_a_snapshot_replaces_the_journals_it_covers(tmp_path):
+    journal, quiz = worker(tmp_path)
+    journal.start()
+    quiz.set("U1", QuizSession(1, 1))
+    quiz.set("U2", QuizSession(1, 2))
+    journal.snapshot()
+    quiz.delete("U2")
+    journal.close()
+
+    again, restored = worker(tmp_path)
+    again.start()
+    assert "U1" in restored and "U2" not in restored
+    again.close()
+
+
+def test_writes_are_not_buffered_before_start(tmp_path):
+    journal, quiz = worker(tmp_path)
+    for i in range(100):
+        quiz.set(f"U{i}", QuizSession(1, i))
+    assert journal.stats()["pending"] == 0
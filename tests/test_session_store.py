@@ -0,0 +1,150 @@
+import sys
+import threading
+import time
+
+from fake_redis import FakeRedis
+from game_state import QuizSession
+from session_store import MemoryStore, RedisStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_update_is_atomic_under_contention():
+    client = FakeRedis()
+    store = RedisStore("test", QuizSession, client=client)
+    threads, per_thread = 8, 50
+    start = threading.Barrier(threads)
+
+    def bump(session):
+        session = session or QuizSession(1, 0)
+        step = session.step
+        time.sleep(0)  # let another thread in between the read and the write
+        session.step = step + 1
+        return session, session.step
+
+    def worker():
+        start.wait()
+        for _ in range(per_thread):
+            store.update("U1", bump)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    assert store.get("U1").step == threads * per_thread
+    assert client.watch_errors > 0
+
+
+def test_update_retries_after_a_concurrent_write():
+    client = FakeRedis()
+    store = RedisStore("test", QuizSession, client=client)
+    store.set("U1", QuizSession(1, 0, step=1))
+    calls = []
+
+    def fn(session):
+        calls.append(session.step)
+        if len(calls) == 1:
+            # another worker writes the key between our WATCH and EXEC
+            store.set("U1", QuizSession(1, 0, step=10))
+        session.step += 1
+        return session, session.step
+
+    assert store.update("U1", fn) == 11
+    assert calls == [1, 10]
+    assert store.get("U1").step == 11
+
+
+def test_update_returning_none_deletes():
+    store = RedisStore("test", QuizSession, client=FakeRedis())
+    store.set("U1", QuizSession(1, 0))
+    assert store.update("U1", lambda s: (None, "gone")) == "gone"
+    assert "U1" not in store
+    assert store.get("U1") is None
+
+
+def test_sessions_expire_after_ttl():
+    clock = Clock()
+    store = RedisStore("test", QuizSession, client=FakeRedis(clock), ttl=60)
+    store.set("U1", QuizSession(1, 0))
+    clock.now += 30
+    store.update("U2", lambda s: (QuizSession(1, 0), None))
+    assert len(store) == 2
+
+    clock.now += 31
+    assert store.get("U1") is None
+    assert "U1" not in store
+    assert store.get("U2") is not None
+    assert len(store) == 1
+
+    # a write refreshes the TTL
+    store.update("U2", lambda s: (s, None))
+    clock.now += 59
+    assert store.get("U2") is not None
+
+
+def test_len_and_stats_only_count_this_namespace():
+    client = FakeRedis()
+    quiz = RedisStore("quiz", QuizSession, client=client)
+    other = RedisStore("adventure", client=client)
+    for i in range(5):
+        quiz.set(f"U{i}", QuizSession(1, i))
+    other.set("U0", {"scene": 1})
+    quiz.delete("U4")
+
+    assert len(quiz) == 4
+    assert len(other) == 1
+    assert quiz.stats()["sessions"] == 4
+    assert other.get("U0") == {"scene": 1}
+
+
+def walked_bytes(store: MemoryStore) -> int:
+    return sys.getsizeof(store._data) + sum(
+        sys.getsizeof(k) + sys.getsizeof(e) + sys.getsizeof(e[1]) for k, e in store._data.items())
+
+
+def test_memory_bytes_is_kept_up_to_date():
+    store = MemoryStore("test", QuizSession, ttl=3600, max_size=50)
+    for i in range(80):
+        store.set(f"U{i % 60}", QuizSession(1, i))
+    store.update("U70", lambda s: (QuizSession(1, 0), None))
+    store.update("U59", lambda s: (None, None))
+    store.delete("U58")
+    store.delete("missing")
+    assert store.evicted_full > 0
+    assert store.memory_bytes() == walked_bytes(store)
+
+    restored = MemoryStore("test", QuizSession, max_size=30)
+    restored.set("U1", QuizSession(1, 1))
+    restored.restore(store.dump())
+    assert restored.memory_bytes() == walked_bytes(restored)
+
+    for key in list(store._data):
+        store.delete(key)
+    assert store.memory_bytes() == sys.getsizeof(store._data)
+
+
+def test_redis_stats_rescan_at_most_every_count_seconds(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("session_store.time.monotonic", clock)
+    client = FakeRedis()
+    store = RedisStore("test", QuizSession, client=client, count_seconds=60)
+    scans = []
+    scan_iter = client.scan_iter
+    monkeypatch.setattr(client, "scan_iter", lambda match: scans.append(match) or scan_iter(match))
+
+    store.set("U1", QuizSession(1, 0))
+    assert store.stats()["sessions"] == 1
+    store.set("U2", QuizSession(1, 0))
+    clock.now += 30
+    assert store.stats()["sessions"] == 1
+    clock.now += 30
+    assert store.stats()["sessions"] == 2
+    assert len(scans) == 2
@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+import pytest
+
+import profiler
+
+
+@pytest.fixture(scope="module")
+def apps():
+    import asgi_app
+    import slacky2
+    return slacky2.flask_app, asgi_app.api
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_TOKEN", "secret")
+    return {"Authorization": "Bearer secret"}
+
+
+def asgi_get(api, path: str, headers: dict) -> tuple:
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": b"",
+             "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+    asyncio.run(api(scope, receive, send))
+    return sent[0]["status"], sent[1]["body"]
+
+
+def test_flask_stats_needs_the_profile_token(apps, token):
+    client = apps[0].test_client()
+    assert client.get("/stats").status_code == 404
+    assert client.get("/stats", headers={"Authorization": "Bearer wrong"}).status_code == 404
+    resp = client.get("/stats", headers=token)
+    assert resp.status_code == 200
+    assert "quiz" in resp.get_json()
+
+
+def test_flask_stats_is_off_without_a_token(apps, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_TOKEN", "")
+    client = apps[0].test_client()
+    assert client.get("/stats", headers={"Authorization": "Bearer "}).status_code == 404
+
+
+def test_asgi_stats_needs_the_profile_token(apps, token):
+    assert asgi_get(apps[1], "/stats", {})[0] == 404
+    status, body = asgi_get(apps[1], "/stats", token)
+    assert status == 200
+    assert "quiz" in json.loads(body)
+
@@ -0,0 +1,107 @@
+import pytest
+
+from tournament import ALREADY_ANSWERED, CLOSED, Scheduler, Tournaments
+
+
+class ManualScheduler(Scheduler):
+    """The real scheduler's queue and one-pending-per-key rule, run by hand."""
+
+    def _ensure_started(self) -> None:
+        pass
+
+    def pending(self, kind: str) -> list:
+        return [key for _, _, key, _ in self._heap if key[0] == kind]
+
+    def run(self, kind: str) -> int:
+        """Run every task of one kind that is pending now; how many ran."""
+        due = [entry for entry in self._heap if entry[2][0] == kind]
+        for entry in due:
+            self._heap.remove(entry)
+            self._pending.discard(entry[2])
+        for _, _, _, fn in sorted(due):
+            fn()
+        return len(due)
+
+
+@pytest.fixture
+def sent():
+    return []
+
+
+@pytest.fixture
+def tournaments(sent):
+    return Tournaments(lambda method, **payload: sent.append((method, payload)),
+                       scheduler=ManualScheduler())
+
+
+def start(tournaments, rounds: int):
+    t = tournaments.create(("T1", "C1"), "UHOST", rounds)
+    tournaments.posted(t, "100.1")
+    return t
+
+
+def option(t, correct: bool) -> int:
+    return next(i for i, o in enumerate(t.question()["options"]) if bool(o["ok"]) == correct)
+
+
+def test_clicks_in_one_interval_share_one_update(tournaments, sent):
+    t = start(tournaments, 2)
+    for n in range(50):
+        tournaments.answer(f"U{n}", f"{t.id}:0:{n % len(t.picks)}")
+    assert tournaments.scheduler.pending("update") == [("update", t.id)]
+
+    assert tournaments.scheduler.run("update") == 1
+    assert [method for method, _ in sent] == ["chat.update"]
+    payload = sent[0][1]
+    assert (payload["channel"], payload["ts"]) == ("C1", "100.1")
+    assert "50 answered" in str(payload["blocks"])
+    assert t.updates == 1
+
+    tournaments.answer("ULATE", f"{t.id}:0:0")
+    assert tournaments.scheduler.run("update") == 1
+    assert len(sent) == 2
+
+
+def test_first_answer_counts(tournaments):
+    t = start(tournaments, 2)
+    right, wrong = option(t, True), option(t, False)
+    assert "Locked in" in tournaments.answer("U1", f"{t.id}:0:{wrong}")["text"]
+    assert tournaments.answer("U1", f"{t.id}:0:{right}")["text"] == ALREADY_ANSWERED
+    assert t.answers == {"U1": wrong}
+    assert sum(t.picks) == 1
+    assert t.scores["U1"][0] == 0
+
+
+def test_close_reveals_the_answer_and_opens_the_next_round(tournaments, sent):
+    t = start(tournaments, 2)
+    tournaments.answer("U1", f"{t.id}:0:{option(t, True)}")
+    tournaments.answer("U2", f"{t.id}:0:{option(t, False)}")
+    first_question = t.question()["q"]
+
+    assert tournaments.scheduler.run("close") == 1
+    assert t.round == 1 and not t.finished
+    assert "(1/2 got it)" in t.last_result
+    assert t.answers == {} and sum(t.picks) == 0
+    assert tournaments.scheduler.pending("close") == [("close", t.id, 1)]
+    assert tournaments.answer("U3", f"{t.id}:0:0")["text"] == CLOSED
+
+    tournaments.scheduler.run("update")
+    assert sent[-1][1]["text"] == t.question()["q"] != first_question
+    assert t.standings() == [("U1", 1), ("U2", 0)]
+
+
+def test_finished_tournament_is_removed(tournaments, sent):
+    t = start(tournaments, 1)
+    tournaments.answer("U1", f"{t.id}:0:{option(t, True)}")
+    assert tournaments.stats()["running"] == 1
+
+    tournaments.scheduler.run("close")
+    assert t.finished
+    assert t.id not in tournaments._running
+    assert tournaments.stats()["running"] == 0
+    assert tournaments.scheduler.pending("close") == []
+    assert tournaments.answer("U2", f"{t.id}:0:0")["text"] == CLOSED
+
+    tournaments.scheduler.run("update")
+    assert "Final standings" in str(sent[-1][1]["blocks"])
+    assert sent[-1][1]["text"] == "CyberQuest tournament results"
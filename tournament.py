@@ -0,0 +1,268 @@
+# tournament.py
+#
+# Channel tournaments. `/cyberquest tournament [rounds]` posts one shared
+# message, and everyone in the channel answers the same question at once.
+# Each round stays open for TOURNAMENT_ROUND_SECONDS; then the answer is
+# revealed, points are added up and the next question takes its place.
+#
+# Answers are tallied in memory as they arrive, and the shared message
+# shows live standings. It is never edited once per click: a click only
+# asks the scheduler for an update, the scheduler keeps at most one
+# pending per tournament, and sends it no sooner than
+# TOURNAMENT_UPDATE_INTERVAL seconds after the last one, rendered from the
+# tallies as they are by then. A burst of 500 clicks in one interval costs
+# one or two chat.update calls.
+#
+# Like the memory session store, a tournament lives in the process that
+# started it, so run tournaments with a single worker.
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+import events
+from cyberquestquiz import QUIZ
+from quiz_blocks import LETTERS
+
+TOURNAMENT_ROUNDS = int(os.getenv("TOURNAMENT_ROUNDS", 5))
+TOURNAMENT_ROUND_SECONDS = float(os.getenv("TOURNAMENT_ROUND_SECONDS", 20))
+TOURNAMENT_UPDATE_INTERVAL = float(os.getenv("TOURNAMENT_UPDATE_INTERVAL", 1.0))
+TOURNAMENT_STANDINGS = int(os.getenv("TOURNAMENT_STANDINGS", 10))
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "⌛ Too late, that question has closed."
+ALREADY_ANSWERED = "🔒 You already locked in an answer for this question."
+LOCKED_IN = "✅ Locked in *{letter}*. Results when the round closes."
+NOT_IN_CHANNEL = "🙈 I can't post here yet. Invite me to the channel and try again."
+
+
+class Scheduler:
+    """One thread running callbacks at their due time, at most one pending per key."""
+
+    def __init__(self):
+        self._heap: list = []
+        self._pending: set = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def call_at(self, due: float, key, fn) -> bool:
+        """Run fn() at monotonic time `due`; False if key is already pending."""
+        self._ensure_started()
+        with self._cond:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+            heapq.heappush(self._heap, (due, next(self._seq), key, fn))
+            self._cond.notify()
+        return True
+
+    def _ensure_started(self) -> None:
+        # threads don't survive fork, so start lazily in each worker
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._run, name="tournament", daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, key, fn = heapq.heappop(self._heap)
+                # calls asked for while fn runs are scheduled again
+                self._pending.discard(key)
+            try:
+                fn()
+            except Exception:
+                logger.exception("tournament task %r failed", key)
+
+
+class Tournament:
+    """One channel's game: the question on show, this round's tally and the standings."""
+
+    def __init__(self, tid: int, where: tuple, host: str, version: int, quiz, questions: list):
+        self.id = tid
+        self.where = where
+        self.host = host
+        self.version = version
+        self.quiz = quiz
+        self.questions = questions
+        self.ts = None
+        self.round = 0
+        self.opened = 0.0
+        self.closes = 0.0
+        self.finished = False
+        # this round: user → option, and picks per option
+        self.answers: dict = {}
+        self.picks: list = []
+        # whole game: user → [correct, seconds taken on correct answers]
+        self.scores: dict = {}
+        self.last_result = None
+        self.last_update = 0.0
+        self.updates = 0
+        self.lock = threading.Lock()
+
+    @property
+    def channel(self) -> str:
+        return self.where[1]
+
+    def question(self) -> dict:
+        return self.quiz.bank[self.questions[self.round]]
+
+    def open_round(self) -> None:
+        self.answers = {}
+        self.picks = [0] * len(self.question()["options"])
+        self.opened = time.monotonic()
+        self.closes = self.opened + TOURNAMENT_ROUND_SECONDS
+
+    def standings(self) -> list:
+        """[(user, correct)] best first; ties go to whoever was quicker."""
+        ranked = sorted(self.scores.items(), key=lambda kv: (-kv[1][0], kv[1][1]))
+        return [(user, correct) for user, (correct, _) in ranked[:TOURNAMENT_STANDINGS]]
+
+
+class Tournaments:
+    """Running tournaments by id, and the scheduler that closes rounds and edits messages.
+
+    send(method, **payload) makes a Web API call, e.g. outbound.dispatcher.api
+    with the bot token bound.
+    """
+
+    def __init__(self, send, interval: float = TOURNAMENT_UPDATE_INTERVAL,
+                 scheduler: Scheduler = None):
+        self.send = send
+        self.interval = interval
+        self.scheduler = scheduler or Scheduler()
+        self._running: dict = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # ── starting ──
+    def create(self, where: tuple, host: str, rounds: int = TOURNAMENT_ROUNDS) -> Tournament:
+        """A tournament ready to post; call posted() with the message ts to begin."""
+        version, quiz = QUIZ.head()
+        questions = quiz.bank.sample(max(1, min(rounds, len(quiz.bank))))
+        t = Tournament(next(self._ids), where, host, version, quiz, questions)
+        t.open_round()
+        return t
+
+    def posted(self, t: Tournament, ts: str) -> None:
+        t.ts = ts
+        # the first round's clock starts once the message is in the channel
+        t.open_round()
+        with self._lock:
+            self._running[t.id] = t
+        self._schedule_close(t)
+
+    # ── answers ──
+    def answer(self, user: str, value: str) -> dict:
+        """respond() kwargs for a click on a tournament button."""
+        try:
+            tid, round_no, option = (int(part) for part in value.split(":"))
+        except ValueError:
+            return dict(text=CLOSED, replace_original=False)
+        t = self._running.get(tid)
+        if t is None:
+            return dict(text=CLOSED, replace_original=False)
+        with t.lock:
+            if t.finished or t.round != round_no or not 0 <= option < len(t.picks):
+                return dict(text=CLOSED, replace_original=False)
+            if user in t.answers:
+                return dict(text=ALREADY_ANSWERED, replace_original=False)
+            elapsed = time.monotonic() - t.opened
+            t.answers[user] = option
+            t.picks[option] += 1
+            q_idx = t.questions[t.round]
+            correct = t.quiz.bank[q_idx]["options"][option]["ok"]
+            score = t.scores.setdefault(user, [0, 0.0])
+            if correct:
+                score[0] += 1
+                score[1] += elapsed
+        events.log.record(events.ANSWER, user, t.where, t.version, q_idx, option,
+                          int(correct), int(elapsed))
+        self._touch(t)
+        return dict(text=LOCKED_IN.format(letter=LETTERS[option]), replace_original=False)
+
+    # ── scheduled work ──
+    def _touch(self, t: Tournament) -> None:
+        """Ask for a chat.update; clicks in the same interval share it."""
+        due = max(time.monotonic(), t.last_update + self.interval)
+        self.scheduler.call_at(due, ("update", t.id), lambda: self._push(t))
+
+    def _push(self, t: Tournament) -> None:
+        with t.lock:
+            message = self.message(t)
+            t.last_update = time.monotonic()
+            t.updates += 1
+        self.send("chat.update", channel=t.channel, ts=t.ts, **message)
+
+    def _schedule_close(self, t: Tournament) -> None:
+        round_no = t.round
+        self.scheduler.call_at(t.closes, ("close", t.id, round_no),
+                               lambda: self._close_round(t, round_no))
+
+    def _close_round(self, t: Tournament, round_no: int) -> None:
+        with t.lock:
+            if t.round != round_no or t.finished:
+                return
+            q = t.question()
+            answered = sum(t.picks)
+            right = sum(n for n, o in zip(t.picks, q["options"]) if o["ok"])
+            answer = next(f"*{LETTERS[i]}* – {o['txt']}"
+                          for i, o in enumerate(q["options"]) if o["ok"])
+            share = f"{right}/{answered} got it" if answered else "nobody answered"
+            t.last_result = f"✅ Q{round_no + 1}: {answer} ({share})"
+            if t.round + 1 < len(t.questions):
+                t.round += 1
+                t.open_round()
+            else:
+                t.finished = True
+        if t.finished:
+            with self._lock:
+                self._running.pop(t.id, None)
+        else:
+            self._schedule_close(t)
+        self._touch(t)
+
+    # ── rendering ──
+    def message(self, t: Tournament) -> dict:
+        """chat.postMessage / chat.update arguments for the tournament's current state."""
+        blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": (
+            f"*🏁 CyberQuest tournament* started by <@{t.host}>. "
+            f"Everyone in the channel can play; first answer counts.")}}]
+        if t.last_result:
+            blocks.append({"type": "context", "elements": [
+                {"type": "mrkdwn", "text": t.last_result}]})
+        if not t.finished:
+            q = t.question()
+            seconds = max(0, round(t.closes - time.monotonic()))
+            blocks += [
+                {"type": "section", "text": {"type": "mrkdwn", "text": (
+                    f"*Q{t.round + 1}/{len(t.questions)}:* {q['q']}\n" + "\n".join(
+                        f"*{LETTERS[i]}* – {o['txt']}" for i, o in enumerate(q["options"])))}},
+                {"type": "actions", "elements": [
+                    {"type": "button", "text": {"type": "plain_text", "text": LETTERS[i]},
+                     "action_id": f"tourney_{LETTERS[i]}", "value": f"{t.id}:{t.round}:{i}"}
+                    for i in range(len(q["options"]))]},
+                {"type": "context", "elements": [{"type": "mrkdwn", "text": (
+                    f"⏱️ closes in about {seconds}s · {sum(t.picks)} answered")}]},
+            ]
+        standings = t.standings()
+        title = "🏆 Final standings" if t.finished else "📈 Standings"
+        lines = [f"{i + 1}. <@{user}>  {correct} ✅" for i, (user, correct) in enumerate(standings)]
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": (
+            f"*{title}*\n" + ("\n".join(lines) if lines else "No correct answers yet."))}})
+        text = "CyberQuest tournament results" if t.finished else t.question()["q"]
+        return dict(blocks=blocks, text=text)
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = list(self._running.values())
+        return {"running": len(running), "updates": sum(t.updates for t in running)}